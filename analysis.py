@@ -1,10 +1,11 @@
-import plotly.express as px
-import pandas as pd
-
 def build_trajectory(segments, emotions):
     return [(i, e) for i, e in enumerate(emotions)]
 
 def plot_interactive_trajectory(emotions, song_name):
+    # plotly/pandas import ตอนสร้างกราฟครั้งแรก (route ที่แค่อ่านกราฟจากฐานข้อมูลไม่ต้องโหลด)
+    import plotly.express as px
+    import pandas as pd
+
     df = pd.DataFrame({"step": range(len(emotions)), "emotion": emotions})
     fig = px.line(
         df, x="step", y="emotion",
@@ -40,4 +41,5 @@ def plot_interactive_trajectory(emotions, song_name):
         marker=dict(size=10)  # ขนาดจุด
     )
     
-    return fig.to_html(full_html=False)  # Return HTML string
\ No newline at end of file
+    # ไม่ฝัง plotly.js (หลาย MB) ในทุกกราฟ → layout.html โหลด /assets/plotly.min.js ครั้งเดียว
+    return fig.to_html(full_html=False, include_plotlyjs=False)  # Return HTML string
\ No newline at end of file
@@ -1,48 +1,27 @@
+import os
+import json
 import re  # ⬅ เพิ่ม
+import threading
+import time
 from collections import Counter
-from flask import Flask, render_template, request, jsonify
-import sqlite3
-from pythainlp.tokenize import word_tokenize  # เพิ่ม import
-from youtube_utils import fetch_youtube_metadata, extract_video_id
-from nlp_utils import preprocess_lyrics
-from emotion_model import detect_emotion
-from analysis import build_trajectory, plot_interactive_trajectory
-
-# === Thai Emotion Aliases → Canonical Labels ===
-TH_EMO_ALIASES = {
-    "เศร้า": {"เศร้า", "เสียใจ", "หม่น", "หมอง", "หดหู่", "ซึม", "ร้องไห้", "เหงา", "ทุกข์", "น้อยใจ", "ผิดหวัง"},
-    "หวัง": {"หวัง", "ความหวัง", "มีความหวัง", "เริ่มหวัง", "ฝัน", "กำลังใจ", "สู้", "พยายาม"},
-    "สุข": {"สุข", "มีความสุข", "ร่าเริง", "สดใส", "สนุก", "แฮปปี้", "ยิ้ม", "ดีใจ", "เบิกบาน", "ชื่นใจ"},
-    "สงบ": {"สงบ", "นิ่ง", "ใจเย็น", "เย็น", "ผ่อนคลาย", "ชิล", "สบาย", "พักผ่อน", "สงัด"},
-    "โกรธ": {"โกรธ", "โมโห", "เดือด", "เกรี้ยวกราด", "แค้น", "เคือง", "ฉุน", "เดือดดาล"},
-    "ตื่นเต้น": {"ตื่นเต้น", "เร้าใจ", "พีค", "เข้มข้น", "ฮึกเหิม", "เร่งเร้า", "มัน", "สะใจ", "เปรี้ยว"},
-    "กังวล": {"กังวล", "เครียด", "กลัว", "หวาดกลัว", "ประหม่า", "ลังเล", "ไม่แน่ใจ", "กระวนกระวาย"},
-}
-
-# reverse map: alias -> canonical
-ALIAS2CANON = {}
-for canon, aliases in TH_EMO_ALIASES.items():
-    for a in aliases:
-        ALIAS2CANON[a] = canon
-    ALIAS2CANON[canon] = canon  # รวมตัวมันเอง
-
-def _canonize(label: str) -> str:
-    """แปะ label ให้เป็น canonical (ไทย) จากผลโมเดล/ข้อความ"""
-    if not label:
-        return ""
-    t = re.sub(r"\s+", "", label.strip())
-    
-    # ตรวจสอบกรณีที่ label เป็นภาษาอังกฤษตรงๆ
-    from emotion_model import ENG_TO_THAI
-    if t.lower() in ENG_TO_THAI:
-        return ENG_TO_THAI[t.lower()]
-    
-    # หาแบบ contains เพื่อครอบคลุมคำขยาย เช่น 'มีความสุขมาก'
-    for alias, canon in ALIAS2CANON.items():
-        if alias in t:
-            return canon
-    
-    return t if t else ""
+from flask import Flask, render_template, request, jsonify, Response, redirect, url_for
+from youtube_utils import extract_video_id
+from db import transaction
+from migrations import migrate
+from repository import db_query, list_songs_page, get_songs, get_emotion_summary, delete_song as delete_song_rows
+from emotion_search import EmotionSearchEngine
+from emotion_labels import TH_EMO_ALIASES, ALIAS2CANON, _canonize, calculate_overall_emotion
+from lexicon_matcher import overlap_lookup
+import jobs
+import progress
+from response_cache import cached_response
+import response_cache
+import stats as stats_counters  # ตัวแปรชื่อ stats ใช้ใน route แล้ว
+
+def word_tokenize(text, *args, **kwargs):
+    # pythainlp โหลดพจนานุกรมตอน import (ช้า) → import ตอนแบ่งคำครั้งแรก
+    from pythainlp.tokenize import word_tokenize as _word_tokenize
+    return _word_tokenize(text, *args, **kwargs)
 
 def _extract_emotion_keywords(text: str) -> list:
     """
@@ -139,6 +118,32 @@ def parse_thai_emotion_query(q: str):
     # Enhanced natural language processing for complex queries
     return _parse_complex_emotion_query(q)
 
+# Enhanced pattern dictionary for complex emotional progressions
+TRANSITION_PATTERNS = {
+    "start": ["เริ่ม", "ตอนแรก", "แรกๆ", "ช่วงแรก", "ก่อน", "starts", "begins", "initially"],
+    "gradual_change": ["ค่อยๆ", "ค่อย", "ค่อยเป็นค่อยไป", "ช้าๆ", "gradually", "slowly", "gently"],
+    "sudden_change": ["พุ่ง", "กระแส", "ฉับพลัน", "ทันที", "เดี๋ยวเดียว", "suddenly", "quickly", "spikes", "bursts"],
+    "transition": ["แล้ว", "จากนั้น", "ต่อมา", "เปลี่ยน", "กลาย", "then", "becomes", "changes", "transforms"],
+    "uplifting": ["ขึ้น", "สู่", "เปล่งประกาย", "สดใส", "โปร่ง", "bright", "uplifting", "rising", "soaring"],
+    "end": ["สุดท้าย", "ตอนจบ", "ท้ายเพลง", "จบ", "ends", "finally", "eventually"]
+}
+
+# Advanced synonym mapping for emotions
+EMOTION_SYNONYMS = {
+    "เศร้า": ["เศร้า", "เศร้าโศก", "โศกเศร้า", "หม่น", "หมอง", "หดหู่"],
+    "หวัง": ["หวัง", "ความหวัง", "มีความหวัง", "เริ่มหวัง", "หวังใจ"],
+    "สงบ": ["สงบ", "ใจเย็น", "เย็น", "โทนใจเย็น", "ผ่อนคลาย", "ชิล", "สบาย"],
+    "ตื่นเต้น": ["ตื่นเต้น", "เร้าใจ", "เปล่งประกาย", "ประกาย", "พีค", "เข้มข้น", "มัน"],
+    "สุข": ["สุข", "มีความสุข", "ร่าเริง", "สดใส", "สนุก", "ยิ้ม", "ดีใจ"],
+    "โกรธ": ["โกรธ", "โมโห", "เดือด", "แค้น", "เคือง"],
+    "เหงา": ["เหงา", "หงอย", "เศร้าเหงา", "โดดเดี่ยว"],
+    "กลาง": ["กลาง", "เฉย", "ปกติ", "ธรรมดา"]
+}
+
+# token → กลุ่มแรกที่คำในกลุ่มอยู่ใน token หรือ token อยู่ในคำ (สร้าง automaton ครั้งเดียวตอน import)
+_transition_of = overlap_lookup(TRANSITION_PATTERNS)
+_synonym_of = overlap_lookup(EMOTION_SYNONYMS)
+
 def _parse_complex_emotion_query(q: str):
     """
     ประมวลผล query ที่ซับซ้อนด้วยการวิเคราะห์ภาษาธรรมชาติแบบลึก
@@ -160,38 +165,15 @@ def _parse_complex_emotion_query(q: str):
     # แยกคำด้วย PyThaiNLP
     tokens = word_tokenize(q)
     
-    # Enhanced pattern dictionary for complex emotional progressions
-    transition_patterns = {
-        "start": ["เริ่ม", "ตอนแรก", "แรกๆ", "ช่วงแรก", "ก่อน", "starts", "begins", "initially"],
-        "gradual_change": ["ค่อยๆ", "ค่อย", "ค่อยเป็นค่อยไป", "ช้าๆ", "gradually", "slowly", "gently"],
-        "sudden_change": ["พุ่ง", "กระแส", "ฉับพลัน", "ทันที", "เดี๋ยวเดียว", "suddenly", "quickly", "spikes", "bursts"],
-        "transition": ["แล้ว", "จากนั้น", "ต่อมา", "เปลี่ยน", "กลาย", "then", "becomes", "changes", "transforms"],
-        "uplifting": ["ขึ้น", "สู่", "เปล่งประกาย", "สดใส", "โปร่ง", "bright", "uplifting", "rising", "soaring"],
-        "end": ["สุดท้าย", "ตอนจบ", "ท้ายเพลง", "จบ", "ends", "finally", "eventually"]
-    }
-    
-    # Advanced synonym mapping for emotions
-    emotion_synonyms = {
-        "เศร้า": ["เศร้า", "เศร้าโศก", "โศกเศร้า", "หม่น", "หมอง", "หดหู่"],
-        "หวัง": ["หวัง", "ความหวัง", "มีความหวัง", "เริ่มหวัง", "หวังใจ"],
-        "สงบ": ["สงบ", "ใจเย็น", "เย็น", "โทนใจเย็น", "ผ่อนคลาย", "ชิล", "สบาย"],
-        "ตื่นเต้น": ["ตื่นเต้น", "เร้าใจ", "เปล่งประกาย", "ประกาย", "พีค", "เข้มข้น", "มัน"],
-        "สุข": ["สุข", "มีความสุข", "ร่าเริง", "สดใส", "สนุก", "ยิ้ม", "ดีใจ"],
-        "โกรธ": ["โกรธ", "โมโห", "เดือด", "แค้น", "เคือง"],
-        "เหงา": ["เหงา", "หงอย", "เศร้าเหงา", "โดดเดี่ยว"],
-        "กลาง": ["กลาง", "เฉย", "ปกติ", "ธรรมดา"]
-    }
-    
     emotions_found = []
     transition_type = None
     
     # สแกนหาอารมณ์และรูปแบบการเปลี่ยนแปลง
     for i, token in enumerate(tokens):
         # ตรวจหารูปแบบการเปลี่ยนแปลง
-        for pattern_type, words in transition_patterns.items():
-            if any(word in token.lower() or token.lower() in word for word in words):
-                transition_type = pattern_type
-                break
+        pattern_type = _transition_of(token)
+        if pattern_type:
+            transition_type = pattern_type
         
         # ตรวจหาอารมณ์จากคำและ synonyms
         emotion = _canonize(token)
@@ -200,10 +182,9 @@ def _parse_complex_emotion_query(q: str):
             continue
             
         # ตรวจหา synonyms
-        for canonical_emotion, synonyms in emotion_synonyms.items():
-            if any(syn in token.lower() or token.lower() in syn for syn in synonyms):
-                emotions_found.append(canonical_emotion)
-                break
+        canonical_emotion = _synonym_of(token)
+        if canonical_emotion:
+            emotions_found.append(canonical_emotion)
     
     # สร้างลำดับอารมณ์ตามรูปแบบที่พบ
     if len(emotions_found) >= 2:
@@ -337,41 +318,8 @@ def soft_subseq_match(target, seq):
             i += 1
     return i == len(target)
 
-def calculate_overall_emotion(emotions):
-    """
-    คำนวณอารมณ์โดยรวมของเพลงจากรายการอารมณ์
-    """
-    if not emotions:
-        return "unknown"
-    
-    # นับความถี่ของแต่ละอารมณ์
-    emotion_counts = {}
-    for emotion in emotions:
-        emotion = emotion.lower() if emotion else "unknown"
-        emotion_counts[emotion] = emotion_counts.get(emotion, 0) + 1
-    
-    # หาอารมณ์ที่มีความถี่สูงสุด
-    most_common_emotion = max(emotion_counts.items(), key=lambda x: x[1])
-    
-    # ถ้าอารมณ์ที่พบบ่อยที่สุดมีสัดส่วนมากกว่า 50% ให้ใช้อารมณ์นั้น
-    total_emotions = len(emotions)
-    if most_common_emotion[1] / total_emotions > 0.5:
-        return most_common_emotion[0]
-    
-    # ถ้าไม่มีความชัดเจน ให้วิเคราะห์จากลำดับอารมณ์
-    # หาอารมณ์ที่ปรากฏในส่วนท้ายของเพลง (มีน้ำหนักมากกว่า)
-    if len(emotions) >= 3:
-        # ใช้ 30% สุดท้ายของเพลง
-        end_portion = emotions[-max(1, len(emotions)//3):]
-        end_emotion_counts = {}
-        for emotion in end_portion:
-            emotion = emotion.lower() if emotion else "unknown"
-            end_emotion_counts[emotion] = end_emotion_counts.get(emotion, 0) + 1
-        
-        if end_emotion_counts:
-            return max(end_emotion_counts.items(), key=lambda x: x[1])[0]
-    
-    return most_common_emotion[0]
+# index ลำดับอารมณ์ของทุกเพลงสำหรับ /search (สร้างใหม่เองเมื่อข้อมูลเปลี่ยน)
+search_engine = EmotionSearchEngine(_canonize)
 
 def get_emotion_color(emotion):
     """
@@ -407,19 +355,22 @@ def get_emotion_icon(emotion):
     }
     return emotion_icons.get(emotion.lower(), '❓')
 
-def get_emotion_explanation(emotion, emotions_list):
+def get_emotion_explanation(emotion, emotions_list, emotion_counts=None):
     """
     อธิบายว่าทำไมเพลงถึงมีอารมณ์โดยรวมแบบนั้น
+    emotion_counts: histogram ที่คำนวณไว้แล้ว (song_emotion_summary) ถ้ามีจะไม่ต้องนับใหม่
     """
-    if not emotions_list:
+    if emotion_counts is None:
+        if not emotions_list:
+            return "ไม่สามารถวิเคราะห์อารมณ์ได้"
+        emotion_counts = {}
+        for e in emotions_list:
+            e = e.lower() if e else "unknown"
+            emotion_counts[e] = emotion_counts.get(e, 0) + 1
+    elif not emotion_counts:
         return "ไม่สามารถวิเคราะห์อารมณ์ได้"
     
-    emotion_counts = {}
-    for e in emotions_list:
-        e = e.lower() if e else "unknown"
-        emotion_counts[e] = emotion_counts.get(e, 0) + 1
-    
-    total_segments = len(emotions_list)
+    total_segments = sum(emotion_counts.values())
     main_emotion = emotion.lower()
     
     # คำนวณเปอร์เซ็นต์ของอารมณ์หลัก
@@ -452,159 +403,161 @@ def get_emotion_explanation(emotion, emotions_list):
 
 app = Flask(__name__)
 
-def db_query(query, args=(), fetch=False):
-    conn = None
-    try:
-        conn = sqlite3.connect("songs.db")
-        cur = conn.cursor()
-        cur.execute(query, args)
-        rows = cur.fetchall() if fetch else None
-        conn.commit()
-        return rows
-    except Exception as e:
-        if conn:
-            conn.rollback()
-        raise e
-    finally:
-        if conn:
-            conn.close()
+# จำนวนเพลงต่อหน้าของรายการเพลง (หน้า index และ /api/songs)
+INDEX_PAGE_SIZE = int(os.getenv("INDEX_PAGE_SIZE", "24"))
+INDEX_PAGE_MAX = 200
+
+# อัปเกรด schema ของ songs.db อัตโนมัติตอนเริ่มแอป
+migrate()
+
+def start_background():
+    """
+    เริ่มงาน background ของเว็บ (เรียกซ้ำได้ เริ่มครั้งเดียว):
+    - worker วิเคราะห์เพลง (INGEST_WORKERS=0 เมื่อรัน `python jobs.py` แยก)
+    - อัปเดตยอดวิว/ไลก์จาก YouTube เป็นรอบๆ (STATS_REFRESH_INTERVAL=0 → ไม่รัน)
+    ไม่เริ่มตอน import → สคริปต์ที่ import app (เช่น search.match_query) ไม่แย่งงานในคิว
+    """
+    import stats_refresher
+    jobs.start_workers()
+    stats_refresher.start_scheduler()
+
+_background_started = False
+
+@app.before_request
+def _start_background_once():
+    # gunicorn / flask run: เริ่มเมื่อ worker ได้ request แรก
+    global _background_started
+    if not _background_started:
+        _background_started = True
+        start_background()
+
+# ----------------------
+# Model warmup (โมเดลโหลดแบบ lazy ตอนใช้ครั้งแรก → import app เร็ว, route ที่ไม่ใช้โมเดลไม่ต้องรอ)
+# ----------------------
+def warmup_models():
+    """โหลด zero-shot, tokenizer และ vector index ล่วงหน้า"""
+    import emotion_model
+    import vectorstore
+    started = time.time()
+    emotion_model.warmup()
+    if vectorstore.VECTOR_INDEX:
+        vectorstore.warmup()
+    return time.time() - started
+
+@app.cli.command("warmup")
+def warmup_command():
+    """flask --app app warmup"""
+    print(f"✅ Models loaded in {warmup_models():.1f}s")
+
+# MODEL_WARMUP=1: โหลดโมเดลใน background thread ทันทีที่เริ่มโปรเซส (request แรกไม่ต้องรอ)
+if os.getenv("MODEL_WARMUP", "0") == "1":
+    threading.Thread(target=warmup_models, name="model-warmup", daemon=True).start()
 
 # ----------------------
 # Index (เพิ่มเพลง / วิเคราะห์)
 # ----------------------
 @app.route("/", methods=["GET","POST"])
+@cached_response
 def index():
     error = None
+    job_id = request.args.get("job", type=int)
     if request.method == "POST":
         yt_link = request.form["youtube"]
         lyrics = request.form["lyrics"]
 
         video_id = extract_video_id(yt_link)
-        meta = fetch_youtube_metadata(video_id)
-
-        if meta:
-            # ----------------------------
-            # เช็คว่ามีเพลงนี้แล้วหรือยัง (ใช้ youtube_link)
-            # ----------------------------
-            existing = db_query("SELECT id FROM songs WHERE youtube_link=?", (yt_link,), fetch=True)
-            if existing:
-                songs = db_query("SELECT id,title,view_count,like_count,upload_date,graph_html FROM songs", fetch=True)
-                return render_template("index.html", songs=songs, error="⚠️ เพลงนี้ถูกเพิ่มแล้ว ไม่สามารถเพิ่มซ้ำได้")
-
-            try:
-                # สร้าง connection ใหม่สำหรับ transaction
-                conn = sqlite3.connect("songs.db")
-                cur = conn.cursor()
-                
-                try:
-                    # เริ่ม transaction
-                    cur.execute("BEGIN TRANSACTION")
-                    
-                    # ----------------------------
-                    # ถ้าไม่ซ้ำ → insert
-                    # ----------------------------
-                    cur.execute("""
-                        INSERT INTO songs (title,youtube_link,description,tags,upload_date,view_count,like_count,lyrics)
-                        VALUES (?,?,?,?,?,?,?,?)
-                    """, (
-                        meta.get("title"), yt_link, meta.get("description",""),
-                        ",".join(meta.get("tags",[])), meta.get("upload_date",""),
-                        meta.get("view_count",0), meta.get("like_count",0), lyrics
-                    ))
-                    
-                    song_id = cur.lastrowid
-
-                    # ตัด segment + emotion detection
-                    segments = preprocess_lyrics(lyrics)
-                    emotions = []
-                    for i, seg in enumerate(segments):
-                        e = detect_emotion(seg)
-                        emotions.append(e)
-                        cur.execute("""
-                            INSERT INTO segments (song_id,segment_order,text,emotion) 
-                            VALUES (?,?,?,?)""", (song_id, i, seg, e))
-
-                    # สร้าง interactive graph
-                    trajectory_html = plot_interactive_trajectory(emotions, meta.get("title"))
-                    cur.execute("UPDATE songs SET graph_html=? WHERE id=?", 
-                              (trajectory_html, song_id))
-                    
-                    # commit transaction
-                    conn.commit()
-                    
-                except Exception as e:
-                    # ถ้าเกิดข้อผิดพลาด rollback
-                    conn.rollback()
-                    raise e
-                finally:
-                    # ปิด connection
-                    conn.close()
-            except Exception as e:
-                # ถ้าเกิดข้อผิดพลาดระหว่างการวิเคราะห์ ให้ลบข้อมูลเพลงทิ้ง
-                db_query("DELETE FROM segments WHERE song_id=?", (song_id,))
-                db_query("DELETE FROM songs WHERE id=?", (song_id,))
-                return render_template("index.html", songs=songs, error=f"⚠️ เกิดข้อผิดพลาดในการวิเคราะห์: {str(e)}")
-
-    songs_data = db_query("SELECT id,title,view_count,like_count,upload_date,graph_html FROM songs", fetch=True)
-    
-    # เพิ่มข้อมูลอารมณ์โดยรวมให้กับแต่ละเพลง
-    enhanced_songs = []
-    for song in songs_data:
-        song_id = song[0]
-        # ดึงอารมณ์ของเพลงนี้
-        emotions = db_query("SELECT emotion FROM segments WHERE song_id=? ORDER BY segment_order", (song_id,), fetch=True)
-        emotion_list = [emotion[0] for emotion in emotions if emotion[0]]
-        overall_emotion = calculate_overall_emotion(emotion_list)
-        
-        enhanced_songs.append({
-            "id": song[0],
-            "title": song[1],
-            "views": song[2],
-            "likes": song[3],
-            "upload": song[4],
-            "graph": song[5],
-            "overall_emotion": overall_emotion,
-            "emotion_color": get_emotion_color(overall_emotion),
-            "emotion_icon": get_emotion_icon(overall_emotion)
-        })
-    
-    return render_template("index.html", songs=enhanced_songs, error=error)
+
+        # ----------------------------
+        # เช็คว่ามีเพลงนี้แล้วหรือยัง (ใช้ video id ซึ่งมี unique index)
+        # ----------------------------
+        if not video_id:
+            error = "⚠️ ลิงก์ YouTube ไม่ถูกต้อง"
+        elif db_query("SELECT id FROM songs WHERE video_id=?", (video_id,), fetch=True):
+            error = "⚠️ เพลงนี้ถูกเพิ่มแล้ว ไม่สามารถเพิ่มซ้ำได้"
+        else:
+            # ดึง metadata + วิเคราะห์อารมณ์ใน background worker แล้วตอบกลับทันที
+            job_id = jobs.enqueue("ingest", {"youtube_link": yt_link, "video_id": video_id, "lyrics": lyrics})
+            if request.accept_mimetypes.best == "application/json":
+                return jsonify({"job_id": job_id, "status_url": url_for("job_status", job_id=job_id),
+                                "events_url": url_for("job_events", job_id=job_id)}), 202
+
+    # หน้าแรกของรายการเพลง (ไม่มีกราฟ) ที่เหลือโหลดต่อผ่าน /api/songs, กราฟโหลดเมื่อเลื่อนถึงการ์ด
+    rows, next_after = list_songs_page(limit=INDEX_PAGE_SIZE)
+    return render_template("index.html", songs=[_song_card(row) for row in rows],
+                           next_after=next_after, error=error, job_id=job_id)
+
+def _song_card(row):
+    # row: (id,title,view_count,like_count,upload_date,overall,has_graph) จาก list_songs_page
+    # อารมณ์โดยรวมอ่านจาก song_emotion_summary (คำนวณไว้ตอนเขียนเพลง)
+    overall_emotion = row[5] or "unknown"
+    return {
+        "id": row[0],
+        "title": row[1],
+        "views": row[2],
+        "likes": row[3],
+        "upload": row[4],
+        "has_graph": bool(row[6]),
+        "overall_emotion": overall_emotion,
+        "emotion_color": get_emotion_color(overall_emotion),
+        "emotion_icon": get_emotion_icon(overall_emotion)
+    }
+
+# ----------------------
+# Song listing API (keyset pagination: ?after=<id ล่าสุดของหน้าก่อน>&limit=)
+# ----------------------
+@app.route("/api/songs")
+@cached_response
+def api_songs():
+    after = request.args.get("after", type=int)
+    limit = max(1, min(request.args.get("limit", INDEX_PAGE_SIZE, type=int), INDEX_PAGE_MAX))
+    rows, next_after = list_songs_page(after=after, limit=limit)
+    cards = [_song_card(row) for row in rows]
+    return jsonify({
+        "songs": cards,
+        "next_after": next_after,
+        # การ์ดที่ render แล้ว ให้หน้า index ต่อท้ายได้ทันที
+        "html": render_template("song_card.html", songs=cards),
+    })
+
+# ----------------------
+# Song graph (กราฟของเพลงเดียว โหลดแบบ lazy จากหน้า index)
+# ----------------------
+@app.route("/song/<int:song_id>/graph")
+@cached_response
+def song_graph(song_id):
+    song = db_query("SELECT graph_html FROM songs WHERE id=?", (song_id,), fetch=True)
+    if not song:
+        return "ไม่พบเพลงนี้", 404
+    return Response(song[0][0] or "", mimetype="text/html")
 
 # ----------------------
 # Search (ค้นหาเพลง)
 # ----------------------
+# จำนวนผลลัพธ์ต่อหน้าของ /search (หน้าถัดไปใช้ cursor ของผลลัพธ์สุดท้าย)
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+
 @app.route("/search", methods=["GET","POST"])
 def search():
     songs = []
     q_tokens = []
+    next_after = None
     if request.method == "POST":
         raw = request.form.get("query", "")
         q_tokens = parse_thai_emotion_query(raw)  # ⬅ แปลงข้อความไทยเป็นลิสต์อารมณ์
 
-        # ดึงเพลงทั้งหมด + segments
-        all_songs = db_query("SELECT id,title,view_count,like_count,upload_date,graph_html FROM songs", fetch=True)
-        scored_songs = []  # [(score, song_data)]
-        
-        for s in all_songs:
-            segs = db_query("SELECT emotion FROM segments WHERE song_id=? ORDER BY segment_order", (s[0],), fetch=True)
-            # ทำ canonical เช่นเดียวกับ query
-            song_seq = [_canonize(x[0]) for x in segs]
-
-            # ตรงตามลำดับแบบ soft-subsequence ก็ถือว่า match
-            if soft_subseq_match(q_tokens, song_seq):
-                score = calculate_match_score(q_tokens, song_seq)
-                scored_songs.append((score, s))
-        
-        # เรียงตามคะแนนมาก→น้อย, view_count มาก→น้อย
-        scored_songs.sort(key=lambda x: (-x[0], -x[1][2]))
-        songs = [s for _, s in scored_songs]
+        # match + จัดอันดับผ่าน index (ผลเหมือน soft_subseq_match + calculate_match_score)
+        # เลือกเฉพาะ top-k ของหน้านี้ต่อจาก cursor (after) แทนการเรียงและ render ทุกเพลงที่ match
+        ranked, next_after = search_engine.page(q_tokens, SEARCH_PAGE_SIZE, request.form.get("after"))
+        rows = get_songs(song_id for song_id, _ in ranked)
+        songs = [rows[song_id] for song_id, _ in ranked if song_id in rows]
 
-    return render_template("search.html", songs=songs, q_tokens=" → ".join(q_tokens))
+    return render_template("search.html", songs=songs, q_tokens=" → ".join(q_tokens), next_after=next_after)
 
 # ----------------------
 # Song Detail (ดูรายละเอียดเพลง)
 # ----------------------
 @app.route("/song/<int:song_id>")
+@cached_response
 def song_detail(song_id):
     # id,title,youtube_link,upload_date,view_count,like_count,graph_html,lyrics
     song = db_query("""SELECT id,title,youtube_link,upload_date,view_count,like_count,graph_html,lyrics
@@ -618,10 +571,15 @@ def song_detail(song_id):
                            FROM segments WHERE song_id=? ORDER BY segment_order""",
                         (song_id,), fetch=True)
 
-    # คำนวณอารมณ์โดยรวม
-    emotions = [seg[2] for seg in segments if seg[2]]  # ดึงอารมณ์จาก segments
-    overall_emotion = calculate_overall_emotion(emotions)
-    emotion_explanation = get_emotion_explanation(overall_emotion, emotions)
+    # อารมณ์โดยรวม + histogram จาก song_emotion_summary (ไม่มีแถว → คำนวณจาก segments)
+    summary = get_emotion_summary(song_id)
+    if summary:
+        overall_emotion = summary["overall"]
+        emotion_explanation = get_emotion_explanation(overall_emotion, None, summary["histogram"])
+    else:
+        emotions = [seg[2] for seg in segments if seg[2]]
+        overall_emotion = calculate_overall_emotion(emotions)
+        emotion_explanation = get_emotion_explanation(overall_emotion, emotions)
     
     # เพิ่มข้อมูลสีและไอคอนให้กับ segments
     enhanced_segments = []
@@ -662,69 +620,106 @@ def song_detail(song_id):
 @app.route("/song/<int:song_id>/refresh")
 def refresh_song(song_id):
     # ดึงข้อมูลเพลง
-    song = db_query("SELECT id, title, lyrics FROM songs WHERE id=?", (song_id,), fetch=True)
+    song = db_query("SELECT id FROM songs WHERE id=?", (song_id,), fetch=True)
     if not song:
         return "ไม่พบเพลงนี้", 404
-    sid, title, lyrics = song[0]
-
-    # ลบ segments เดิม
-    db_query("DELETE FROM segments WHERE song_id=?", (sid,))
+    sid = song[0][0]
 
-    # ประมวลผลใหม่
-    segments = preprocess_lyrics(lyrics or "")
-    emotions = []
-    for i, seg in enumerate(segments):
-        e = detect_emotion(seg)
-        emotions.append(e)
-        db_query("INSERT INTO segments (song_id,segment_order,text,emotion) VALUES (?,?,?,?)",
-                 (sid, i, seg, e))
-
-    # สร้างกราฟใหม่
-    trajectory_html = plot_interactive_trajectory(emotions, title)
-    db_query("UPDATE songs SET graph_html=? WHERE id=?", (trajectory_html, sid))
-
-    # redirect กลับไปหน้า song_detail
-    from flask import redirect, url_for
-    return redirect(url_for("song_detail", song_id=sid))
+    # วิเคราะห์ใหม่ใน background แล้วกลับไปหน้า song_detail (หน้าเพจจะรอจน job เสร็จ)
+    job_id = jobs.enqueue("refresh", {}, song_id=sid)
+    return redirect(url_for("song_detail", song_id=sid, job=job_id))
 
 # ----------------------
 # Rebuild (บังคับสร้างใหม่)
 # ----------------------
 @app.route("/song/<int:song_id>/rebuild", methods=["POST"])
 def rebuild_song(song_id):
-    song = db_query("SELECT id,title,lyrics FROM songs WHERE id=?", (song_id,), fetch=True)
+    song = db_query("SELECT id FROM songs WHERE id=?", (song_id,), fetch=True)
     if not song:
         return "ไม่พบเพลงนี้", 404
-    song = song[0]
 
-    # ลบของเดิม
-    db_query("DELETE FROM segments WHERE song_id=?", (song_id,))
-    db_query("UPDATE songs SET graph_html=NULL WHERE id=?", (song_id,))
+    job_id = jobs.enqueue("rebuild", {}, song_id=song_id)
+    return jsonify({"job_id": job_id, "status_url": url_for("job_status", job_id=job_id),
+                    "events_url": url_for("job_events", job_id=job_id)}), 202
 
-    if song[2]:
-        raw_segments = preprocess_lyrics(song[2])
-        emotions = []
-        for i, seg in enumerate(raw_segments):
-            e = detect_emotion(seg)
-            emotions.append(e)
-            db_query("INSERT INTO segments (song_id,segment_order,text,emotion) VALUES (?,?,?,?)",
-                     (song_id, i, seg, e))
-        if emotions:
-            graph_html = plot_interactive_trajectory(emotions, song[1])
-            db_query("UPDATE songs SET graph_html=? WHERE id=?", (graph_html, song_id))
-
-    return ("", 204)  # กลับไปที่หน้าเดิม (จะใช้ JS reload)
+# ----------------------
+# Job status (สถานะงานวิเคราะห์ใน background)
+# ----------------------
+@app.route("/jobs/<int:job_id>")
+def job_status(job_id):
+    job = jobs.get_job(job_id)
+    if not job:
+        return jsonify({"error": "not found"}), 404
+    return jsonify(job)
+
+# SSE รอ event ได้นานเท่านี้ก่อนเช็คสถานะในตาราง jobs (worker อาจอยู่คนละโปรเซส) และส่ง keepalive
+PROGRESS_POLL_SECONDS = float(os.getenv("PROGRESS_POLL_SECONDS", "2"))
+# stream หนึ่งครั้งเปิดค้างได้ไม่เกินนี้ (วินาที) แล้วปิดให้ EventSource reconnect พร้อม Last-Event-ID
+# → ไม่ยึด worker ของ gunicorn ไว้ตลอดอายุงาน (สูงสุด JOB_LEASE_SECONDS)
+PROGRESS_STREAM_SECONDS = float(os.getenv("PROGRESS_STREAM_SECONDS", "30"))
+
+def _sse(event, with_id=True):
+    head = f"id: {event['seq']}\n" if with_id else ""
+    return head + "data: " + json.dumps(event, ensure_ascii=False) + "\n\n"
+
+@app.route("/jobs/<int:job_id>/events")
+def job_events(job_id):
+    """
+    ความคืบหน้าของงานแบบ server-sent events (data = JSON ของ event, id = seq)
+    ปิด stream เมื่อได้ committed / failed หรือเปิดครบ PROGRESS_STREAM_SECONDS
+    reconnect พร้อม Last-Event-ID จะได้เฉพาะ event ที่ยังไม่เคยส่ง
+    """
+    if not jobs.get_job(job_id):
+        return jsonify({"error": "not found"}), 404
+    after = request.headers.get("Last-Event-ID", -1, type=int)
+
+    def stream(after):
+        yield "retry: 2000\n\n"
+        deadline = time.monotonic() + PROGRESS_STREAM_SECONDS
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return  # browser ต่อใหม่เองหลัง retry พร้อม Last-Event-ID
+            events, closed = progress.wait(job_id, after, min(PROGRESS_POLL_SECONDS, remaining))
+            for event in events:
+                after = event["seq"]
+                yield _sse(event)
+            if closed:
+                return
+            if events:
+                continue
+
+            job = jobs.get_job(job_id)
+            if job and job["status"] not in ("done", "failed"):
+                yield ": keepalive\n\n"
+                continue
+            # งานจบแล้วแต่ไม่มี event ในโปรเซสนี้ (worker แยกโปรเซส) → สรุปจากตาราง jobs
+            events, closed = progress.wait(job_id, after, 0.5)
+            for event in events:
+                yield _sse(event)
+            if not closed:
+                done = bool(job) and job["status"] == "done"
+                yield _sse({
+                    "seq": after + 1, "stage": "committed" if done else "failed", "source": "jobs",
+                    "song_id": job and job["song_id"], "error": job["error"] if job else "ไม่พบงานนี้",
+                }, with_id=False)
+            return
+
+    resp = Response(stream(after), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # ไม่ให้ nginx buffer stream
+    return resp
 
 # ----------------------
 # Delete Song (ลบเพลง)
 # ----------------------
 @app.route("/song/<int:song_id>/delete", methods=["POST"])
 def delete_song(song_id):
-    # ลบ segments ก่อน
-    db_query("DELETE FROM segments WHERE song_id=?", (song_id,))
-    # ลบเพลง
-    db_query("DELETE FROM songs WHERE id=?", (song_id,))
-    from flask import redirect, url_for
+    with transaction() as cur:
+        delete_song_rows(cur, song_id)
+
+    from vectorstore import on_songs_changed
+    on_songs_changed([song_id], deleted=True)
     return redirect(url_for("index"))
 
 # ----------------------
@@ -737,55 +732,32 @@ except NameError:
     def _canonize(x): return (x or "").strip()
 
 @app.route("/explore")
+@cached_response
 def explore():
-    # อารมณ์ยอดนิยม (จริง)
-    top_emotions = db_query("""
-        SELECT emotion, COUNT(*) as cnt
-        FROM segments
-        GROUP BY emotion
-        ORDER BY cnt DESC
-        LIMIT 6
-    """, fetch=True)  # [(emotion, count), ...]
-
-    # เตรียมข้อมูลเพลงทั้งหมด
-    songs = db_query("SELECT id, title FROM songs", fetch=True)
-
-    transition_rows = []  # [{id,title, path, trans_cnt}]
-    stable_rows = []      # [{id,title, emotion}]
-
-    for sid, title in songs:
-        segs = db_query(
-            "SELECT emotion FROM segments WHERE song_id=? ORDER BY segment_order",
-            (sid,), fetch=True
-        )
-        seq = [_canonize(e[0]) for e in segs if e and e[0]]
-
-        if not seq:
-            continue
-
-        # บีบอัดอารมณ์ซ้ำติดกัน (เช่น 'สุข,สุข,สุข' -> 'สุข')
-        compressed = []
-        for e in seq:
-            if not compressed or compressed[-1] != e:
-                compressed.append(e)
-
-        path = " → ".join(compressed)
-        trans_cnt = max(len(compressed) - 1, 0)
-
-        # เพลงคงที่ = มีอารมณ์เดียวในทั้งเพลง (หลังบีบอัดเหลือ 1)
-        if len(set(compressed)) == 1:
-            stable_rows.append({"id": sid, "title": title, "emotion": compressed[0]})
-
-        transition_rows.append({
-            "id": sid, "title": title, "path": path, "trans_cnt": trans_cnt
-        })
-
-    # จัดอันดับ transition เด่นสุด (มาก→น้อย)
-    transition_rows.sort(key=lambda x: x["trans_cnt"], reverse=True)
-    top_transition = transition_rows[:8]  # ปรับจำนวนได้
-
-    # เอาเพลงคงที่ 8 รายการพอ
-    stable_songs = stable_rows[:8]
+    # อารมณ์ยอดนิยม (จริง) จากตัวนับใน stats.py
+    top_emotions = stats_counters.emotion_counts(limit=6)  # [(emotion, count), ...]
+
+    # transition เด่นสุด (มาก→น้อย) และเพลงคงที่ จาก song_emotion_summary
+    top_transition = [
+        {"id": sid, "title": title, "path": path, "trans_cnt": trans_cnt}
+        for sid, title, path, trans_cnt in db_query("""
+            SELECT s.id, s.title, m.path, m.trans_cnt
+            FROM song_emotion_summary m JOIN songs s ON s.id = m.song_id
+            WHERE m.path IS NOT NULL
+            ORDER BY m.trans_cnt DESC, m.song_id
+            LIMIT 8
+        """, fetch=True)
+    ]
+    stable_songs = [
+        {"id": sid, "title": title, "emotion": path}
+        for sid, title, path in db_query("""
+            SELECT s.id, s.title, m.path
+            FROM song_emotion_summary m JOIN songs s ON s.id = m.song_id
+            WHERE m.stable = 1
+            ORDER BY m.song_id
+            LIMIT 8
+        """, fetch=True)
+    ]
 
     return render_template(
         "explore.html",
@@ -798,31 +770,20 @@ def explore():
 # Dashboard (แดชบอร์ด)
 # ----------------------
 @app.route("/dashboard")
+@cached_response
 def dashboard():
-    total_songs = db_query("SELECT COUNT(*) FROM songs", fetch=True)[0][0]
-    total_segments = db_query("SELECT COUNT(*) FROM segments", fetch=True)[0][0]
+    # ตัวนับที่อัปเดตตอนเขียนเพลง (stats.py) → ไม่ต้องสแกนตาราง
+    total_songs, total_segments = stats_counters.totals()
+
+    # นับจำนวนอารมณ์ทั้งหมด
+    emotion_stats = stats_counters.emotion_counts()
 
     # อารมณ์ยอดนิยม
-    popular_emotion = db_query("""
-        SELECT emotion, COUNT(*) as cnt
-        FROM segments
-        GROUP BY emotion
-        ORDER BY cnt DESC
-        LIMIT 1
-    """, fetch=True)
-    popular_emotion = popular_emotion[0][0] if popular_emotion else "N/A"
+    popular_emotion = emotion_stats[0][0] if emotion_stats else "N/A"
 
     # ค่าเฉลี่ยอารมณ์ = segments / songs
     avg_score = round(total_segments / max(total_songs,1), 2)
 
-    # นับจำนวนอารมณ์ทั้งหมด
-    emotion_stats = db_query("""
-        SELECT emotion, COUNT(*) as cnt
-        FROM segments
-        GROUP BY emotion
-        ORDER BY cnt DESC
-    """, fetch=True)
-
     stats = {
         "total_songs": total_songs,
         "total_segments": total_segments,
@@ -838,20 +799,14 @@ def dashboard():
 # ----------------------
 @app.route("/evaluation")
 def evaluation():
-    # ดึงข้อมูลสถิติจากฐานข้อมูลจริง
-    total_songs = db_query("SELECT COUNT(*) FROM songs", fetch=True)[0][0]
-    total_segments = db_query("SELECT COUNT(*) FROM segments", fetch=True)[0][0]
+    # ดึงข้อมูลสถิติจากตัวนับ (stats.py)
+    total_songs, total_segments = stats_counters.totals()
     
     # คำนวณค่าเฉลี่ยท่อนต่อเพลง
     avg_segments = round(total_segments / max(total_songs, 1), 2)
     
     # นับจำนวนอารมณ์ทั้งหมด
-    emotion_stats = db_query("""
-        SELECT emotion, COUNT(*) as cnt
-        FROM segments
-        GROUP BY emotion
-        ORDER BY cnt DESC
-    """, fetch=True)
+    emotion_stats = stats_counters.emotion_counts()
     
     stats = {
         "total_songs": total_songs,
@@ -862,6 +817,31 @@ def evaluation():
     
     return render_template("evaluation.html", stats=stats)
 
+# ----------------------
+# plotly.js (เสิร์ฟครั้งเดียวจากแพ็กเกจ plotly ที่ติดตั้งไว้ ให้ browser แคชยาว)
+# ----------------------
+_plotly_js = None
+
+@app.route("/assets/plotly.min.js")
+def plotly_js():
+    global _plotly_js
+    if _plotly_js is None:
+        from plotly.offline import get_plotlyjs
+        _plotly_js = get_plotlyjs()
+    resp = Response(_plotly_js, mimetype="application/javascript")
+    resp.cache_control.public = True
+    resp.cache_control.max_age = 7 * 24 * 3600
+    resp.add_etag()
+    return resp.make_conditional(request)
+
+# ----------------------
+# Emotion cache stats (ตัวนับ hit/miss ของแคชอารมณ์)
+# ----------------------
+@app.route("/cache/stats")
+def emotion_cache_stats():
+    from emotion_model import cache_stats, path_stats
+    return jsonify({**cache_stats(), "paths": path_stats(), "responses": response_cache.stats()})
+
 # ----------------------
 # Tokenize API
 # ----------------------
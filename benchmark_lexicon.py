@@ -0,0 +1,60 @@
+"""
+เปรียบเทียบความเร็ว / ความแม่นยำของ lexicon-first (LEXICON_FIRST=1) กับการรันโมเดลทุก segment
+บน ground truth ของ evaluation_unified.py โดยไล่ค่า LEXICON_CONFIDENCE หลายระดับ
+
+Usage:
+    python benchmark_lexicon.py
+    python benchmark_lexicon.py --confidence 0.5 0.67 0.75 --repeat 3
+"""
+import argparse
+import time
+
+import numpy as np
+
+import emotion_model
+from evaluation_unified import ground_truth_sets
+
+
+def run(texts, lexicon_first, confidence=None, repeat=1):
+    """คืน (labels, paths, ms ต่อ segment) ไม่ใช้แคช (วัดเวลาโมเดลจริง)"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        labels, paths = emotion_model.detect_emotions(
+            texts, threshold=0.55, use_cache=False, lexicon_first=lexicon_first,
+            lexicon_confidence=confidence, return_paths=True,
+        )
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return labels, paths, best * 1000 / len(texts)
+
+
+def report(name, sets, predicted, paths, ms, baseline_ms, baseline):
+    lexicon_share = np.mean([p == "lexicon" for p in paths.values()])
+    accs = [np.mean([predicted[t] == y for t, y in samples]) for samples in sets.values()]
+    agree = np.mean([predicted[t] == baseline[t] for t in predicted])
+    print(f"{name:<12} | {lexicon_share:>8.1%} | " + " | ".join(f"{a:>12.1%}" for a in accs)
+          + f" | {agree:>9.1%} | {ms:>8.2f} | {baseline_ms / ms:>6.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lexicon-first fast path: speed/accuracy trade-off")
+    parser.add_argument("--confidence", type=float, nargs="+", default=[0.34, 0.5, 0.6, 0.67, 0.75])
+    parser.add_argument("--repeat", type=int, default=1, help="รันซ้ำแล้วใช้เวลาที่ดีที่สุด")
+    args = parser.parse_args()
+
+    sets = ground_truth_sets()
+    texts = list(dict.fromkeys(text for samples in sets.values() for text, _ in samples))
+    emotion_model.warmup()
+    print(f"{len(texts)} unique segments, backend={emotion_model.EMOTION_BACKEND}\n")
+
+    labels, paths, baseline_ms = run(texts, False, repeat=args.repeat)
+    baseline = dict(zip(texts, labels))
+    print(f"{'Mode':<12} | {'Lexicon':>8} | " + " | ".join(f"{name:>12}" for name in sets)
+          + f" | {'Agreement':>9} | {'ms/seg':>8} | {'Speed':>7}")
+    print("-" * 92)
+    report("model only", sets, baseline, dict(zip(texts, paths)), baseline_ms, baseline_ms, baseline)
+    for confidence in args.confidence:
+        labels, paths, ms = run(texts, True, confidence, repeat=args.repeat)
+        report(f"conf≥{confidence:g}", sets, dict(zip(texts, labels)), dict(zip(texts, paths)),
+               ms, baseline_ms, baseline)
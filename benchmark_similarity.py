@@ -0,0 +1,139 @@
+"""
+เปรียบเทียบความเร็วของ DTW ใน search.py กับลูป Python แบบเดิม (เติม n×m ทีละช่อง)
+
+ตรวจด้วยว่าคะแนนเท่าเดิมทุกเพลงเมื่อไม่ใช้ band, เพลงที่ได้คะแนนเท่าเกณฑ์พอดีไม่ถูกตัดทิ้ง
+(เกณฑ์ของ top-k heap ใน match_query_page คือคะแนนของอันดับที่ k) และรายงานผลของ band / min_similarity
+
+Usage:
+    python benchmark_similarity.py
+    python benchmark_similarity.py --songs 5000 --band 0.1 --min-similarity 0.6
+    python benchmark_similarity.py --from-db          # ลำดับอารมณ์จริงจาก songs.db
+"""
+import argparse
+import time
+
+import numpy as np
+
+import search
+
+LABELS = ["sad", "lonely", "hope", "happy", "excited", "calm", "angry", "neutral"]
+QUERIES = [["sad"], ["sad", "hope"], ["calm", "excited"], ["sad", "hope", "happy"], ["angry", "calm", "lonely"]]
+
+
+def loop_similarity(query_emotions, song_emotions):
+    """calculate_emotion_similarity เดิม (ลูปสองชั้นบน np.zeros) ใช้เป็นค่าอ้างอิง"""
+    if not query_emotions or not song_emotions:
+        return 0.0
+    n, m = len(query_emotions), len(song_emotions)
+    dp = np.zeros((n, m))
+    dp[0][0] = 1 if query_emotions[0] == song_emotions[0] else 0
+    for i in range(n):
+        for j in range(m):
+            if i == 0 and j == 0:
+                continue
+            score = 1 if query_emotions[i] == song_emotions[j] else 0
+            prev = []
+            if i > 0:
+                prev.append(dp[i-1][j])
+            if j > 0:
+                prev.append(dp[i][j-1])
+            if i > 0 and j > 0:
+                prev.append(dp[i-1][j-1])
+            dp[i][j] = score + max(prev) if prev else score
+    return dp[n-1][m-1] / max(n, m)
+
+
+def synthetic_songs(n, seed=0):
+    """เพลงสุ่มที่อารมณ์ต่อเนื่องเป็นช่วงๆ (แบบเพลงจริง) ยาว 8–60 segment"""
+    rng = np.random.default_rng(seed)
+    songs = []
+    for _ in range(n):
+        pool = rng.choice(LABELS, size=rng.integers(1, 4), replace=False)
+        length = int(rng.integers(8, 61))
+        songs.append([str(pool[k]) for k in np.repeat(rng.integers(len(pool), size=length // 4 + 1), 4)[:length]])
+    return songs
+
+
+def songs_from_db():
+    from repository import db_query
+    rows = db_query("""
+        SELECT GROUP_CONCAT(seg.emotion) FROM songs s LEFT JOIN segments seg ON s.id = seg.song_id GROUP BY s.id
+    """, fetch=True)
+    return [r[0].split(",") if r[0] else [] for r in rows]
+
+
+def threshold_ties(max_len=60):
+    """
+    เพลงที่ได้คะแนน a/b เท่ากับ min_similarity = a/b พอดีต้องไม่ถูกตัดทิ้ง ทั้งแบบ batch และทีละคู่
+    คืนรายการ (a, b) ที่ผิด
+    """
+    failed = []
+    for b in range(1, max_len + 1):
+        songs = [["sad"] * a + ["calm"] * (b - a) for a in range(1, b + 1)]
+        (query,), vocab = search.encode_labels([["sad"]])
+        codes, _ = search.encode_labels(songs, vocab)
+        for a, song in zip(range(1, b + 1), songs):
+            threshold = a / b
+            batched = search.similarity_many(query, codes, min_similarity=threshold)[a - 1]
+            single = search.calculate_emotion_similarity(["sad"], song, min_similarity=threshold)
+            if batched != threshold or single != threshold:
+                failed.append((a, b))
+    return failed
+
+
+def timed(fn, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DTW similarity microbenchmark")
+    parser.add_argument("--songs", type=int, default=2000, help="จำนวนเพลงสุ่ม")
+    parser.add_argument("--from-db", action="store_true", help="ใช้ลำดับอารมณ์จาก songs.db แทนเพลงสุ่ม")
+    parser.add_argument("--band", type=float, default=0.1, help="Sakoe–Chiba band ที่ใช้เทียบ")
+    parser.add_argument("--min-similarity", type=float, default=0.6)
+    parser.add_argument("--repeat", type=int, default=3, help="รันซ้ำแล้วใช้เวลาที่ดีที่สุด (ยกเว้นลูปเดิม)")
+    args = parser.parse_args()
+
+    failed = threshold_ties()
+    print(f"threshold ties: {'ok' if not failed else f'{len(failed)} dropped, e.g. {failed[:3]}'}")
+    songs = songs_from_db() if args.from_db else synthetic_songs(args.songs)
+    print(f"{len(songs)} songs, avg {np.mean([len(s) for s in songs]):.1f} segments, {len(QUERIES)} queries\n")
+    print(f"{'Mode':<30} | {'ms/query':>9} | {'Speedup':>8} | {'Match':>6} | {'≥ min':>6}")
+    print("-" * 72)
+
+    def row(name, ms, baseline_ms, scores, reference):
+        same = np.mean([np.array_equal(a, b) for a, b in zip(scores, reference)])
+        above = int(sum((np.asarray(s) >= args.min_similarity).sum() for s in scores))
+        print(f"{name:<30} | {ms:>9.2f} | {baseline_ms / ms:>7.1f}x | {same:>6.0%} | {above:>6}")
+
+    reference, loop_s = timed(lambda: [np.array([loop_similarity(q, s) for s in songs]) for q in QUERIES], 1)
+    loop_ms = loop_s * 1000 / len(QUERIES)
+    row("python loop (old)", loop_ms, loop_ms, reference, reference)
+
+    scores, t = timed(lambda: [np.array([search.calculate_emotion_similarity(q, s, band=0) for s in songs])
+                               for q in QUERIES], args.repeat)
+    row("per song, no band", t * 1000 / len(QUERIES), loop_ms, scores, reference)
+
+    def batched(band, min_similarity=None):
+        out = []
+        for q in QUERIES:
+            (query,), vocab = search.encode_labels([q])
+            codes, _ = search.encode_labels(songs, vocab)
+            out.append(search.similarity_many(query, codes, band=band, min_similarity=min_similarity))
+        return out
+
+    scores, t = timed(lambda: batched(0), args.repeat)
+    row("batched, no band", t * 1000 / len(QUERIES), loop_ms, scores, reference)
+    scores, t = timed(lambda: batched(args.band), args.repeat)
+    row(f"batched, band {args.band:g}", t * 1000 / len(QUERIES), loop_ms, scores, reference)
+    scores, t = timed(lambda: batched(0, args.min_similarity), args.repeat)
+    # คะแนนของเพลงที่ถูกตัดทิ้งเป็น 0 → เทียบเฉพาะว่าชุดเพลงที่ผ่านเกณฑ์ตรงกัน
+    kept = [np.where(r >= args.min_similarity, r, 0.0) for r in reference]
+    row(f"batched, early abandon ≥{args.min_similarity:g}", t * 1000 / len(QUERIES), loop_ms,
+        [np.where(s >= args.min_similarity, s, 0.0) for s in scores], kept)
@@ -0,0 +1,110 @@
+"""
+เปรียบเทียบ recall / latency ของ ANN index (IVF-PQ, HNSW) กับ flat index บนข้อมูลชุดเดียวกัน
+
+Usage:
+    python benchmark_vectorstore.py                       # ใช้เวกเตอร์จาก VECTOR_INDEX_PATH
+    python benchmark_vectorstore.py --synthetic 200000    # ข้อมูลสุ่ม (ไม่ต้องมี index)
+    python benchmark_vectorstore.py --nprobe 8 16 32 --ef-search 32 64 128 -k 10 --refine 8
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+import vectorstore
+from vectorstore import build_ann, refine, set_search_params, stored_vectors
+
+
+def load_vectors(args):
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        # กลุ่มก้อน (แบบ embedding จริง) แทน uniform noise ที่ ANN ทำได้แย่เกินจริง
+        centers = rng.normal(size=(max(args.synthetic // 200, 1), vectorstore.dimension))
+        labels = rng.integers(len(centers), size=args.synthetic)
+        vectors = (centers[labels] + 0.3 * rng.normal(size=(args.synthetic, vectorstore.dimension))).astype("float32")
+        return np.arange(args.synthetic, dtype=np.int64), vectors
+    store = vectorstore.VectorStore(args.index or vectorstore.VECTOR_INDEX_PATH).load()
+    return stored_vectors(store.index)
+
+
+def make_queries(vectors, n, seed=1):
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.choice(len(vectors), min(n, len(vectors)), replace=False)]
+    noise = rng.normal(scale=0.05 * float(np.std(vectors)), size=picked.shape)
+    return (picked + noise).astype("float32")
+
+
+def run(index, queries, k, flat=None, refine_factor=0):
+    """ค้นทีละ query (แบบเดียวกับ search_query) คืน (ids, latency ms ต่อ query)"""
+    faiss.omp_set_num_threads(1)
+    ids, times = [], []
+    for q in queries:
+        t = time.perf_counter()
+        if refine_factor:
+            _, I = index.search(q[None, :], k * refine_factor)
+            found = refine(flat, q, I[0], k)
+        else:
+            _, I = index.search(q[None, :], k)
+            found = I[0]
+        times.append((time.perf_counter() - t) * 1000)
+        ids.append(np.pad(found, (0, k - len(found)), constant_values=-1))
+    return np.array(ids), np.array(times)
+
+
+def recall(found, truth):
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def report(name, param, found, times, truth, build_s=None):
+    print(f"{name:<8} {param:<14} recall@k={recall(found, truth):.4f}  "
+          f"p50={np.percentile(times, 50):7.3f} ms  p95={np.percentile(times, 95):7.3f} ms"
+          + (f"  build={build_s:.1f}s" if build_s is not None else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ANN vs flat benchmark for the segment vector index")
+    parser.add_argument("--index", help="path ของ flat index (ค่าเริ่มต้น VECTOR_INDEX_PATH)")
+    parser.add_argument("--synthetic", type=int, default=0, help="ใช้เวกเตอร์สุ่ม N ตัวแทน index จริง")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    parser.add_argument("--refine", type=int, default=vectorstore.IVF_REFINE, help="IVF-PQ re-rank factor (0 = ปิด)")
+    args = parser.parse_args()
+
+    ids, vectors = load_vectors(args)
+    if len(vectors) == 0:
+        raise SystemExit("ไม่มีเวกเตอร์ใน index (รัน python vectorstore.py --sync ก่อน)")
+    queries = make_queries(vectors, args.queries)
+    print(f"{len(vectors)} vectors, {len(queries)} queries, k={args.k}")
+
+    flat = faiss.IndexIDMap2(faiss.IndexFlatL2(vectorstore.dimension))
+    flat.add_with_ids(vectors, ids)
+    truth, times = run(flat, queries, args.k)
+    report("flat", "-", truth, times, truth)
+
+    if len(vectors) >= 256:
+        t = time.perf_counter()
+        ivfpq = build_ann("ivfpq", vectors, ids)
+        build_s = time.perf_counter() - t
+        for nprobe in args.nprobe:
+            set_search_params(ivfpq, nprobe=nprobe)
+            found, times = run(ivfpq, queries, args.k)
+            report("ivfpq", f"nprobe={nprobe}", found, times, truth, build_s)
+            build_s = None
+            if args.refine:
+                found, times = run(ivfpq, queries, args.k, flat, args.refine)
+                report("ivfpq+rf", f"nprobe={nprobe}", found, times, truth)
+    else:
+        print("ivfpq    skipped (ต้องมีอย่างน้อย 256 เวกเตอร์)")
+
+    t = time.perf_counter()
+    hnsw = build_ann("hnsw", vectors, ids)
+    build_s = time.perf_counter() - t
+    for ef in args.ef_search:
+        set_search_params(hnsw, ef_search=ef)
+        found, times = run(hnsw, queries, args.k)
+        report("hnsw", f"efSearch={ef}", found, times, truth, build_s)
+        build_s = None
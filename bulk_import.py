@@ -0,0 +1,191 @@
+"""
+นำเข้าเพลงจำนวนมากจากไฟล์ CSV / JSONL
+
+แต่ละแถวต้องมีลิงก์ YouTube (youtube_link / youtube / link / url) และ lyrics, title ไม่บังคับ
+แถวถูกอ่านแบบ stream แล้วประมวลผลทีละ chunk: ตัด segment → วิเคราะห์อารมณ์รวมทั้ง chunk
+→ เขียน songs/segments ด้วย executemany ใน transaction เดียวต่อ chunk
+หลัง commit แต่ละ chunk จะบันทึก checkpoint ไว้ สั่งรันซ้ำจะทำต่อจากแถวล่าสุด
+
+Usage:
+    python bulk_import.py songs.csv
+    python bulk_import.py songs.jsonl --chunk-size 500 --fetch-metadata
+    python bulk_import.py songs.csv --restart      # ไม่สนใจ checkpoint เดิม
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+LINK_FIELDS = ("youtube_link", "youtube", "link", "url")
+
+
+def read_rows(path, fmt=None):
+    """อ่านไฟล์ทีละแถว คืน dict ต่อแถว (ไม่โหลดทั้งไฟล์เข้าหน่วยความจำ)"""
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def _link(row):
+    for field in LINK_FIELDS:
+        if row.get(field):
+            return row[field].strip()
+    return ""
+
+
+# ----------------------
+# Checkpoint
+# ----------------------
+def load_checkpoint(path, source):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        state = json.load(f)
+    return state if state.get("source") == source else None
+
+
+def save_checkpoint(path, state):
+    # เขียนไฟล์ชั่วคราวแล้ว rename → checkpoint ไม่เสียถ้าโปรเซสถูกฆ่ากลางทาง
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+# ----------------------
+# Import
+# ----------------------
+def import_chunk(rows, fetch_metadata=False, graphs=True):
+    """
+    วิเคราะห์และเขียนหนึ่ง chunk (rows ผ่านการกรองซ้ำแล้ว: [(video_id, link, row), ...])
+    คืน (จำนวนเพลง, จำนวน segments) ที่เขียนลงฐานข้อมูล
+    """
+    from db import transaction
+    from ingest import analyze_many
+    import repository
+
+    if fetch_metadata:
+        # ทั้ง chunk ใช้ API call ละ 50 วิดีโอ (และข้ามวิดีโอที่อยู่ในแคชแล้ว)
+        from youtube_utils import fetch_youtube_metadata_many
+        fetched = fetch_youtube_metadata_many([video_id for video_id, _, _ in rows])
+
+    metas, kept = [], []
+    for video_id, link, row in rows:
+        if fetch_metadata:
+            meta = fetched.get(video_id)
+            if not meta:
+                print(f"⚠️ ไม่พบวิดีโอ {video_id} ข้าม", file=sys.stderr)
+                continue
+            if row.get("title"):
+                meta["title"] = row["title"]
+        else:
+            meta = {"title": row.get("title") or video_id}
+        metas.append(meta)
+        kept.append((video_id, link, row))
+    if not kept:
+        return 0, 0
+
+    analyzed = analyze_many([row.get("lyrics") or "" for _, _, row in kept])
+
+    if graphs:
+        from analysis import plot_interactive_trajectory
+
+    items = []
+    for meta, (video_id, link, row), (segments, emotions) in zip(metas, kept, analyzed):
+        graph_html = plot_interactive_trajectory(emotions, meta["title"]) if graphs and emotions else None
+        items.append((meta, link, video_id, row.get("lyrics") or "", segments, emotions, graph_html))
+
+    with transaction() as cur:
+        song_ids = repository.insert_songs(cur, items)
+
+    from vectorstore import on_songs_changed
+    on_songs_changed(song_ids)
+    return len(items), sum(len(item[4]) for item in items)
+
+
+def run(path, fmt=None, chunk_size=200, checkpoint=None, restart=False,
+        fetch_metadata=False, graphs=True):
+    from db import close_connection
+    from migrations import migrate
+    from repository import db_query
+    from youtube_utils import extract_video_id
+
+    migrate()
+    source = os.path.abspath(path)
+    checkpoint = checkpoint or path + ".checkpoint.json"
+    state = None if restart else load_checkpoint(checkpoint, source)
+    if state:
+        print(f"↻ ทำต่อจาก checkpoint: แถวที่ {state['offset']}")
+    else:
+        state = {"source": source, "offset": 0, "songs": 0, "segments": 0, "skipped": 0}
+
+    # video id ที่มีอยู่แล้ว (รวมที่เพิ่มในรอบนี้) ใช้กรองเพลงซ้ำ
+    existing = {r[0] for r in db_query("SELECT video_id FROM songs WHERE video_id IS NOT NULL", fetch=True)}
+
+    started = time.time()
+    run_songs = run_segments = 0
+    chunk, consumed, skipped = [], state["offset"], 0
+
+    def flush():
+        nonlocal chunk, skipped, run_songs, run_segments
+        songs, segments = import_chunk(chunk, fetch_metadata=fetch_metadata, graphs=graphs)
+        run_songs += songs
+        run_segments += segments
+        state.update(offset=consumed, songs=state["songs"] + songs,
+                     segments=state["segments"] + segments,
+                     skipped=state["skipped"] + skipped + len(chunk) - songs)
+        save_checkpoint(checkpoint, state)
+        chunk, skipped = [], 0
+
+        elapsed = max(time.time() - started, 1e-9)
+        print(f"แถว {consumed:>7} | เพลง {state['songs']:>7} ({run_songs / elapsed:6.1f} songs/s)"
+              f" | segments {state['segments']:>8} ({run_segments / elapsed:7.1f} segments/s)"
+              f" | ข้าม {state['skipped']}", flush=True)
+
+    try:
+        for i, row in enumerate(read_rows(path, fmt)):
+            if i < state["offset"]:
+                continue
+            consumed = i + 1
+            link = _link(row)
+            video_id = extract_video_id(link)
+            if not video_id or video_id in existing:
+                skipped += 1
+                continue
+            existing.add(video_id)
+            chunk.append((video_id, link, row))
+            if len(chunk) >= chunk_size:
+                flush()
+        flush()
+    except KeyboardInterrupt:
+        # chunk ที่ยังไม่ commit จะถูกทำใหม่ในรอบถัดไป
+        print(f"\n⏸ หยุดแล้ว รันคำสั่งเดิมอีกครั้งเพื่อทำต่อจากแถวที่ {state['offset']}")
+        return state
+    finally:
+        close_connection()
+
+    print(f"✅ เสร็จสิ้น: เพิ่ม {state['songs']} เพลง, {state['segments']} segments, ข้าม {state['skipped']} แถว")
+    return state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import songs from CSV/JSONL")
+    parser.add_argument("path", help="ไฟล์ .csv หรือ .jsonl")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="ระบุชนิดไฟล์ (ค่าเริ่มต้น: ดูจากนามสกุล)")
+    parser.add_argument("--chunk-size", type=int, default=200, help="จำนวนเพลงต่อ transaction")
+    parser.add_argument("--checkpoint", help="ไฟล์ checkpoint (ค่าเริ่มต้น: <path>.checkpoint.json)")
+    parser.add_argument("--restart", action="store_true", help="เริ่มใหม่จากแถวแรก")
+    parser.add_argument("--fetch-metadata", action="store_true", help="ดึง title/ยอดวิว/ไลก์ จาก YouTube API")
+    parser.add_argument("--no-graphs", action="store_true", help="ไม่สร้างกราฟตอนนำเข้า (สร้างทีหลังได้ด้วย refresh)")
+    args = parser.parse_args()
+
+    run(args.path, fmt=args.format, chunk_size=args.chunk_size, checkpoint=args.checkpoint,
+        restart=args.restart, fetch_metadata=args.fetch_metadata, graphs=not args.no_graphs)
@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# การจัดการ connection ของ songs.db
+# - หนึ่ง connection ต่อ thread (ต่อโปรเซส) ใช้ซ้ำข้าม request → statement cache ของ sqlite3 ทำงานได้จริง
+# - WAL: ผู้อ่านไม่บล็อกผู้เขียน ลด "database is locked" เมื่อมีหลาย worker
+DB_PATH = os.getenv("SONGS_DB", "songs.db")
+
+PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),     # ปลอดภัยกับ WAL และ fsync น้อยกว่า FULL มาก
+    ("cache_size", -64000),        # ~64MB page cache ต่อ connection
+    ("mmap_size", 268435456),      # 256MB memory-mapped I/O
+    ("temp_store", "MEMORY"),
+    ("busy_timeout", 5000),        # รอ lock สูงสุด 5 วินาทีแทนการ error ทันที
+)
+
+_local = threading.local()
+
+
+def _connect(path):
+    # isolation_level=None: autocommit ทีละ statement, transaction ควบคุมเองผ่าน transaction()
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, cached_statements=256)
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
+
+def get_connection(path=None):
+    """คืน connection ของ thread ปัจจุบัน (สร้างใหม่ถ้ายังไม่มี หรือถ้าโปรเซสถูก fork มา)"""
+    path = path or DB_PATH
+    pool = getattr(_local, "pool", None)
+    if pool is None or getattr(_local, "pid", None) != os.getpid():
+        pool = _local.pool = {}
+        _local.pid = os.getpid()
+        _local.depth = {}
+    conn = pool.get(path)
+    if conn is None:
+        conn = pool[path] = _connect(path)
+    return conn
+
+
+def close_connection(path=None):
+    """ปิด connection ของ thread ปัจจุบัน (เช่น ตอนจบสคริปต์)"""
+    pool = getattr(_local, "pool", None) or {}
+    for p in ([path or DB_PATH] if path else list(pool)):
+        conn = pool.pop(p, None)
+        if conn is not None:
+            conn.close()
+
+
+@contextmanager
+def transaction(path=None):
+    """
+    with transaction() as cur: ...
+    commit เมื่อจบ block, rollback เมื่อมี exception
+    ซ้อนกันได้ (block ด้านในใช้ SAVEPOINT)
+    """
+    path = path or DB_PATH
+    conn = get_connection(path)
+    depth = _local.depth.get(path, 0)
+    savepoint = f"sp_{depth}"
+    # BEGIN IMMEDIATE จอง write lock ตั้งแต่ต้น กัน deadlock ตอนอัปเกรด lock
+    conn.execute("BEGIN IMMEDIATE" if depth == 0 else f"SAVEPOINT {savepoint}")
+    _local.depth[path] = depth + 1
+    try:
+        yield conn.cursor()
+    except BaseException:
+        if depth == 0:
+            conn.execute("ROLLBACK")
+        else:
+            conn.execute(f"ROLLBACK TO {savepoint}")
+            conn.execute(f"RELEASE {savepoint}")
+        raise
+    else:
+        conn.execute("COMMIT" if depth == 0 else f"RELEASE {savepoint}")
+    finally:
+        _local.depth[path] = depth
+
+
+def execute(query, args=(), fetch=False, path=None):
+    """รัน statement เดียวบน connection ของ thread (อยู่ใน transaction ที่เปิดอยู่ถ้ามี)"""
+    cur = get_connection(path).execute(query, args)
+    return cur.fetchall() if fetch else None
@@ -1,44 +1,11 @@
-import sqlite3
+from db import close_connection, execute
+from migrations import migrate, current_version
 
-conn = sqlite3.connect("songs.db")
-c = conn.cursor()
+# สร้าง/อัปเกรด schema ของ songs.db ผ่าน migrations.py (แอปก็เรียก migrate() ตอนเริ่มเช่นกัน)
+applied = migrate(verbose=True)
 
-# ตารางเพลงหลัก (เพิ่ม image_path)
-c.execute("""
-CREATE TABLE IF NOT EXISTS songs (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    title TEXT,
-    youtube_link TEXT,
-    description TEXT,
-    tags TEXT,
-    upload_date TEXT,
-    view_count INTEGER,
-    like_count INTEGER,
-    lyrics TEXT
-)
-""")
+if "shrink graph_html" in applied:
+    execute("VACUUM")  # คืนพื้นที่ไฟล์ songs.db หลังตัด plotly.js ออกจาก graph_html
 
-# ตาราง segment + อารมณ์
-c.execute("""
-CREATE TABLE IF NOT EXISTS segments (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    song_id INTEGER,
-    segment_order INTEGER,
-    text TEXT,
-    emotion TEXT,
-    FOREIGN KEY(song_id) REFERENCES songs(id)
-)
-""")
-
-try:
-    c.execute("ALTER TABLE songs ADD COLUMN image_path TEXT")
-except sqlite3.OperationalError:
-    print("Column already exists")
-
-try:
-    c.execute("ALTER TABLE songs ADD COLUMN graph_html TEXT")
-except sqlite3.OperationalError:
-    print("graph_html column already exists")
-
-conn.commit()
-conn.close()
\ No newline at end of file
+print(f"songs.db schema version {current_version()}" + ("" if applied else " (up to date)"))
+close_connection()
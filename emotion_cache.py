@@ -0,0 +1,193 @@
+"""
+แคชผลวิเคราะห์อารมณ์ราย segment
+
+แถวของลายเซ็นอื่น (โมเดล / backend / lexicon ต่างกัน) ไม่ถูกลบตอนเปิดแคช เพราะหลายโปรเซสที่ใช้
+ลายเซ็นต่างกันอาจใช้ songs.db เดียวกัน (เช่น เว็บที่ใช้ inference server กับ bulk_import ที่รันโมเดลเอง)
+ลายเซ็นอยู่ใน key อยู่แล้วจึงไม่มีทางได้ label ผิดชุด ล้างแถวเก่าด้วยคำสั่ง prune
+
+Usage:
+    python emotion_cache.py                          # จำนวนแถวต่อลายเซ็น
+    python emotion_cache.py prune --max-age-days 30 --max-rows 200000
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from db import get_connection, transaction
+from migrations import migrate
+
+# แคชผลวิเคราะห์อารมณ์ราย segment (content-addressed)
+# ชั้นที่ 1: LRU ในโปรเซส, ชั้นที่ 2: ตาราง emotion_cache ใน songs.db
+LRU_SIZE = int(os.getenv("EMOTION_CACHE_SIZE", "4096"))
+ENABLED = os.getenv("EMOTION_CACHE", "1") != "0"
+
+
+def normalize_text(text: str) -> str:
+    """ทำข้อความให้อยู่ในรูปเดียวกันก่อนทำ key (ท่อนซ้ำ/เว้นวรรคต่างกันได้ key เดียวกัน)"""
+    text = unicodedata.normalize("NFC", text or "")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def model_signature(model_name: str, labels, lexicon=None, markers=(), fallback_version=None) -> str:
+    """
+    ลายเซ็นของโมเดล + label set (+ lexicon, ชุดคำบ่งชี้, เวอร์ชันของ fallback) เปลี่ยนเมื่อไหร่แคชเดิมใช้ไม่ได้ทันที
+    markers: ชุดคำที่ fallback ใช้ตัดสิน (เช่น POSITIVE_MARKERS, NEGATIVE_MARKERS)
+    fallback_version: เปลี่ยนเมื่ออัลกอริทึมของ fallback เปลี่ยน (label ที่แคชไว้อาจมาจาก fallback)
+    """
+    parts = [model_name, ",".join(labels)]
+    if fallback_version:
+        parts.append(f"fallback={fallback_version}")
+    if lexicon:
+        parts.append(",".join(f"{k}={v}" for k, v in sorted(lexicon.items())))
+    for words in markers:
+        parts.append(",".join(sorted(words)))
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(text: str, signature: str, threshold: float, multi_label: bool) -> str:
+    raw = f"{signature}|{threshold:.4f}|{int(bool(multi_label))}|{normalize_text(text)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class EmotionCache:
+    """แคชสองชั้น: LRU (dict ในหน่วยความจำ) ด้านหน้า SQLite"""
+
+    def __init__(self, signature: str, db_path: str = None, maxsize: int = LRU_SIZE):
+        self.signature = signature
+        self.db_path = db_path
+        self.maxsize = maxsize
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._ready = False
+        self.counters = {"lru_hits": 0, "db_hits": 0, "misses": 0, "writes": 0}
+
+    def _connect(self):
+        conn = get_connection(self.db_path)
+        if not self._ready:
+            migrate(self.db_path)  # ตาราง emotion_cache มาจาก migration
+            self._ready = True
+        return conn
+
+    def _remember(self, key, label):
+        self._lru[key] = label
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)
+
+    def get_many(self, keys) -> dict:
+        """คืน {key: label} เฉพาะ key ที่เจอในแคช"""
+        found, missing = {}, []
+        with self._lock:
+            for k in keys:
+                if k in self._lru:
+                    self._lru.move_to_end(k)
+                    found[k] = self._lru[k]
+                    self.counters["lru_hits"] += 1
+                else:
+                    missing.append(k)
+        if not missing:
+            return found
+
+        conn = self._connect()
+        rows = []
+        # SQLite จำกัดจำนวน parameter ต่อ statement
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            rows += conn.execute(
+                f"SELECT key, label FROM emotion_cache WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+
+        with self._lock:
+            for k, label in rows:
+                found[k] = label
+                self._remember(k, label)
+            self.counters["db_hits"] += len(rows)
+            self.counters["misses"] += len(missing) - len(rows)
+        return found
+
+    def put_many(self, items: dict):
+        """บันทึก {key: label} ลงทั้งสองชั้น"""
+        if not items:
+            return
+        now = time.time()
+        self._connect()
+        with transaction(self.db_path) as cur:
+            cur.executemany(
+                "INSERT OR REPLACE INTO emotion_cache (key, signature, label, created_at) VALUES (?,?,?,?)",
+                [(k, self.signature, label, now) for k, label in items.items()],
+            )
+        with self._lock:
+            for k, label in items.items():
+                self._remember(k, label)
+            self.counters["writes"] += len(items)
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+        self._connect()
+        with transaction(self.db_path) as cur:
+            cur.execute("DELETE FROM emotion_cache")
+
+    def prune(self, max_age_days=None, max_rows=None) -> int:
+        """
+        ลบแถวที่เขียนนานกว่า max_age_days วัน แล้วเหลือแถวใหม่สุดไม่เกิน max_rows (ทุกลายเซ็นรวมกัน)
+        คืนจำนวนแถวที่ลบ
+        """
+        self._connect()
+        deleted = 0
+        with transaction(self.db_path) as cur:
+            if max_age_days is not None:
+                cur.execute("DELETE FROM emotion_cache WHERE created_at < ?",
+                            (time.time() - max_age_days * 86400,))
+                deleted += cur.rowcount
+            if max_rows is not None:
+                cur.execute("""
+                    DELETE FROM emotion_cache WHERE key IN (
+                        SELECT key FROM emotion_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                    )
+                """, (max_rows,))
+                deleted += cur.rowcount
+        with self._lock:
+            self._lru.clear()
+        return deleted
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self.counters)
+            c["lru_size"] = len(self._lru)
+        lookups = c["lru_hits"] + c["db_hits"] + c["misses"]
+        c["hit_rate"] = round((c["lru_hits"] + c["db_hits"]) / lookups, 4) if lookups else 0.0
+        c["signature"] = self.signature
+        return c
+
+
+def signature_counts(db_path=None) -> dict:
+    """{signature: จำนวนแถว} ในตาราง emotion_cache"""
+    migrate(db_path)
+    rows = get_connection(db_path).execute(
+        "SELECT signature, COUNT(*) FROM emotion_cache GROUP BY signature ORDER BY COUNT(*) DESC"
+    ).fetchall()
+    return dict(rows)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or prune the segment emotion cache")
+    parser.add_argument("command", nargs="?", choices=["stats", "prune"], default="stats")
+    parser.add_argument("--max-age-days", type=float, help="prune: ลบแถวที่เก่ากว่านี้")
+    parser.add_argument("--max-rows", type=int, help="prune: เหลือแถวใหม่สุดไม่เกินนี้")
+    args = parser.parse_args()
+
+    if args.command == "prune":
+        if args.max_age_days is None and args.max_rows is None:
+            parser.error("prune needs --max-age-days and/or --max-rows")
+        deleted = EmotionCache("").prune(args.max_age_days, args.max_rows)
+        print(f"🧹 ลบ {deleted} แถว")
+    for signature, count in signature_counts().items():
+        print(f"{signature or '-':<16} {count:>9}")
@@ -0,0 +1,113 @@
+import re
+from functools import lru_cache
+
+from lexicon_matcher import LexiconMatcher
+
+# label อารมณ์: alias ภาษาไทย → canonical และการสรุปอารมณ์ของเพลง
+# ใช้ร่วมกันระหว่าง app.py (หน้าเว็บ/ค้นหา) และ repository.py (สรุปอารมณ์ตอนเขียนเพลง)
+
+# === Thai Emotion Aliases → Canonical Labels ===
+TH_EMO_ALIASES = {
+    "เศร้า": {"เศร้า", "เสียใจ", "หม่น", "หมอง", "หดหู่", "ซึม", "ร้องไห้", "เหงา", "ทุกข์", "น้อยใจ", "ผิดหวัง"},
+    "หวัง": {"หวัง", "ความหวัง", "มีความหวัง", "เริ่มหวัง", "ฝัน", "กำลังใจ", "สู้", "พยายาม"},
+    "สุข": {"สุข", "มีความสุข", "ร่าเริง", "สดใส", "สนุก", "แฮปปี้", "ยิ้ม", "ดีใจ", "เบิกบาน", "ชื่นใจ"},
+    "สงบ": {"สงบ", "นิ่ง", "ใจเย็น", "เย็น", "ผ่อนคลาย", "ชิล", "สบาย", "พักผ่อน", "สงัด"},
+    "โกรธ": {"โกรธ", "โมโห", "เดือด", "เกรี้ยวกราด", "แค้น", "เคือง", "ฉุน", "เดือดดาล"},
+    "ตื่นเต้น": {"ตื่นเต้น", "เร้าใจ", "พีค", "เข้มข้น", "ฮึกเหิม", "เร่งเร้า", "มัน", "สะใจ", "เปรี้ยว"},
+    "กังวล": {"กังวล", "เครียด", "กลัว", "หวาดกลัว", "ประหม่า", "ลังเล", "ไม่แน่ใจ", "กระวนกระวาย"},
+}
+
+# reverse map: alias -> canonical
+ALIAS2CANON = {}
+for canon, aliases in TH_EMO_ALIASES.items():
+    for a in aliases:
+        ALIAS2CANON[a] = canon
+    ALIAS2CANON[canon] = canon  # รวมตัวมันเอง
+
+# automaton ของ alias ทั้งหมด เรียงตามลำดับใน ALIAS2CANON (alias ที่มาก่อนชนะ เหมือนการวนเช็คทีละตัว)
+_ALIAS_MATCHER = LexiconMatcher(ALIAS2CANON)
+
+@lru_cache(maxsize=8192)
+def _canonize(label: str) -> str:
+    """แปะ label ให้เป็น canonical (ไทย) จากผลโมเดล/ข้อความ"""
+    if not label:
+        return ""
+    t = re.sub(r"\s+", "", label.strip())
+    
+    # ตรวจสอบกรณีที่ label เป็นภาษาอังกฤษตรงๆ
+    from emotion_model import ENG_TO_THAI
+    if t.lower() in ENG_TO_THAI:
+        return ENG_TO_THAI[t.lower()]
+    
+    # หาแบบ contains เพื่อครอบคลุมคำขยาย เช่น 'มีความสุขมาก' (อ่านข้อความรอบเดียวด้วย automaton)
+    found = _ALIAS_MATCHER.first_ranked(t)
+    if found is not None:
+        return ALIAS2CANON[_ALIAS_MATCHER.patterns[found]]
+    
+    return t if t else ""
+
+
+def calculate_overall_emotion(emotions):
+    """
+    คำนวณอารมณ์โดยรวมของเพลงจากรายการอารมณ์
+    """
+    if not emotions:
+        return "unknown"
+    
+    # นับความถี่ของแต่ละอารมณ์
+    emotion_counts = {}
+    for emotion in emotions:
+        emotion = emotion.lower() if emotion else "unknown"
+        emotion_counts[emotion] = emotion_counts.get(emotion, 0) + 1
+    
+    # หาอารมณ์ที่มีความถี่สูงสุด
+    most_common_emotion = max(emotion_counts.items(), key=lambda x: x[1])
+    
+    # ถ้าอารมณ์ที่พบบ่อยที่สุดมีสัดส่วนมากกว่า 50% ให้ใช้อารมณ์นั้น
+    total_emotions = len(emotions)
+    if most_common_emotion[1] / total_emotions > 0.5:
+        return most_common_emotion[0]
+    
+    # ถ้าไม่มีความชัดเจน ให้วิเคราะห์จากลำดับอารมณ์
+    # หาอารมณ์ที่ปรากฏในส่วนท้ายของเพลง (มีน้ำหนักมากกว่า)
+    if len(emotions) >= 3:
+        # ใช้ 30% สุดท้ายของเพลง
+        end_portion = emotions[-max(1, len(emotions)//3):]
+        end_emotion_counts = {}
+        for emotion in end_portion:
+            emotion = emotion.lower() if emotion else "unknown"
+            end_emotion_counts[emotion] = end_emotion_counts.get(emotion, 0) + 1
+        
+        if end_emotion_counts:
+            return max(end_emotion_counts.items(), key=lambda x: x[1])[0]
+    
+    return most_common_emotion[0]
+
+
+def summarize_emotions(emotions):
+    """
+    สรุปอารมณ์ของเพลงจากลำดับอารมณ์ราย segment (ค่าที่หน้า / /explore /song/<id> ใช้)
+    Returns: dict(overall, path, trans_cnt, stable, histogram)
+    """
+    present = [e for e in emotions if e]
+
+    # histogram ตามลำดับที่พบครั้งแรก (ลำดับมีผลกับอารมณ์รองใน get_emotion_explanation)
+    histogram = {}
+    for e in present:
+        e = e.lower()
+        histogram[e] = histogram.get(e, 0) + 1
+
+    # บีบอัดอารมณ์ซ้ำติดกัน (เช่น 'สุข,สุข,สุข' -> 'สุข')
+    compressed = []
+    for e in (_canonize(e) for e in present):
+        if not compressed or compressed[-1] != e:
+            compressed.append(e)
+
+    return {
+        "overall": calculate_overall_emotion(present),
+        "path": " → ".join(compressed) if compressed else None,
+        "trans_cnt": max(len(compressed) - 1, 0),
+        # เพลงคงที่ = มีอารมณ์เดียวในทั้งเพลง (หลังบีบอัดเหลือ 1)
+        "stable": len(set(compressed)) == 1,
+        "histogram": histogram,
+    }
@@ -1,5 +1,10 @@
-from transformers import pipeline
-from pythainlp import word_tokenize
+import os
+import threading
+
+import numpy as np
+
+import emotion_cache
+from lexicon_matcher import LexiconMatcher
 
 # Lexicon mapping ระหว่างไทย-อังกฤษ
 # Lexicon mapping ระหว่างไทย-อังกฤษ (Expanded to 80+ words)
@@ -52,6 +57,46 @@ THAI_TO_ENG = {
 POSITIVE_MARKERS = {"ดี", "สวย", "งาม", "รัก", "ชอบ", "ใช่", "เลิศ", "สุด"}
 NEGATIVE_MARKERS = {"แย่", "เลว", "ไม่", "เกลียด", "เบื่อ", "เซ็ง", "เจ็บ", "ตาย"}
 
+# คำปฏิเสธ (อยู่ใน NEGATIVE_MARKERS) กลับความหมายของคำอารมณ์ที่ตามมา เช่น "ไม่เศร้า"
+NEGATIONS = {"ไม่"}
+# อารมณ์เชิงบวก: คำบ่งชี้เชิงลบใดๆ หน้าคำเหล่านี้ก็ถือว่าหักล้าง (เช่น "เบื่อ สนุก")
+POSITIVE_EMOTIONS = {"happy", "hope", "excited", "calm"}
+# จำนวนคำ (ไม่นับช่องว่าง) ก่อนคำอารมณ์ที่ตรวจหาคำปฏิเสธ เช่น "ไม่ค่อยเศร้า"
+NEGATION_WINDOW = 2
+
+# automaton ของคำอารมณ์ + คำบ่งชี้ทั้งหมด หาได้ในการอ่านข้อความรอบเดียว
+_CUES = LexiconMatcher(list(THAI_TO_ENG) + sorted(POSITIVE_MARKERS) + sorted(NEGATIVE_MARKERS))
+
+def _words(text: str) -> list:
+    """ช่วง (start, end) ของแต่ละคำจาก PyThaiNLP รวมช่องว่าง (import ตอนใช้ครั้งแรก โหลดพจนานุกรมช้า)"""
+    from pythainlp import word_tokenize
+    spans, pos = [], 0
+    for w in word_tokenize(text):
+        found = text.find(w, pos)
+        if found < 0:
+            continue  # tokenizer แปลงข้อความ → ข้ามคำนี้ (ขอบคำถัดไปยังถูกต้อง)
+        spans.append((found, found + len(w)))
+        pos = found + len(w)
+    return spans
+
+def lexicon_cues(text: str) -> list:
+    """
+    คำใน lexicon ที่พบในข้อความ (ซ้ายสุด-ยาวสุด ไม่ทับกัน): [(คำแรก, คำสุดท้าย, คำใน lexicon), ...]
+    คำแรก/คำสุดท้าย = ลำดับคำ (ไม่นับช่องว่าง) ที่ match ครอบ
+    รับเฉพาะ match ที่ขอบตรงกับขอบคำ ("ชอบ" ใน "รับผิดชอบ" ไม่นับ) จึงได้คำชุดเดียวกับการเทียบทีละ token
+    ข้อความที่ automaton ไม่พบคำใดเลยไม่ต้องตัดคำ
+    """
+    if next(_CUES.iter_matches(text), None) is None:
+        return []
+    spans = [(a, b) for a, b in _words(text) if text[a:b].strip()]
+    first = {a: k for k, (a, _) in enumerate(spans)}
+    last = {b: k for k, (_, b) in enumerate(spans)}
+    return [
+        (first[start], last[end], _CUES.patterns[i])
+        for start, end, i in _CUES.leftmost_longest(text, set(first) | set(last))
+        if start in first and end in last
+    ]
+
 # reverse mapping อังกฤษ-ไทย
 ENG_TO_THAI = {
     "sad": "เศร้า",
@@ -68,12 +113,136 @@ CANDIDATE_LABELS = ["sad", "lonely", "hope", "happy", "excited", "calm", "angry"
 
 # ใช้โมเดลที่ stable
 ZS_MODEL = "facebook/bart-large-mnli"
-_zs = pipeline("zero-shot-classification", model=ZS_MODEL)
+
+# ถ้าตั้งไว้ ส่งข้อความไปให้ inference_server.py (โมเดลเดียวต่อเครื่อง) แทนการโหลดโมเดลเอง
+INFERENCE_SERVER_URL = os.getenv("INFERENCE_SERVER_URL") or None
+
+# lexicon-first: ตัดสินจาก lexicon โดยไม่รันโมเดลเมื่อคะแนน lexicon ชนะขาด (ปิดไว้เป็นค่าเริ่มต้น)
+LEXICON_FIRST = os.getenv("LEXICON_FIRST", "0") == "1"
+# ความมั่นใจขั้นต่ำ (top - second) / (top + second + 1): คำเดียว = 0.5, สองคำ label เดียวกัน = 0.67
+LEXICON_CONFIDENCE = float(os.getenv("LEXICON_CONFIDENCE", "0.6"))
+
+# backend ของโมเดล: torch (transformers pipeline) / onnx / onnx-int8 (onnxruntime, ดู onnx_backend.py)
+EMOTION_BACKEND = os.getenv("EMOTION_BACKEND", "torch")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "models/bart-large-mnli-onnx")
+
+class _TorchClassifier:
+    """zero-shot pipeline ของ transformers (PyTorch float32)"""
+
+    def __init__(self, model_name):
+        from transformers import pipeline
+        zs = pipeline("zero-shot-classification", model=model_name)
+        self.model, self.tokenizer = zs.model, zs.tokenizer
+        self.entailment_id = zs.entailment_id
+        self.num_labels = self.model.config.num_labels
+
+    def logits(self, features):
+        import torch
+        batch = self.tokenizer.pad(features, return_tensors="pt")
+        batch = {k: v.to(self.model.device) for k, v in batch.items()}
+        with torch.no_grad():
+            return self.model(**batch).logits.float().cpu().numpy()
+
+def load_classifier(backend=None):
+    """สร้าง classifier ของ backend ที่ระบุ (ค่าเริ่มต้น EMOTION_BACKEND)"""
+    backend = backend or EMOTION_BACKEND
+    if backend == "torch":
+        return _TorchClassifier(ZS_MODEL)
+    if backend in ("onnx", "onnx-int8"):
+        from onnx_backend import OnnxClassifier
+        return OnnxClassifier(ONNX_MODEL_DIR, quantized=backend == "onnx-int8")
+    raise ValueError(f"unknown EMOTION_BACKEND: {backend}")
+
+# โหลดโมเดลครั้งแรกที่ต้องใช้ (import โมดูลนี้เพื่อใช้ lexicon / label จึงไม่ต้องรอโหลดโมเดล)
+_zs = None
+_zs_lock = threading.Lock()
+
+def get_classifier():
+    """classifier ของ EMOTION_BACKEND ที่ใช้ร่วมกันทุก thread (สร้างครั้งเดียวภายใต้ lock)"""
+    global _zs
+    if _zs is None:
+        with _zs_lock:
+            if _zs is None:
+                _zs = load_classifier()
+    return _zs
+
+def warmup():
+    """โหลดโมเดลและ tokenizer ล่วงหน้า (เช่น ก่อนเปิดรับ request) แล้วรันหนึ่ง forward pass"""
+    _lexicon_fallback("warmup")
+    if INFERENCE_SERVER_URL:
+        return  # โมเดลอยู่ที่ inference server
+    get_classifier()
+    _zs_batch(["warmup"], False, 1)
+
+# template เดียวกับที่ zero-shot pipeline ใช้ภายใน (ต้องตรงกันเพื่อให้ผลเหมือนเดิม)
+HYPOTHESIS_TEMPLATE = "This example is {}."
+# จำนวนคู่ (segment, label) ต่อหนึ่ง forward pass
+ZS_BATCH_SIZE = int(os.getenv("ZS_BATCH_SIZE", "32"))
+
+# แคชผลราย segment: key = ข้อความ (normalize) + โมเดล + threshold + multi_label
+# lexicon และคำบ่งชี้บวก/ลบอยู่ในลายเซ็นด้วยเพราะ fallback มีผลต่อ label สุดท้าย
+# backend อื่นที่ไม่ใช่ torch ให้คะแนนต่างกันเล็กน้อย (โดยเฉพาะ int8) จึงแยกแคชกัน
+# เวอร์ชันของ lexicon fallback (เปลี่ยนทุกครั้งที่วิธีหาคำ/ตัดสินเปลี่ยน → label เก่าในแคชไม่ถูกใช้ต่อ)
+LEXICON_FALLBACK_VERSION = "ac-word-boundary-1"
+
+def _cache_signature(backend):
+    return emotion_cache.model_signature(
+        ZS_MODEL if backend == "torch" else f"{ZS_MODEL}@{backend}", CANDIDATE_LABELS, THAI_TO_ENG,
+        (POSITIVE_MARKERS, NEGATIVE_MARKERS), LEXICON_FALLBACK_VERSION,
+    )
+
+# ใช้ inference server: backend ที่ให้คะแนนคือของเซิร์ฟเวอร์ → สร้างแคชเมื่อรู้ backend จาก /health (get_cache)
+_cache_backend = None if INFERENCE_SERVER_URL else EMOTION_BACKEND
+_cache = emotion_cache.EmotionCache(_cache_signature(EMOTION_BACKEND)) \
+    if emotion_cache.ENABLED and not INFERENCE_SERVER_URL else None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """แคชของ backend ที่ให้คะแนนจริง (None = ปิดแคช หรือยังถาม backend จากเซิร์ฟเวอร์ไม่ได้)"""
+    global _cache, _cache_backend
+    if _cache is None and emotion_cache.ENABLED and INFERENCE_SERVER_URL:
+        from inference_server import server_backend
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    backend = server_backend(INFERENCE_SERVER_URL) or "torch"
+                except Exception:
+                    return None  # เซิร์ฟเวอร์ไม่ตอบ → รอบนี้ไม่ใช้แคช ถามใหม่ครั้งหน้า
+                _cache_backend = backend
+                _cache = emotion_cache.EmotionCache(_cache_signature(backend))
+    return _cache
+
+def _drop_cache(backend):
+    """เซิร์ฟเวอร์เปลี่ยน backend ระหว่างทาง → ทิ้งแคชเดิม ให้ get_cache สร้างใหม่ตาม backend ปัจจุบัน"""
+    global _cache, _cache_backend
+    with _cache_lock:
+        if _cache_backend != backend:
+            _cache, _cache_backend = None, None
+
+def cache_stats() -> dict:
+    """ตัวนับ hit/miss ของแคชอารมณ์"""
+    if _cache:
+        return {**_cache.stats(), "backend": _cache_backend}
+    return {"enabled": False}
+
+# จำนวน segment ต่อเส้นทางที่ใช้ตัดสิน (cache / lexicon / model / fallback)
+_paths = {}
+_paths_lock = threading.Lock()
+
+def _count_paths(paths):
+    with _paths_lock:
+        for p in paths:
+            if p != "empty":
+                _paths[p] = _paths.get(p, 0) + 1
+
+def path_stats() -> dict:
+    with _paths_lock:
+        return dict(_paths)
 
 def _lexicon_fallback(text: str) -> str:
     """ค้นหาอารมณ์จาก lexicon ถ้าไม่เจอใช้ neutral"""
-    # แยกคำด้วย PyThaiNLP
-    tokens = word_tokenize(text)
+    # หาคำใน lexicon ด้วย automaton (คำที่ยาวกว่าชนะ เช่น "ดีใจ" ไม่ใช่ "ดี")
+    tokens = [w for _, _, w in lexicon_cues(text)]
     
     # 1. Direct Lexicon Match
     for w in tokens:
@@ -91,38 +260,197 @@ def _lexicon_fallback(text: str) -> str:
         
     return "neutral"
 
-def detect_emotion(text: str, threshold: float = 0.55, multi_label: bool = False) -> str:
-    """วิเคราะห์อารมณ์จากข้อความ ถ้าไม่มั่นใจจะใช้ lexicon fallback"""
-    if not text.strip():
-        return "neutral" 
-    
+def lexicon_scores(text: str) -> dict:
+    """
+    นับคำใน lexicon ต่อ label (คำที่ถูกปฏิเสธไม่นับ)
+    Returns: {label: จำนวนคำ}
+    """
+    cues = lexicon_cues(text)
+
+    scores = {}
+    for i, (first, _, w) in enumerate(cues):
+        label = THAI_TO_ENG.get(w)
+        if label is None:
+            continue
+        # คำใน lexicon ที่จบภายใน NEGATION_WINDOW คำก่อนหน้า
+        before = [b for _, last, b in cues[:i] if last >= first - NEGATION_WINDOW]
+        if any(b in NEGATIONS for b in before):
+            continue
+        if label in POSITIVE_EMOTIONS and any(b in NEGATIVE_MARKERS for b in before):
+            continue
+        scores[label] = scores.get(label, 0) + 1
+    return scores
+
+def lexicon_decide(text: str, confidence: float = None):
+    """
+    label จาก lexicon เมื่อชนะขาดตั้งแต่ confidence ขึ้นไป ไม่งั้นคืน None (ให้โมเดลตัดสิน)
+    confidence = (top - second) / (top + second + 1)
+    """
+    confidence = LEXICON_CONFIDENCE if confidence is None else confidence
+    ranked = sorted(lexicon_scores(text).items(), key=lambda kv: -kv[1])
+    if not ranked:
+        return None
+    top = ranked[0][1]
+    second = ranked[1][1] if len(ranked) > 1 else 0
+    if (top - second) / (top + second + 1) >= confidence:
+        return ranked[0][0]
+    return None
+
+def _decide(text: str, labels, scores, threshold: float, multi_label: bool) -> str:
+    """เลือก label จากผล zero-shot ถ้าไม่มั่นใจจะใช้ lexicon fallback"""
+    if multi_label:
+        picked = [lbl for lbl, sc in zip(labels, scores) if sc >= threshold]
+        if picked:
+            return picked[0]
+    else:
+        lbl, sc = labels[0], scores[0]
+        if sc >= threshold:
+            return lbl
+
+    # 2. Smart Fallback (Lexicon + Context)
+    # กรณีคะแนนไม่ถึง threshold หรือโมเดลไม่มั่นใจ ให้ใช้ Lexicon/Context
+    lexicon_result = _lexicon_fallback(text)
+
+    # ถ้า Lexicon เจออารมณ์ชัดเจน (ไม่ใช่ neutral) ให้ใช้อันนั้น
+    if lexicon_result != "neutral":
+        return lexicon_result
+
+    # ถ้า Lexicon ก็ไม่เจอ ให้ return ผลจากโมเดลแม้คะแนนจะต่ำ (Best Effort)
+    # แต่ถ้าคะแนนต่ำมากๆ (<0.3) ให้ fallback เป็น neutral จริงๆ เพื่อลด noise
+    if not multi_label and scores[0] < 0.35: # Hard floor for very low confidence
+        return "neutral"
+
+    return labels[0] # Return best guess from model
+
+def _zs_batch(texts, multi_label: bool, batch_size: int, classifier=None):
+    """
+    รัน zero-shot แบบ batch: ทุกคู่ (segment × label) ถูก tokenize ครั้งเดียว
+    เรียงตามความยาวแล้ว pad ทีละ batch เพื่อลด padding ที่เสียเปล่า
+    คืนค่า [(labels, scores), ...] เรียงคะแนนมาก→น้อย เหมือน output ของ pipeline
+    """
+    zs = classifier or get_classifier()
+    tokenizer = zs.tokenizer
+    entailment_id = zs.entailment_id
+    contradiction_id = -1 if entailment_id == 0 else 0
+
+    n_labels = len(CANDIDATE_LABELS)
+    premises = [t for t in texts for _ in CANDIDATE_LABELS]
+    hypotheses = [HYPOTHESIS_TEMPLATE.format(lbl) for _ in texts for lbl in CANDIDATE_LABELS]
+    encoded = tokenizer(premises, hypotheses, truncation="only_first")
+    features = [{k: encoded[k][i] for k in encoded.keys()} for i in range(len(premises))]
+
+    # เรียงตามจำนวน token เพื่อให้แต่ละ batch ยาวใกล้เคียงกัน
+    order = sorted(range(len(features)), key=lambda i: len(features[i]["input_ids"]))
+    logits = np.zeros((len(features), zs.num_labels), dtype=np.float32)
+
+    for start in range(0, len(order), batch_size):
+        idx = order[start:start + batch_size]
+        logits[idx] = zs.logits([features[i] for i in idx])
+
+    logits = logits.reshape(len(texts), n_labels, -1)
+    if multi_label:
+        pair = logits[..., [contradiction_id, entailment_id]]
+        pair = np.exp(pair - pair.max(-1, keepdims=True))
+        scores = pair[..., 1] / pair.sum(-1)
+    else:
+        entail = logits[..., entailment_id]
+        entail = np.exp(entail - entail.max(-1, keepdims=True))
+        scores = entail / entail.sum(-1, keepdims=True)
+
+    results = []
+    for row in scores:
+        top = row.argsort()[::-1]
+        results.append(([CANDIDATE_LABELS[i] for i in top], [float(row[i]) for i in top]))
+    return results
+
+def _rank(texts, multi_label: bool, batch_size: int):
+    """
+    อันดับ label + คะแนนจากโมเดล (inference server ถ้าตั้งไว้ ไม่งั้นรันในโปรเซสนี้)
+    Returns: (ranked, backend ที่ให้คะแนน)
+    """
+    if INFERENCE_SERVER_URL:
+        from inference_server import rank_remote
+        ranked, backend = rank_remote(INFERENCE_SERVER_URL, texts, multi_label, with_backend=True)
+        return ranked, backend or "torch"
+    return _zs_batch(texts, multi_label, batch_size), EMOTION_BACKEND
+
+def detect_emotions(segments, threshold: float = 0.55, multi_label: bool = False,
+                    batch_size: int = None, use_cache: bool = True,
+                    lexicon_first: bool = None, lexicon_confidence: float = None,
+                    return_paths: bool = False):
+    """
+    วิเคราะห์อารมณ์หลาย segment พร้อมกัน (ทั้งเพลงใน forward pass ชุดเดียว)
+    ใช้กติกาเดียวกับ detect_emotion: threshold, lexicon fallback และ floor 0.35
+    segment ที่เคยวิเคราะห์แล้ว (หรือซ้ำในเพลงเดียวกัน เช่นท่อนฮุก) จะไม่เข้าโมเดลอีก
+    lexicon_first (ค่าเริ่มต้น LEXICON_FIRST): segment ที่ lexicon ชนะขาดไม่ต้องเข้าโมเดล
+    return_paths=True: คืน (labels, paths) โดย path ต่อ segment เป็น
+        "empty" / "cache" / "lexicon" / "model" / "fallback" (โมเดลล้มเหลว)
+    """
+    results = ["neutral"] * len(segments)
+    paths = ["empty"] * len(segments)
+
+    def done():
+        _count_paths(paths)
+        return (results, paths) if return_paths else results
+
+    todo = [i for i, text in enumerate(segments) if text.strip()]
+    if not todo:
+        return done()
+
+    cache = get_cache() if use_cache else None
+    keys = {}
+    if cache:
+        keys = {i: emotion_cache.cache_key(segments[i], cache.signature, threshold, multi_label) for i in todo}
+        hits = cache.get_many(list(dict.fromkeys(keys.values())))
+        for i in todo:
+            if keys[i] in hits:
+                results[i], paths[i] = hits[keys[i]], "cache"
+        todo = [i for i in todo if keys[i] not in hits]
+        if not todo:
+            return done()
+
+    # lexicon-first: ตัดสินเลยถ้า lexicon มั่นใจพอ (ไม่เก็บลงแคช เพื่อให้ปิดโหมดนี้แล้วได้ผลโมเดลเหมือนเดิม)
+    if LEXICON_FIRST if lexicon_first is None else lexicon_first:
+        remaining = []
+        for i in todo:
+            label = lexicon_decide(segments[i], lexicon_confidence)
+            if label is None:
+                remaining.append(i)
+            else:
+                results[i], paths[i] = label, "lexicon"
+        todo = remaining
+        if not todo:
+            return done()
+
+    # ข้อความซ้ำกันรันโมเดลครั้งเดียว
+    first = {}
+    for i in todo:
+        first.setdefault(keys.get(i, emotion_cache.normalize_text(segments[i])), i)
+    unique = list(first.values())
+    texts = [segments[i] for i in unique]
+
     try:
-        # 1. Zero-shot Classification
-        res = _zs(text, candidate_labels=CANDIDATE_LABELS, multi_label=multi_label)
-        
-        if multi_label:
-            picked = [lbl for lbl, sc in zip(res["labels"], res["scores"]) if sc >= threshold]
-            if picked:
-                return picked[0]
-        else:
-            lbl, sc = res["labels"][0], res["scores"][0]
-            if sc >= threshold:
-                return lbl
-        
-        # 2. Smart Fallback (Lexicon + Context)
-        # กรณีคะแนนไม่ถึง threshold หรือโมเดลไม่มั่นใจ ให้ใช้ Lexicon/Context
-        lexicon_result = _lexicon_fallback(text)
-        
-        # ถ้า Lexicon เจออารมณ์ชัดเจน (ไม่ใช่ neutral) ให้ใช้อันนั้น
-        if lexicon_result != "neutral":
-            return lexicon_result
-            
-        # ถ้า Lexicon ก็ไม่เจอ ให้ return ผลจากโมเดลแม้คะแนนจะต่ำ (Best Effort)
-        # แต่ถ้าคะแนนต่ำมากๆ (<0.3) ให้ fallback เป็น neutral จริงๆ เพื่อลด noise
-        if not multi_label and res["scores"][0] < 0.35: # Hard floor for very low confidence
-            return "neutral"
-            
-        return res["labels"][0] # Return best guess from model
-        
+        ranked, backend = _rank(texts, multi_label, batch_size or ZS_BATCH_SIZE)
+        decided = {i: _decide(text, labels, scores, threshold, multi_label)
+                   for i, text, (labels, scores) in zip(unique, texts, ranked)}
     except Exception:
-        return _lexicon_fallback(text)
+        # โมเดล / inference server ล้มเหลว → lexicon (ไม่เก็บลงแคช)
+        for i in todo:
+            results[i], paths[i] = _lexicon_fallback(segments[i]), "fallback"
+        return done()
+
+    for i in todo:
+        results[i] = decided[first[keys.get(i, emotion_cache.normalize_text(segments[i]))]]
+        paths[i] = "model"
+    if cache:
+        if backend == _cache_backend:
+            cache.put_many({keys[i]: decided[i] for i in unique})
+        else:
+            _drop_cache(backend)  # ผลนี้มาจาก backend อื่น ไม่เก็บใต้ลายเซ็นเดิม
+    return done()
+
+def detect_emotion(text: str, threshold: float = 0.55, multi_label: bool = False,
+                   lexicon_first: bool = None) -> str:
+    """วิเคราะห์อารมณ์จากข้อความ ถ้าไม่มั่นใจจะใช้ lexicon fallback"""
+    return detect_emotions([text], threshold=threshold, multi_label=multi_label,
+                           lexicon_first=lexicon_first)[0]
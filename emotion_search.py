@@ -0,0 +1,253 @@
+"""
+เครื่องมือค้นหาเพลงตามลำดับอารมณ์ (ใช้ใน /search)
+
+ลำดับอารมณ์ของทุกเพลงถูกเก็บเป็น array ของรหัสตัวเลข (int32) ต่อกันเป็นก้อนเดียว + offsets ต่อเพลง
+- inverted index: อารมณ์ → เพลงที่มี (พร้อมจำนวนครั้ง)
+- ตำแหน่งแรก/สุดท้ายของแต่ละอารมณ์ในทุกเพลง (array หนาแน่น อารมณ์ × เพลง)
+  ใช้ตัดผู้สมัครด้วยคู่อารมณ์ตามลำดับ (a มาก่อน b ที่ไหนก็ได้ในเพลง) แบบ vectorized
+- ตรวจ subsequence ของผู้สมัครทุกเพลงพร้อมกันด้วย searchsorted บนตำแหน่งของแต่ละอารมณ์
+
+ผลลัพธ์และลำดับตรงกับ soft_subseq_match + calculate_match_score เดิมทุกประการ:
+- query หลายอารมณ์: เพลงที่มี query เป็น subsequence ได้คะแนน 1.0
+- query อารมณ์เดียว: คะแนน = จำนวน segment ที่ตรง / จำนวน segment ทั้งหมด
+- เรียงตามคะแนนมาก→น้อย, view_count มาก→น้อย, แล้วตาม id
+
+แบ่งหน้าด้วย cursor = (คะแนน, view_count, id) ของผลลัพธ์สุดท้ายในหน้าก่อน (encode_cursor / decode_cursor)
+แต่ละหน้าเลือก top-k ด้วย np.partition แล้วเรียงจริงเฉพาะ k ตัว ไม่เรียงทุกเพลงที่ match
+"""
+import threading
+
+import numpy as np
+
+from repository import emotion_code_labels, get_data_version, load_emotion_codes
+
+
+def encode_cursor(score, views, song_id):
+    """cursor ของหน้าถัดไป (ข้อความ ใช้ใน URL/ฟอร์มได้) repr ของ float แปลงกลับได้ค่าเดิมทุกบิต"""
+    return f"{float(score)!r}:{float(views)!r}:{int(song_id)}"
+
+
+def decode_cursor(cursor):
+    """คืน (score, views, song_id) หรือ None ถ้า cursor ว่าง/ผิดรูปแบบ (เริ่มหน้าแรก)"""
+    try:
+        score, views, song_id = cursor.split(":")
+        return float(score), float(views), int(song_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def top_k(keys, k):
+    """
+    ตำแหน่งของ k อันดับแรกตาม keys (list ของ array, สำคัญสุดก่อน, ค่ามากดีกว่า) เรียงจากดีไปแย่
+    เลือกด้วย np.partition ทีละ key: ค่าที่ดีกว่าอันดับ k ติดแน่นอน ค่าที่เสมออันดับ k ไปตัดสินด้วย key ถัดไป
+    """
+    pool = np.arange(len(keys[0]))
+    chosen = []
+    need = k
+    for key in keys:
+        if len(pool) <= need:
+            break
+        values = key[pool]
+        kth = np.partition(values, len(pool) - need)[len(pool) - need]
+        better = values > kth
+        chosen.append(pool[better])
+        need -= int(better.sum())
+        pool = pool[values == kth]
+    chosen.append(pool[:need])
+    picked = np.concatenate(chosen)
+    order = np.lexsort([key[picked] for key in reversed(keys)])[::-1]
+    return picked[order]
+
+
+def _normalizer():
+    from emotion_model import THAI_TO_ENG
+
+    def normalize(e):
+        # ภาษาไทย → อังกฤษ (ตรงกับฐานข้อมูล), อังกฤษ → lowercase
+        if e in THAI_TO_ENG:
+            return THAI_TO_ENG[e]
+        return e.lower() if e else e
+    return normalize
+
+
+class EmotionSearchIndex:
+    """snapshot ของลำดับอารมณ์ทุกเพลง (อ่านอย่างเดียว ใช้ข้าม thread ได้)"""
+
+    def __init__(self, song_ids, views, codes, lengths, vocab, normalize):
+        """
+        codes: รหัสอารมณ์ (ตาม vocab) ของทุกเพลงต่อกัน, lengths: จำนวน segment ต่อเพลง
+        vocab: {label ที่ normalize แล้ว: รหัส}
+        """
+        self.normalize = normalize
+        self.vocab = vocab
+        n = len(song_ids)
+        self.song_ids = np.asarray(song_ids, dtype=np.int64)
+        self.views = np.asarray([v or 0 for v in views], dtype=np.float64)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(self.lengths, out=self.offsets[1:])
+        codes = np.asarray(codes, dtype=np.int32)
+        song_of = np.repeat(np.arange(n, dtype=np.int64), self.lengths)
+
+        # ตำแหน่ง (global) ของแต่ละอารมณ์ เรียงจากน้อยไปมาก
+        order = np.argsort(codes, kind="stable")
+        bounds = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=len(self.vocab)), out=bounds[1:])
+        self.positions = [order[bounds[c]:bounds[c + 1]] for c in range(len(self.vocab))]
+
+        # inverted index: อารมณ์ → (เพลง, จำนวนครั้ง) และตำแหน่งแรก/สุดท้ายต่อเพลง
+        self.postings = []
+        self.first = np.full((len(self.vocab), n), np.iinfo(np.int64).max, dtype=np.int64)
+        self.last = np.full((len(self.vocab), n), -1, dtype=np.int64)
+        for c, pos in enumerate(self.positions):
+            songs, first_idx, counts = np.unique(song_of[pos], return_index=True, return_counts=True)
+            self.postings.append((songs, counts))
+            self.first[c, songs] = pos[first_idx]
+            self.last[c, songs] = pos[first_idx + counts - 1]
+
+    @classmethod
+    def from_sequences(cls, song_ids, views, sequences, normalize):
+        """สร้างจาก list ของลำดับ label ต่อเพลง"""
+        vocab, code_of_label, flat = {}, {}, []
+        for seq in sequences:
+            for label in seq:
+                code = code_of_label.get(label)
+                if code is None:
+                    # label ดิบมีไม่กี่แบบ → normalize ครั้งเดียวต่อ label
+                    code = code_of_label[label] = vocab.setdefault(normalize(label), len(vocab))
+                flat.append(code)
+        return cls(song_ids, views, flat, [len(seq) for seq in sequences], vocab, normalize)
+
+    def __len__(self):
+        return len(self.song_ids)
+
+    def _after(self, songs, scores, after):
+        """mask ของเพลงที่อยู่หลัง cursor (score, views, id) ในลำดับผลลัพธ์"""
+        score, views, song_id = after
+        ids, song_views = self.song_ids[songs], self.views[songs]
+        return (scores < score) | ((scores == score) & (
+            (song_views < views) | ((song_views == views) & (ids > song_id))))
+
+    def match(self, query, after=None):
+        """
+        query: list ของอารมณ์ (ไทย/อังกฤษ)
+        after: cursor (score, views, id) → คืนเฉพาะเพลงที่อยู่หลัง cursor
+        Returns: (ตำแหน่งเพลงที่ match, คะแนน) เรียงตาม id
+        """
+        empty = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        if not query:
+            return empty
+        codes = [self.vocab.get(self.normalize(e)) for e in query]
+        if any(c is None for c in codes):
+            return empty  # มีอารมณ์ที่ไม่มีเพลงไหนเลย
+
+        # กรณีอารมณ์คงที่: มีอย่างน้อย 1 ครั้ง, คะแนน = สัดส่วน segment ที่ตรง
+        if len(set(codes)) == 1:
+            songs, counts = self.postings[codes[0]]
+            scores = np.minimum(counts / self.lengths[songs], 1.0)
+            if after is not None:
+                keep = self._after(songs, scores, after)
+                songs, scores = songs[keep], scores[keep]
+            return songs, scores
+
+        # ตัดผู้สมัคร: ทุกคู่ที่ติดกันใน query ต้องมี a ปรากฏก่อน b ในเพลง (เงื่อนไขจำเป็น)
+        mask = None
+        for a, b in {(a, b) for a, b in zip(codes, codes[1:])}:
+            pair = self.first[a] < self.last[b]
+            mask = pair if mask is None else mask & pair
+        candidates = np.flatnonzero(mask)
+        if after is not None:
+            # คะแนนสูงสุดที่เป็นไปได้คือ 1.0 → ผู้สมัครที่แม้ได้ 1.0 ก็ยังไม่อยู่หลัง cursor ไม่ต้องตรวจ subsequence
+            candidates = candidates[self._after(candidates, np.ones(len(candidates)), after)]
+        if not len(candidates):
+            return empty
+
+        # ตรวจ subsequence แบบ greedy ของผู้สมัครทุกเพลงพร้อมกัน
+        cursor = self.offsets[candidates] - 1
+        for c in codes:
+            pos = self.positions[c]
+            k = np.searchsorted(pos, cursor, side="right")
+            ok = k < len(pos)
+            nxt = pos[np.minimum(k, len(pos) - 1)]
+            ok &= nxt < self.offsets[candidates + 1]
+            candidates, cursor = candidates[ok], nxt[ok]
+            if not len(candidates):
+                return empty
+        return candidates, np.ones(len(candidates), dtype=np.float64)
+
+    def search(self, query, limit=None, after=None):
+        """
+        Returns: [(song_id, score), ...] เรียงตามคะแนน, view_count (มาก→น้อย) แล้วตาม id
+        limit: จำนวนผลลัพธ์สูงสุด (None = ทั้งหมด), after: cursor จาก page() / decode_cursor
+        """
+        songs, scores = self.match(query, after)
+        if limit is None:
+            # songs เรียงตาม id อยู่แล้ว → stable sort สองรอบ (view_count แล้วคะแนน) ให้ลำดับเสมอกันตาม id
+            order = np.argsort(-self.views[songs], kind="stable")
+            order = order[np.argsort(-scores[order], kind="stable")]
+        else:
+            order = top_k([scores, self.views[songs], -self.song_ids[songs]], limit)
+        return list(zip(self.song_ids[songs[order]].tolist(), scores[order].tolist()))
+
+    def page(self, query, limit, after=None):
+        """
+        ผลลัพธ์หนึ่งหน้า: ([(song_id, score), ...], cursor ของหน้าถัดไป หรือ None ถ้าหมดแล้ว)
+        after: cursor ที่ได้จากหน้าก่อน (ข้อความ)
+        """
+        ranked = self.search(query, limit + 1, decode_cursor(after) if after else None)
+        if len(ranked) <= limit:
+            return ranked, None
+        ranked = ranked[:limit]
+        song_id, score = ranked[-1]
+        pos = np.searchsorted(self.song_ids, song_id)  # song_ids เรียงตาม id
+        return ranked, encode_cursor(score, self.views[pos], song_id)
+
+
+class EmotionSearchEngine:
+    """
+    ถือ EmotionSearchIndex ล่าสุด สร้างใหม่อัตโนมัติเมื่อข้อมูลเพลงเปลี่ยน
+    canonize: ฟังก์ชันแปลง label จากฐานข้อมูลเป็น canonical (เหมือนที่ใช้กับ query)
+    """
+
+    def __init__(self, canonize):
+        self.canonize = canonize
+        self._index = None
+        self._fingerprint = None
+        self._lock = threading.Lock()
+
+    def _current_fingerprint(self):
+        # ทุก write path (เพิ่ม/refresh/rebuild/ลบ) เพิ่ม data version ใน transaction เดียวกัน
+        return get_data_version()[0]
+
+    def invalidate(self):
+        self._fingerprint = None
+
+    def get_index(self):
+        fingerprint = self._current_fingerprint()
+        if self._index is not None and fingerprint == self._fingerprint:
+            return self._index
+        with self._lock:
+            if self._index is None or fingerprint != self._fingerprint:
+                self._index = self.build()
+                self._fingerprint = fingerprint
+            return self._index
+
+    def build(self):
+        # ลำดับรหัสอารมณ์จาก song_emotion_summary → แปลงรหัสเป็น vocab ของการค้นหาด้วยตาราง lookup
+        normalize = _normalizer()
+        songs = load_emotion_codes()
+        vocab = {}
+        lut = np.array([
+            vocab.setdefault(normalize(self.canonize(label)), len(vocab))
+            for label in emotion_code_labels()  # อ่านหลัง seq → ครอบคลุมทุกรหัสที่ใช้
+        ], dtype=np.int32)
+        codes = lut[np.concatenate([seq for _, _, seq in songs])] if songs else np.zeros(0, dtype=np.int32)
+        return EmotionSearchIndex(
+            [s[0] for s in songs], [s[1] for s in songs], codes, [len(s[2]) for s in songs], vocab, normalize,
+        )
+
+    def search(self, query, limit=None, after=None):
+        return self.get_index().search(query, limit, after)
+
+    def page(self, query, limit, after=None):
+        return self.get_index().page(query, limit, after)
@@ -1,4 +1,4 @@
-import sqlite3
+from db import get_connection
 import pandas as pd
 from sklearn.metrics import accuracy_score, precision_recall_fscore_support, confusion_matrix, classification_report
 import numpy as np
@@ -112,7 +112,7 @@ def test_neutral_reduction_on_db():
     print("🧪 NEUTRAL BIAS REDUCTION TEST (Re-analyzing DB Data)")
     print("="*65)
     try:
-        conn = sqlite3.connect("songs.db")
+        conn = get_connection()
         cursor = conn.cursor()
         
         # Get actual segments labeled as 'neutral' from the database
@@ -145,7 +145,6 @@ def test_neutral_reduction_on_db():
                 print(f" - '{text[:40]}...' -> {new_emo}")
                 changed_count += 1
                 
-        conn.close()
     except Exception as e:
         print(f"⚠️ Error testing DB: {e}")
 
@@ -155,7 +154,7 @@ def analyze_dataset_statistics():
     print("="*40)
     
     try:
-        conn = sqlite3.connect("songs.db")
+        conn = get_connection()
         
         # 1. Emotion Distribution
         df = pd.read_sql_query("SELECT emotion, COUNT(*) as count FROM segments GROUP BY emotion ORDER BY count DESC", conn)
@@ -173,7 +172,6 @@ def analyze_dataset_statistics():
         print("- Lukthung: 12%")
         print("- Ballad  : 8%")
         
-        conn.close()
     except Exception as e:
         print(f"⚠️ Could not connect to database or empty data: {e}")
 
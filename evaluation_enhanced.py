@@ -8,7 +8,7 @@ Emotion Music App - Enhanced Evaluation System
 4. Detailed Error Analysis
 """
 
-import sqlite3
+from db import get_connection
 import pandas as pd
 from sklearn.metrics import (
     accuracy_score, precision_recall_fscore_support, 
@@ -260,7 +260,7 @@ def test_on_real_songs():
     print("="*70)
     
     try:
-        conn = sqlite3.connect("songs.db")
+        conn = get_connection()
         cursor = conn.cursor()
         
         # Get sample segments from each emotion
@@ -295,7 +295,6 @@ def test_on_real_songs():
         accuracy = correct / len(samples) * 100
         print(f"\n🎯 Accuracy on Real Songs: {correct}/{len(samples)} = {accuracy:.1f}%")
         
-        conn.close()
     except Exception as e:
         print(f"⚠️ Error: {e}")
 
@@ -199,6 +199,13 @@ def calculate_majority_vote(votes):
     return majority_label, agreement_rate, vote_counts
 
 
+def ground_truth_sets():
+    """ชุด ground truth ทั้งสามแบบ (ไม่ oversample) สำหรับสคริปต์เทียบ backend / benchmark"""
+    extended = [sample for samples in EXTENDED_GROUND_TRUTH.values() for sample in samples]
+    crowdsourced = [(text, calculate_majority_vote(votes)[0]) for text, votes in CROWDSOURCED_VOTES]
+    return {"basic": BASIC_GROUND_TRUTH, "extended": extended, "crowdsourced": crowdsourced}
+
+
 def create_balanced_dataset(data_dict):
     """Create balanced dataset using oversampling"""
     max_count = max(len(samples) for samples in data_dict.values())
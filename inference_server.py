@@ -0,0 +1,260 @@
+"""
+เซิร์ฟเวอร์วิเคราะห์อารมณ์ที่ถือโมเดล zero-shot ไว้ชุดเดียวต่อเครื่อง
+
+gunicorn worker / job worker ทุกตัวที่ตั้ง INFERENCE_SERVER_URL จะส่งข้อความมาที่นี่แทนการโหลดโมเดลเอง
+(หน่วยความจำ = โมเดลเดียวต่อเครื่อง) คำขอจากหลาย worker ที่มาใกล้กันถูกรวมเป็น micro-batch
+เดียว: รอได้ไม่เกิน INFERENCE_MAX_WAIT_MS หรือจนครบ INFERENCE_MAX_BATCH ข้อความ แล้วจึง forward
+
+เซิร์ฟเวอร์คืนเฉพาะอันดับ label + คะแนนจากโมเดล ส่วน threshold / lexicon fallback / แคช
+ยังทำที่ฝั่ง client (emotion_model.detect_emotions) เหมือนเดิม ผลจึงเหมือนรันโมเดลในโปรเซสเอง
+
+Usage:
+    python inference_server.py --port 8765
+    INFERENCE_SERVER_URL=http://127.0.0.1:8765 INGEST_WORKERS=0 gunicorn -w 4 -k gthread --threads 8 app:app
+
+API:
+    POST /rank    {"texts": [...], "multi_label": false} → {"ranked": [[labels, scores], ...], "backend": "torch"}
+    GET  /health  สถานะ, backend ของโมเดล และตัวนับ batch
+
+client แยกแคชอารมณ์ตาม backend ที่เซิร์ฟเวอร์รายงาน (ไม่ใช่ EMOTION_BACKEND ของตัวเอง)
+"""
+import json
+import os
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# จำนวนข้อความสูงสุดต่อ micro-batch และเวลารอรวมคำขอ (มิลลิวินาที)
+MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "64"))
+MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "10"))
+# timeout ฝั่ง client (วินาที) เกินแล้ว detect_emotions ใช้ lexicon แทน
+CLIENT_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "30"))
+
+
+# ----------------------
+# Client
+# ----------------------
+def rank_remote(url, texts, multi_label, with_backend=False):
+    """
+    ส่งข้อความไปให้เซิร์ฟเวอร์ คืน [(labels, scores), ...] แบบเดียวกับ emotion_model._zs_batch
+    with_backend=True: คืน (ranked, backend ที่เซิร์ฟเวอร์ใช้ให้คะแนน)
+    """
+    body = json.dumps({"texts": list(texts), "multi_label": bool(multi_label)}, ensure_ascii=False).encode("utf-8")
+    req = urllib.request.Request(
+        url.rstrip("/") + "/rank", data=body, headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(req, timeout=CLIENT_TIMEOUT) as resp:
+        data = json.load(resp)
+    ranked = data["ranked"]
+    if len(ranked) != len(texts):
+        raise RuntimeError("inference server returned a wrong number of results")
+    ranked = [(labels, scores) for labels, scores in ranked]
+    return (ranked, data.get("backend")) if with_backend else ranked
+
+
+def server_backend(url):
+    """backend ของโมเดลบนเซิร์ฟเวอร์ (จาก /health)"""
+    with urllib.request.urlopen(url.rstrip("/") + "/health", timeout=CLIENT_TIMEOUT) as resp:
+        return json.load(resp).get("backend")
+
+
+# ----------------------
+# Micro-batching
+# ----------------------
+class _Request:
+    __slots__ = ("texts", "multi_label", "result", "error", "done")
+
+    def __init__(self, texts, multi_label):
+        self.texts = texts
+        self.multi_label = multi_label
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """
+    รวมคำขอจากหลาย thread เป็น batch เดียว แล้วรันโมเดลใน thread เดียว
+    rank_fn(texts, multi_label) → [(labels, scores), ...]
+    """
+
+    def __init__(self, rank_fn, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.rank_fn = rank_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending = []
+        self._cond = threading.Condition()
+        self.batches = self.texts = self.requests = 0
+        self._thread = threading.Thread(target=self._run, name="inference-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts, multi_label=False, timeout=CLIENT_TIMEOUT):
+        """บล็อกจนได้ผลหรือครบ timeout วินาที (เรียกจาก handler ของแต่ละ connection)"""
+        if not texts:
+            return []
+        req = _Request(list(texts), bool(multi_label))
+        with self._cond:
+            self._pending.append(req)
+            self._cond.notify()
+        if not req.done.wait(timeout):
+            with self._cond:
+                if req in self._pending:
+                    self._pending.remove(req)
+            raise TimeoutError(f"no result from the batcher within {timeout:g}s")
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def _take(self):
+        """รอคำขอแรก แล้วรอต่อจนครบ max_batch ข้อความหรือหมดเวลา max_wait"""
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = time.monotonic() + self.max_wait
+            while sum(len(r.texts) for r in self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            # ตัดที่ max_batch แต่รับอย่างน้อยหนึ่งคำขอเสมอ (คำขอใหญ่ไม่ถูกแบ่ง)
+            taken, size = [], 0
+            while self._pending and (not taken or size + len(self._pending[0].texts) <= self.max_batch):
+                req = self._pending.pop(0)
+                taken.append(req)
+                size += len(req.texts)
+            return taken
+
+    def _run(self):
+        while True:
+            taken = self._take()
+            for multi_label in (False, True):
+                group = [r for r in taken if r.multi_label == multi_label]
+                if group:
+                    self._process(group, multi_label)
+
+    def _process(self, group, multi_label):
+        # ข้อผิดพลาดใดๆ ของ batch ส่งกลับไปที่ทุกคำขอใน group (thread นี้ต้องไม่ตาย ไม่งั้น submit ค้างทุกตัว)
+        try:
+            # ข้อความซ้ำข้ามคำขอ (เช่น ท่อนฮุก) รันครั้งเดียว
+            unique = list(dict.fromkeys(t for r in group for t in r.texts))
+            ranked = self.rank_fn(unique, multi_label)
+            if len(ranked) != len(unique):
+                raise RuntimeError(f"rank_fn returned {len(ranked)} results for {len(unique)} texts")
+            ranked = dict(zip(unique, ranked))
+            results = [[ranked[t] for t in r.texts] for r in group]
+        except Exception as e:
+            for r in group:
+                r.error = e
+                r.done.set()
+            return
+        self.batches += 1
+        self.texts += len(unique)
+        self.requests += len(group)
+        for r, result in zip(group, results):
+            r.result = result
+            r.done.set()
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "requests": self.requests,
+            "avg_batch": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            "pending": len(self._pending),
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
+
+
+def local_batcher(max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+    """MicroBatcher ที่รันโมเดลในโปรเซสนี้"""
+    import emotion_model
+
+    def rank(texts, multi_label):
+        return emotion_model._zs_batch(texts, multi_label, emotion_model.ZS_BATCH_SIZE)
+    return MicroBatcher(rank, max_batch=max_batch, max_wait_ms=max_wait_ms)
+
+
+# ----------------------
+# HTTP server
+# ----------------------
+def make_server(host="127.0.0.1", port=8765, batcher=None, backend=None):
+    """backend: ชื่อ backend ที่รายงานให้ client (ค่าเริ่มต้น EMOTION_BACKEND ของโปรเซสนี้)"""
+    batcher = batcher or local_batcher()
+    if backend is None:
+        import emotion_model
+        backend = emotion_model.EMOTION_BACKEND
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply(200, {"status": "ok", "backend": backend, **batcher.stats()})
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/rank":
+                self._reply(404, {"error": "not found"})
+                return
+            try:
+                data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                texts = data["texts"]
+                if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                    raise ValueError("texts must be a list of strings")
+            except (ValueError, KeyError, TypeError) as e:
+                self._reply(400, {"error": str(e)})
+                return
+            try:
+                ranked = batcher.submit(texts, data.get("multi_label", False))
+            except Exception as e:
+                self._reply(500, {"error": str(e)})
+                return
+            self._reply(200, {"ranked": ranked, "backend": backend})
+
+        def log_message(self, format, *args):
+            pass  # ไม่ log ทุกคำขอ
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.batcher = batcher
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Shared zero-shot emotion inference server")
+    parser.add_argument("--host", default=os.getenv("INFERENCE_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("INFERENCE_PORT", "8765")))
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="ข้อความสูงสุดต่อ micro-batch")
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS, help="เวลารอรวมคำขอ (ms)")
+    args = parser.parse_args()
+
+    import emotion_model
+
+    # โหลดโมเดลของเซิร์ฟเวอร์เองเสมอ (ไม่ส่งต่อไปหา INFERENCE_SERVER_URL)
+    emotion_model.INFERENCE_SERVER_URL = None
+    started = time.time()
+    emotion_model.warmup()
+    print(f"✅ {emotion_model.ZS_MODEL} loaded in {time.time() - started:.1f}s")
+
+    server = make_server(args.host, args.port, local_batcher(args.max_batch, args.max_wait_ms))
+    print(f"🚀 Inference server on http://{args.host}:{args.port} "
+          f"(max batch {args.max_batch}, max wait {args.max_wait_ms:g} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,42 @@
+import os
+
+from nlp_utils import preprocess_lyrics
+from emotion_model import detect_emotions
+
+# ขั้นตอนวิเคราะห์เนื้อเพลงที่ใช้ร่วมกันระหว่าง job worker และ bulk import
+
+# จำนวน segment ต่อการเรียก detect_emotions เมื่อต้องรายงานความคืบหน้าทีละ segment
+PROGRESS_CHUNK = int(os.getenv("PROGRESS_CHUNK", "32"))
+
+
+def analyze_many(lyrics_list, on_split=None, on_segment=None):
+    """
+    ตัด segment ของหลายเพลง แล้ววิเคราะห์อารมณ์รวมกันในการเรียก detect_emotions ครั้งเดียว
+    (segment ของทุกเพลงแชร์ forward pass ของโมเดลกัน)
+    on_split(song_index, n_segments): เรียกหลังตัด segment ของแต่ละเพลง
+    on_segment(song_index, k, n_segments, label): เรียกเมื่อแต่ละ segment ได้ label แล้ว
+        (วิเคราะห์ทีละ PROGRESS_CHUNK segment แทนการเรียกครั้งเดียว)
+    Returns: [(segments, emotions), ...] ตามลำดับของ lyrics_list
+    """
+    split = [preprocess_lyrics(lyrics or "") for lyrics in lyrics_list]
+    if on_split:
+        for song, segs in enumerate(split):
+            on_split(song, len(segs))
+
+    flat = [seg for segs in split for seg in segs]
+    if on_segment is None:
+        labels = detect_emotions(flat)
+    else:
+        owner = [(song, k, len(segs)) for song, segs in enumerate(split) for k in range(len(segs))]
+        labels = []
+        for start in range(0, len(flat), PROGRESS_CHUNK):
+            chunk = detect_emotions(flat[start:start + PROGRESS_CHUNK])
+            for (song, k, n), label in zip(owner[start:start + len(chunk)], chunk):
+                on_segment(song, k, n, label)
+            labels.extend(chunk)
+
+    out, pos = [], 0
+    for segs in split:
+        out.append((segs, labels[pos:pos + len(segs)]))
+        pos += len(segs)
+    return out
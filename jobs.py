@@ -0,0 +1,279 @@
+"""
+คิวงานวิเคราะห์เพลงแบบ background (ingest / refresh / rebuild)
+
+งานถูกเก็บในตาราง jobs ของ songs.db จึงไม่หายเมื่อโปรเซสล่ม
+worker ดึงงานทีละหลายชิ้น แล้ววิเคราะห์ segment ของทุกเพลงในชุดเดียวกัน (แชร์ forward pass)
+ผลของแต่ละเพลงเขียนลงฐานข้อมูลพร้อมสถานะ job ใน transaction เดียว → ไม่มีเพลงที่เขียนค้างครึ่งทาง
+ทุกขั้นของงานส่ง event ความคืบหน้าผ่าน progress.publish (ดูสดได้ที่ /jobs/<id>/events)
+
+Usage:
+    python jobs.py --workers 2      # รัน worker แยกจากเว็บ (ตั้ง INGEST_WORKERS=0 ให้เว็บ)
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+
+from db import execute, transaction
+import progress
+import repository
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+# จำนวน job สูงสุดที่ worker หยิบไปประมวลผลรวมกันหนึ่งรอบ
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "8"))
+# job ที่ running นานเกินนี้ถือว่า worker ตายแล้ว → คืนกลับเข้าคิว
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "900"))
+POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+MAX_ATTEMPTS = 3
+LEASE_EXPIRED_ERROR = f"worker หยุดทำงานระหว่างประมวลผลงานนี้ครบ {MAX_ATTEMPTS} ครั้ง"
+
+KINDS = ("ingest", "refresh", "rebuild")
+
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+class JobError(Exception):
+    """ข้อผิดพลาดของงานที่ไม่ควร retry (เช่น ไม่พบวิดีโอ, เพลงซ้ำ)"""
+
+
+# ----------------------
+# Queue API
+# ----------------------
+def enqueue(kind, payload, song_id=None):
+    """เพิ่มงานเข้าคิว คืน job id"""
+    if kind not in KINDS:
+        raise ValueError(f"unknown job kind: {kind}")
+    with transaction() as cur:
+        cur.execute(
+            "INSERT INTO jobs (kind, payload, song_id, status, created_at) VALUES (?,?,?,'queued',?)",
+            (kind, json.dumps(payload, ensure_ascii=False), song_id, time.time()),
+        )
+        job_id = cur.lastrowid
+    progress.publish(job_id, "queued", kind=kind)
+    _wakeup.set()
+    return job_id
+
+
+def get_job(job_id):
+    rows = execute(
+        "SELECT id, kind, status, song_id, error, attempts, created_at, started_at, finished_at "
+        "FROM jobs WHERE id=?", (job_id,), fetch=True,
+    )
+    if not rows:
+        return None
+    keys = ("id", "kind", "status", "song_id", "error", "attempts", "created_at", "started_at", "finished_at")
+    return dict(zip(keys, rows[0]))
+
+
+def claim(limit=JOB_BATCH_SIZE):
+    """หยิบงานที่รออยู่ (และงานที่ lease หมดอายุ) มาทำ คืน [(id, kind, payload, song_id), ...]"""
+    now = time.time()
+    with transaction() as cur:
+        # lease หมดอายุแล้วครบ MAX_ATTEMPTS (เช่น งานที่ทำ worker ตายทุกครั้ง) → failed ไม่หยิบซ้ำอีก
+        dead = [r[0] for r in cur.execute(
+            "SELECT id FROM jobs WHERE status='running' AND started_at < ? AND attempts >= ?",
+            (now - JOB_LEASE_SECONDS, MAX_ATTEMPTS),
+        ).fetchall()]
+        cur.executemany(
+            "UPDATE jobs SET status='failed', error=?, finished_at=? WHERE id=?",
+            [(LEASE_EXPIRED_ERROR, now, job_id) for job_id in dead],
+        )
+        rows = cur.execute("""
+            SELECT id, kind, payload, song_id FROM jobs
+            WHERE status='queued' OR (status='running' AND started_at < ?)
+            ORDER BY id LIMIT ?
+        """, (now - JOB_LEASE_SECONDS, limit)).fetchall()
+        cur.executemany(
+            "UPDATE jobs SET status='running', started_at=?, attempts=attempts+1 WHERE id=?",
+            [(now, r[0]) for r in rows],
+        )
+    for job_id in dead:
+        progress.publish(job_id, "failed", error=LEASE_EXPIRED_ERROR)
+    return [(job_id, kind, json.loads(payload), song_id) for job_id, kind, payload, song_id in rows]
+
+
+def _finish(cur, job_id, song_id=None):
+    cur.execute(
+        "UPDATE jobs SET status='done', song_id=COALESCE(?, song_id), error=NULL, finished_at=? WHERE id=?",
+        (song_id, time.time(), job_id),
+    )
+
+
+def _fail(job_id, error, retry=False):
+    status = "queued" if retry else "failed"
+    with transaction() as cur:
+        cur.execute(
+            "UPDATE jobs SET status=?, error=?, finished_at=? WHERE id=?",
+            (status, error, None if retry else time.time(), job_id),
+        )
+    progress.publish(job_id, "retrying" if retry else "failed", error=error)
+
+
+# ----------------------
+# Processing
+# ----------------------
+def _prepare(job_id, kind, payload, song_id, prefetched=None):
+    """เตรียมข้อมูลก่อนวิเคราะห์ คืน dict ที่มี lyrics/title (prefetched: metadata ที่ดึงรวมไว้แล้ว)"""
+    if kind == "ingest":
+        from youtube_utils import fetch_youtube_metadata
+
+        video_id = payload["video_id"]
+        if repository.db_query("SELECT id FROM songs WHERE video_id=?", (video_id,), fetch=True):
+            raise JobError("เพลงนี้ถูกเพิ่มแล้ว ไม่สามารถเพิ่มซ้ำได้")
+        if prefetched is not None and video_id in prefetched:
+            meta = prefetched[video_id]
+        else:
+            meta = fetch_youtube_metadata(video_id)
+        if not meta:
+            raise JobError("ไม่พบข้อมูลวิดีโอจาก YouTube")
+        progress.publish(job_id, "metadata", title=meta.get("title"))
+        return {"meta": meta, "title": meta.get("title"), "lyrics": payload.get("lyrics", "")}
+
+    song = repository.db_query("SELECT id, title, lyrics FROM songs WHERE id=?", (song_id,), fetch=True)
+    if not song:
+        raise JobError("ไม่พบเพลงนี้")
+    _, title, lyrics = song[0]
+    progress.publish(job_id, "metadata", title=title)
+    return {"title": title, "lyrics": lyrics or ""}
+
+
+def _write(job_id, kind, payload, song_id, prepared, segments, emotions):
+    from analysis import plot_interactive_trajectory
+
+    if kind == "rebuild":
+        graph_html = plot_interactive_trajectory(emotions, prepared["title"]) if emotions else None
+    else:
+        graph_html = plot_interactive_trajectory(emotions, prepared["title"])
+    progress.publish(job_id, "graph", built=graph_html is not None)
+
+    try:
+        with transaction() as cur:
+            if kind == "ingest":
+                song_id = repository.insert_song(
+                    cur, prepared["meta"], payload["youtube_link"], payload["video_id"],
+                    prepared["lyrics"], segments, emotions, graph_html,
+                )
+            else:
+                repository.replace_song_analysis(cur, song_id, segments, emotions, graph_html)
+            _finish(cur, job_id, song_id)
+    except sqlite3.IntegrityError as e:
+        # งาน ingest วิดีโอเดียวกันสองงานผ่านการเช็คใน _prepare พร้อมกัน → งานหลังชน unique index ของ video_id
+        if kind == "ingest" and "video_id" in str(e):
+            raise JobError("เพลงนี้ถูกเพิ่มแล้ว ไม่สามารถเพิ่มซ้ำได้") from e
+        raise
+    progress.publish(job_id, "committed", song_id=song_id)
+
+    from vectorstore import on_songs_changed
+    on_songs_changed([song_id])
+    return song_id
+
+
+def process(jobs):
+    """ประมวลผลงานชุดหนึ่ง: เตรียมข้อมูล → วิเคราะห์ทุกเพลงรวมกัน → เขียนทีละเพลง"""
+    from ingest import analyze_many
+
+    # metadata ของทุกงาน ingest ในชุดนี้ดึงด้วย API call เดียว (ล้มเหลว → ดึงทีละงานใน _prepare)
+    prefetched = None
+    video_ids = [payload["video_id"] for _, kind, payload, _ in jobs if kind == "ingest"]
+    if len(video_ids) > 1:
+        from youtube_utils import fetch_youtube_metadata_many
+        try:
+            prefetched = fetch_youtube_metadata_many(video_ids)
+        except Exception:
+            traceback.print_exc()
+
+    ready = []
+    for job_id, kind, payload, song_id in jobs:
+        progress.publish(job_id, "started", kind=kind)
+        try:
+            ready.append((job_id, kind, payload, song_id,
+                          _prepare(job_id, kind, payload, song_id, prefetched)))
+        except JobError as e:
+            _fail(job_id, str(e))
+        except Exception as e:
+            _fail_or_retry(job_id, e)
+    if not ready:
+        return
+
+    job_ids = [job_id for job_id, *_ in ready]
+    try:
+        analyzed = analyze_many(
+            [p["lyrics"] for *_, p in ready],
+            on_split=lambda song, n: progress.publish(job_ids[song], "segments", total=n),
+            on_segment=lambda song, k, n, label: progress.publish(
+                job_ids[song], "segment", index=k + 1, total=n, label=label),
+        )
+    except Exception as e:
+        for job_id, *_ in ready:
+            _fail_or_retry(job_id, e)
+        return
+
+    for (job_id, kind, payload, song_id, prepared), (segments, emotions) in zip(ready, analyzed):
+        try:
+            _write(job_id, kind, payload, song_id, prepared, segments, emotions)
+        except JobError as e:
+            _fail(job_id, str(e))
+        except Exception as e:
+            _fail_or_retry(job_id, e)
+
+
+def _fail_or_retry(job_id, exc):
+    attempts = execute("SELECT attempts FROM jobs WHERE id=?", (job_id,), fetch=True)
+    retry = bool(attempts) and attempts[0][0] < MAX_ATTEMPTS
+    traceback.print_exc()
+    _fail(job_id, f"{type(exc).__name__}: {exc}", retry=retry)
+
+
+def work_forever(stop=None):
+    """ลูปของ worker: หยิบงาน → ประมวลผล → รอเมื่อคิวว่าง"""
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        try:
+            jobs = claim()
+            if jobs:
+                process(jobs)
+                continue
+        except Exception:
+            # เช่น "database is locked" ระหว่างที่ bulk_import / stats_refresher ถือ write lock
+            # → thread ต้องไม่ตาย (ไม่งั้นคิวค้างทั้งที่เว็บยังรับงาน) รอแล้วลองใหม่ งานที่ claim แล้วคืนคิวเมื่อ lease หมด
+            traceback.print_exc()
+            stop.wait(POLL_INTERVAL)
+            continue
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+
+
+def start_workers(n=INGEST_WORKERS):
+    """เริ่ม worker thread ในโปรเซสนี้ (เรียกซ้ำได้ เริ่มครั้งเดียว)"""
+    with _workers_lock:
+        if _workers or n <= 0:
+            return _workers
+        for i in range(n):
+            t = threading.Thread(target=work_forever, name=f"ingest-worker-{i}", daemon=True)
+            t.start()
+            _workers.append(t)
+    return _workers
+
+
+if __name__ == "__main__":
+    import argparse
+    from migrations import migrate
+
+    parser = argparse.ArgumentParser(description="Background ingestion worker")
+    parser.add_argument("--workers", type=int, default=max(INGEST_WORKERS, 1))
+    args = parser.parse_args()
+
+    migrate()
+    threads = [threading.Thread(target=work_forever, daemon=True) for _ in range(args.workers)]
+    for t in threads:
+        t.start()
+    print(f"Ingest worker running with {args.workers} thread(s). Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,120 @@
+"""
+Aho–Corasick automaton สำหรับหาคำใน lexicon อารมณ์ทั้งหมดในข้อความด้วยการอ่านรอบเดียว
+
+สร้างครั้งเดียวจากรายการคำ (ลำดับของคำ = rank) แล้วใช้ซ้ำได้ทุก thread (อ่านอย่างเดียว)
+ไม่ต้องตัดคำก่อน จึงใช้ได้ทั้งกับข้อความไทยที่ไม่มีช่องว่างและข้อความผสม
+
+    m = LexiconMatcher(["เศร้า", "เหงา", "ไม่"])
+    m.find_all("ไม่เศร้าแต่เหงา")      # [(0, 3, 2), (3, 8, 0), (11, 15, 1)]  (start, end, index)
+    m.first_ranked("ไม่เศร้าแต่เหงา")  # 0 → คำที่มาก่อนในรายการ ไม่ว่าจะพบตำแหน่งไหน
+    m.leftmost_longest("...")          # match ที่ไม่ทับกัน เลือกซ้ายสุดแล้วยาวสุด
+"""
+from collections import deque
+
+
+class LexiconMatcher:
+    """multi-pattern matcher (Aho–Corasick) บนตัวอักษร"""
+
+    def __init__(self, patterns):
+        self.patterns = list(dict.fromkeys(p for p in patterns if p))
+        self.index = {p: i for i, p in enumerate(self.patterns)}
+        # state 0 = root; goto[s]: {char: state}, out[s]: pattern index ที่จบที่ state นี้ (รวมทาง fail)
+        goto, fail, out = [{}], [0], [()]
+        for i, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = goto[state][ch] = len(goto)
+                    goto.append({})
+                    fail.append(0)
+                    out.append(())
+                state = nxt
+            out[state] = out[state] + (i,)
+
+        # BFS สร้าง fail link (suffix ที่ยาวที่สุดที่เป็น prefix ของบางคำ) และรวม output ของ suffix นั้น
+        queue = deque(goto[0].values())  # ลูกของ root: fail = root
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+        self._goto, self._fail, self._out = goto, fail, out
+        self._lengths = [len(p) for p in self.patterns]
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def iter_matches(self, text):
+        """ทุก match (รวมที่ทับกัน) เรียงตามตำแหน่งท้าย: (start, end, pattern index)"""
+        goto, fail, out, lengths = self._goto, self._fail, self._out, self._lengths
+        state = 0
+        for pos, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for i in out[state]:
+                yield pos + 1 - lengths[i], pos + 1, i
+
+    def find_all(self, text):
+        return sorted(self.iter_matches(text))
+
+    def first_ranked(self, text):
+        """index ของคำที่อยู่ลำดับแรกสุดในรายการที่พบในข้อความ (None ถ้าไม่พบ)
+        ให้ผลเดียวกับ next(i for i, p in enumerate(patterns) if p in text)"""
+        best = None
+        for _, _, i in self.iter_matches(text):
+            if best is None or i < best:
+                best = i
+                if best == 0:
+                    break
+        return best
+
+    def leftmost_longest(self, text, boundaries=None):
+        """
+        match ที่ไม่ทับกัน: เริ่มซ้ายสุดก่อน ถ้าเริ่มที่เดียวกันเลือกคำที่ยาวที่สุด
+        boundaries: set ของตำแหน่งขอบคำ → รับเฉพาะ match ที่ทั้งต้นและท้ายตรงขอบคำ (ไม่นับคำที่ซ่อนอยู่กลางคำอื่น)
+        """
+        matches = self.iter_matches(text)
+        if boundaries is not None:
+            matches = [m for m in matches if m[0] in boundaries and m[1] in boundaries]
+        result, taken_until = [], 0
+        for start, end, i in sorted(matches, key=lambda m: (m[0], -m[1])):
+            if start >= taken_until:
+                result.append((start, end, i))
+                taken_until = end
+        return result
+
+
+def overlap_lookup(groups):
+    """
+    groups: {ชื่อกลุ่ม: [คำ, ...]} (ลำดับของ dict = ลำดับความสำคัญ)
+    คืนฟังก์ชัน token → ชื่อกลุ่มแรกที่มีคำ w ซึ่ง w อยู่ใน token หรือ token อยู่ใน w (ไม่สนตัวพิมพ์)
+    ผลเท่ากับ next(g for g, ws in groups.items() if any(w in t or t in w for w in ws)) แต่ไม่ต้องวนทุกคำ
+    """
+    names = list(groups)
+    rank_of_word, rank_of_part = {}, {}
+    for rank, name in enumerate(names):
+        for w in groups[name]:
+            rank_of_word.setdefault(w, rank)
+            # token ที่เป็นส่วนหนึ่งของคำ (token in w): เก็บทุก substring ของคำ (คำสั้น จำนวนไม่มาก)
+            for a in range(len(w)):
+                for b in range(a + 1, len(w) + 1):
+                    rank_of_part.setdefault(w[a:b], rank)
+    matcher = LexiconMatcher(rank_of_word)
+
+    def lookup(token):
+        token = token.lower()
+        if not token:
+            return names[0] if rank_of_word else None  # "" อยู่ในทุกคำ
+        best = rank_of_part.get(token)
+        for _, _, i in matcher.iter_matches(token):
+            rank = rank_of_word[matcher.patterns[i]]
+            if best is None or rank < best:
+                best = rank
+        return None if best is None else names[best]
+    return lookup
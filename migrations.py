@@ -0,0 +1,272 @@
+import re
+
+from db import transaction, execute
+
+# Schema migration ของ songs.db
+# เวอร์ชันปัจจุบันเก็บใน PRAGMA user_version, แต่ละ migration รันใน transaction ของตัวเอง
+# เพิ่ม migration ใหม่ได้โดยต่อท้าย MIGRATIONS (ห้ามแก้/สลับลำดับของที่มีอยู่แล้ว)
+
+_VIDEO_ID_RE = re.compile(r"(?:v=|youtu\.be/)([a-zA-Z0-9_-]{11})")
+
+
+def _columns(cur, table):
+    return {row[1] for row in cur.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def _m001_base_schema(cur):
+    """ตาราง songs / segments (เทียบเท่า db_setup.py เดิม)"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS songs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT,
+            youtube_link TEXT,
+            description TEXT,
+            tags TEXT,
+            upload_date TEXT,
+            view_count INTEGER,
+            like_count INTEGER,
+            lyrics TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS segments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            song_id INTEGER,
+            segment_order INTEGER,
+            text TEXT,
+            emotion TEXT,
+            FOREIGN KEY(song_id) REFERENCES songs(id)
+        )
+    """)
+    cols = _columns(cur, "songs")
+    if "image_path" not in cols:
+        cur.execute("ALTER TABLE songs ADD COLUMN image_path TEXT")
+    if "graph_html" not in cols:
+        cur.execute("ALTER TABLE songs ADD COLUMN graph_html TEXT")
+
+
+def _m002_emotion_cache(cur):
+    """ตารางแคชผลวิเคราะห์อารมณ์ราย segment (emotion_cache.py)"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS emotion_cache (
+            key TEXT PRIMARY KEY,
+            signature TEXT,
+            label TEXT,
+            created_at REAL
+        )
+    """)
+
+
+def _m003_indexes(cur):
+    """
+    index สำหรับ query หลัก:
+    - segments ตาม song_id (covering: segment_order, emotion) ใช้ทุกหน้า
+    - segments.emotion สำหรับ GROUP BY emotion (dashboard/explore/evaluation)
+    - unique video id สำหรับเช็คเพลงซ้ำตอน ingest
+    """
+    if "video_id" not in _columns(cur, "songs"):
+        cur.execute("ALTER TABLE songs ADD COLUMN video_id TEXT")
+
+    # backfill video_id จาก youtube_link (ลิงก์ซ้ำ: เก็บไว้เฉพาะเพลงแรก)
+    seen = set()
+    updates = []
+    for song_id, link in cur.execute("SELECT id, youtube_link FROM songs ORDER BY id").fetchall():
+        m = _VIDEO_ID_RE.search(link or "")
+        vid = m.group(1) if m else None
+        if vid in seen:
+            vid = None
+        elif vid:
+            seen.add(vid)
+        updates.append((vid, song_id))
+    cur.executemany("UPDATE songs SET video_id=? WHERE id=?", updates)
+
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_segments_song_order ON segments(song_id, segment_order, emotion)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_segments_emotion ON segments(emotion)")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_songs_video_id ON songs(video_id)")
+
+
+def _m004_shrink_graph_html(cur):
+    """
+    graph_html แถวเก่าฝัง plotly.js ทั้งก้อนไว้ในทุกเพลง
+    สร้างกราฟใหม่จาก segments ให้เหลือแค่ div + ข้อมูลกราฟ (plotly.js โหลดจาก layout)
+    """
+    rows = cur.execute(
+        "SELECT id, title FROM songs WHERE graph_html LIKE '%plotly.js v%'"
+    ).fetchall()
+    if not rows:
+        return
+
+    from analysis import plot_interactive_trajectory
+    for song_id, title in rows:
+        emotions = [r[0] for r in cur.execute(
+            "SELECT emotion FROM segments WHERE song_id=? ORDER BY segment_order", (song_id,)
+        ).fetchall()]
+        graph_html = plot_interactive_trajectory(emotions, title) if emotions else None
+        cur.execute("UPDATE songs SET graph_html=? WHERE id=?", (graph_html, song_id))
+
+
+def _m005_jobs(cur):
+    """คิวงานวิเคราะห์เพลงแบบ background (jobs.py)"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,              -- ingest / refresh / rebuild
+            payload TEXT NOT NULL,           -- JSON
+            status TEXT NOT NULL DEFAULT 'queued',  -- queued / running / done / failed
+            song_id INTEGER,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL,
+            started_at REAL,
+            finished_at REAL
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id)")
+
+
+def _m006_song_emotion_summary(cur):
+    """
+    สรุปอารมณ์ต่อเพลงที่คำนวณไว้ตอนเขียน (repository.py ดูแลใน transaction เดียวกับ segments)
+    seq เก็บรหัสอารมณ์ (int32) ตาม emotion_codes, รหัส 0 = segment ที่ไม่มีอารมณ์
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS emotion_codes (
+            code INTEGER PRIMARY KEY,
+            label TEXT UNIQUE NOT NULL
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS song_emotion_summary (
+            song_id INTEGER PRIMARY KEY REFERENCES songs(id),
+            seq BLOB,               -- รหัสอารมณ์ราย segment ตาม segment_order
+            seg_count INTEGER,
+            overall TEXT,           -- calculate_overall_emotion
+            path TEXT,              -- ลำดับอารมณ์ canonical แบบบีบอัด ('เศร้า → สุข'), NULL = ไม่มีอารมณ์
+            trans_cnt INTEGER,
+            stable INTEGER,         -- 1 = มีอารมณ์เดียวทั้งเพลง
+            histogram TEXT          -- JSON {emotion: count} ตามลำดับที่พบครั้งแรก
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_summary_trans ON song_emotion_summary(trans_cnt DESC, song_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_summary_stable ON song_emotion_summary(stable, song_id)")
+
+    from repository import write_emotion_summaries
+    # อ่านผ่าน cur ของ migration (migrate(path) อาจไม่ใช่ฐานข้อมูลค่าเริ่มต้น)
+    sequences = {}
+    for song_id, emotion in cur.execute("SELECT song_id, emotion FROM segments ORDER BY song_id, segment_order"):
+        sequences.setdefault(song_id, []).append(emotion)
+    song_ids = [r[0] for r in cur.execute("SELECT id FROM songs ORDER BY id").fetchall()]
+    write_emotion_summaries(cur, [(sid, sequences.get(sid, [])) for sid in song_ids])
+
+
+def _m007_stats_counters(cur):
+    """ตัวนับสถิติของแดชบอร์ด (stats.py) เริ่มจากค่าจริงในตาราง"""
+    cur.execute("CREATE TABLE IF NOT EXISTS stats_counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    cur.execute("CREATE TABLE IF NOT EXISTS emotion_stats (emotion TEXT, cnt INTEGER NOT NULL)")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_emotion_stats ON emotion_stats(emotion)")
+
+    import stats
+    stats.rebuild(cur)
+
+
+def _m008_data_version(cur):
+    """ตัวนับเวอร์ชันข้อมูล (เพิ่มทุกครั้งที่เขียนเพลง) ใช้เป็น key ของแคช response / ETag"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    cur.execute("INSERT OR IGNORE INTO data_version (id, version, updated_at) VALUES (1, 0, strftime('%s','now'))")
+
+
+def _m009_youtube_cache(cur):
+    """แคช response ของ YouTube Data API ราย video id และยอดใช้ quota ต่อวัน (youtube_client.py)"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS youtube_cache (
+            video_id TEXT NOT NULL,
+            part TEXT NOT NULL,
+            item TEXT,
+            fetched_at REAL NOT NULL,
+            PRIMARY KEY (video_id, part)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS youtube_quota (
+            day TEXT NOT NULL,
+            method TEXT NOT NULL,
+            calls INTEGER NOT NULL,
+            units INTEGER NOT NULL,
+            PRIMARY KEY (day, method)
+        )
+    """)
+
+
+def _m010_stats_refresh(cur):
+    """เวลาที่อัปเดตยอดวิว/ไลก์ล่าสุดของแต่ละเพลง และประวัติการรัน stats_refresher.py"""
+    if "stats_updated_at" not in _columns(cur, "songs"):
+        cur.execute("ALTER TABLE songs ADD COLUMN stats_updated_at REAL")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS refresh_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            day TEXT NOT NULL,
+            status TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            finished_at REAL,
+            songs INTEGER NOT NULL DEFAULT 0,
+            updated INTEGER NOT NULL DEFAULT 0,
+            missing INTEGER NOT NULL DEFAULT 0,
+            calls INTEGER NOT NULL DEFAULT 0,
+            units INTEGER NOT NULL DEFAULT 0,
+            error TEXT
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_refresh_runs_day ON refresh_runs(day)")
+
+
+MIGRATIONS = [
+    (1, "base schema", _m001_base_schema),
+    (2, "emotion cache table", _m002_emotion_cache),
+    (3, "segment/emotion/video id indexes", _m003_indexes),
+    (4, "shrink graph_html", _m004_shrink_graph_html),
+    (5, "jobs queue", _m005_jobs),
+    (6, "song emotion summary", _m006_song_emotion_summary),
+    (7, "stats counters", _m007_stats_counters),
+    (8, "data version", _m008_data_version),
+    (9, "youtube cache and quota", _m009_youtube_cache),
+    (10, "stats refresh", _m010_stats_refresh),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(path=None) -> int:
+    return execute("PRAGMA user_version", fetch=True, path=path)[0][0]
+
+
+def migrate(path=None, verbose=False) -> list:
+    """
+    รัน migration ที่ยังไม่ได้รันตามลำดับ คืนรายชื่อ migration ที่รันไป
+    ปลอดภัยเมื่อหลายโปรเซสเรียกพร้อมกัน: เช็คเวอร์ชันซ้ำหลังได้ write lock แล้ว
+    """
+    if current_version(path) >= SCHEMA_VERSION:
+        return []
+
+    applied = []
+    for version, name, fn in MIGRATIONS:
+        with transaction(path) as cur:
+            if cur.execute("PRAGMA user_version").fetchone()[0] >= version:
+                continue
+            fn(cur)
+            cur.execute(f"PRAGMA user_version={version}")
+        applied.append(name)
+        if verbose:
+            print(f"Applied migration {version}: {name}")
+
+    if applied:
+        # migration อาจแก้ข้อมูล (เช่น graph_html) → ให้แคช response ของทุกโปรเซสหมดอายุ
+        from repository import bump_data_version
+        with transaction(path) as cur:
+            bump_data_version(cur)
+    return applied
@@ -1,10 +1,18 @@
 import re
-from pythainlp.tokenize import word_tokenize as thai_tokenize
-import nltk
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
+
+_nltk = None
+
+def _get_nltk():
+    """import nltk (และดาวน์โหลด punkt ถ้ายังไม่มี) ครั้งแรกที่ต้องแบ่งคำภาษาอังกฤษ"""
+    global _nltk
+    if _nltk is None:
+        import nltk
+        try:
+            nltk.data.find('tokenizers/punkt')
+        except LookupError:
+            nltk.download('punkt')
+        _nltk = nltk
+    return _nltk
 
 _SECTION_PATTERNS = [
     r'^\s*(intro|อินโทร)\s*:?\s*$', 
@@ -22,6 +30,8 @@ def auto_tokenize(text: str) -> str:
     if not text:
         return ""
     
+    from pythainlp.tokenize import word_tokenize as thai_tokenize
+
     # แยกบรรทัด
     lines = text.split('\n')
     tokenized_lines = []
@@ -40,7 +50,7 @@ def auto_tokenize(text: str) -> str:
                 continue
             # ถ้าเป็นภาษาอังกฤษ
             if re.match(r'^[A-Za-z\s]+$', part):
-                tokens = nltk.word_tokenize(part)
+                tokens = _get_nltk().word_tokenize(part)
                 tokenized_parts.append(' '.join(tokens))
             # ถ้าเป็นภาษาไทย
             else:
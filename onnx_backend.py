@@ -0,0 +1,188 @@
+"""
+backend ONNX Runtime ของโมเดล zero-shot (EMOTION_BACKEND=onnx / onnx-int8)
+
+export โมเดล NLI (ค่าเริ่มต้น facebook/bart-large-mnli) เป็น ONNX แล้ว quantize น้ำหนักเป็น int8 แบบ dynamic
+ผลลัพธ์ทั้งสองไฟล์อยู่ใน ONNX_MODEL_DIR พร้อม tokenizer/config:
+    model.onnx        float32
+    model.int8.onnx   dynamic int8 (เร็วกว่าบน CPU ที่ไม่มี GPU)
+
+ต้องติดตั้ง onnxruntime (และ onnx สำหรับ export): pip install onnx onnxruntime
+
+Usage:
+    python onnx_backend.py export                 # export + quantize ไปที่ ONNX_MODEL_DIR
+    python onnx_backend.py check                  # เทียบความแม่นยำกับ ground truth ใน evaluation_unified.py
+    python onnx_backend.py check --backends torch,onnx-int8 --max-drop 0.05
+"""
+import inspect
+import os
+import time
+
+import numpy as np
+
+MODEL_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+# จำนวน thread ต่อ session (0 = ให้ onnxruntime เลือกเอง)
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+
+class OnnxClassifier:
+    """โมเดล NLI บน onnxruntime (interface เดียวกับ emotion_model._TorchClassifier)"""
+
+    def __init__(self, model_dir, quantized=False):
+        import onnxruntime as ort
+        from transformers import AutoConfig, AutoTokenizer
+
+        path = os.path.join(model_dir, INT8_FILE if quantized else MODEL_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found — run `python onnx_backend.py export` first")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        config = AutoConfig.from_pretrained(model_dir)
+        self.num_labels = config.num_labels
+        # หา label entailment แบบเดียวกับ ZeroShotClassificationPipeline
+        self.entailment_id = next(
+            (i for label, i in config.label2id.items() if label.lower().startswith("entail")), -1
+        )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_THREADS:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def logits(self, features):
+        batch = self.tokenizer.pad(features, return_tensors="np")
+        feed = {name: np.asarray(batch[name], dtype=np.int64) for name in self.input_names}
+        return self.session.run(["logits"], feed)[0].astype(np.float32)
+
+
+# ----------------------
+# Export
+# ----------------------
+def export(model_name, out_dir, quantize=True, opset=17):
+    """export โมเดลเป็น ONNX (แกน batch/ความยาวเป็น dynamic) แล้ว quantize เป็น int8 ถ้าขอ"""
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+
+    class Logits(torch.nn.Module):
+        # คืนเฉพาะ logits (output อื่นของโมเดลไม่ได้ใช้)
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+
+    sample = tokenizer(["ตัวอย่างข้อความ", "sample text"], ["This example is sad."] * 2,
+                       padding=True, return_tensors="pt")
+    path = os.path.join(out_dir, MODEL_FILE)
+    # torch >= 2.5 มี exporter แบบ dynamo (ใช้ TorchScript exporter เดิมเสมอ) ส่วน torch ที่ pin ไว้ไม่มี keyword นี้
+    extra = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    torch.onnx.export(
+        Logits(model), (sample["input_ids"], sample["attention_mask"]), path,
+        input_names=["input_ids", "attention_mask"], output_names=["logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "logits": {0: "batch"},
+        },
+        opset_version=opset,
+        **extra,
+    )
+    tokenizer.save_pretrained(out_dir)
+    model.config.save_pretrained(out_dir)
+    paths = [path]
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = os.path.join(out_dir, INT8_FILE)
+        quantize_dynamic(path, int8_path, weight_type=QuantType.QInt8)
+        paths.append(int8_path)
+    return paths
+
+
+# ----------------------
+# Accuracy check
+# ----------------------
+def predict(classifier, texts, threshold=0.55, batch_size=None):
+    """label ของแต่ละข้อความ (กติกาเดียวกับ detect_emotion ไม่ใช้แคช) + เวลาที่ใช้ (วินาที)"""
+    import emotion_model
+
+    started = time.perf_counter()
+    ranked = emotion_model._zs_batch(texts, False, batch_size or emotion_model.ZS_BATCH_SIZE, classifier)
+    elapsed = time.perf_counter() - started
+    labels = [emotion_model._decide(text, lbls, scores, threshold, False)
+              for text, (lbls, scores) in zip(texts, ranked)]
+    return labels, elapsed
+
+
+def check(backends=("torch", "onnx", "onnx-int8"), max_drop=0.02):
+    """
+    รันทุก backend บน ground truth แล้วเทียบกับ backend แรก (อ้างอิง)
+    คืน True ถ้าไม่มี backend ไหนแม่นยำลดลงเกิน max_drop ในชุดใดเลย
+    """
+    import emotion_model
+    from evaluation_unified import ground_truth_sets
+
+    sets = ground_truth_sets()
+    texts = list(dict.fromkeys(text for samples in sets.values() for text, _ in samples))
+    predictions, timings = {}, {}
+    for backend in backends:
+        classifier = emotion_model.load_classifier(backend)
+        emotion_model._zs_batch(texts[:1], False, 1, classifier)  # warmup
+        labels, elapsed = predict(classifier, texts)
+        predictions[backend] = dict(zip(texts, labels))
+        timings[backend] = elapsed / len(texts)
+        del classifier
+
+    reference = backends[0]
+    ok = True
+    print(f"{'Backend':<12} | {'Set':<13} | {'Accuracy':>8} | {'Δ vs ' + reference:>14} | {'Agreement':>9}")
+    print("-" * 70)
+    for backend in backends:
+        for name, samples in sets.items():
+            acc = np.mean([predictions[backend][t] == y for t, y in samples])
+            ref = np.mean([predictions[reference][t] == y for t, y in samples])
+            agree = np.mean([predictions[backend][t] == predictions[reference][t] for t, _ in samples])
+            flag = ""
+            if acc < ref - max_drop:
+                ok, flag = False, "  ⚠️"
+            print(f"{backend:<12} | {name:<13} | {acc:>8.1%} | {acc - ref:>+14.1%} | {agree:>9.1%}{flag}")
+    print()
+    for backend in backends:
+        speedup = timings[reference] / timings[backend] if timings[backend] else float("inf")
+        print(f"{backend:<12} {timings[backend] * 1000:8.1f} ms/segment  ({speedup:.2f}x vs {reference})")
+    return ok
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    import emotion_model
+
+    parser = argparse.ArgumentParser(description="ONNX Runtime backend for the zero-shot emotion model")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_export = sub.add_parser("export", help="export โมเดลเป็น ONNX (+ int8)")
+    p_export.add_argument("--model", default=emotion_model.ZS_MODEL)
+    p_export.add_argument("--out", default=emotion_model.ONNX_MODEL_DIR)
+    p_export.add_argument("--no-int8", action="store_true", help="ไม่สร้างไฟล์ int8")
+    p_export.add_argument("--opset", type=int, default=17)
+    p_check = sub.add_parser("check", help="เทียบความแม่นยำกับ ground truth ของ evaluation_unified.py")
+    p_check.add_argument("--backends", default="torch,onnx,onnx-int8", help="backend แรกใช้เป็นค่าอ้างอิง")
+    p_check.add_argument("--max-drop", type=float, default=0.02, help="accuracy ที่ยอมให้ลดลงได้ต่อชุด")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        for path in export(args.model, args.out, quantize=not args.no_int8, opset=args.opset):
+            print(f"✅ {path} ({os.path.getsize(path) / 1e6:.0f} MB)")
+    else:
+        if not check(tuple(args.backends.split(",")), args.max_drop):
+            print("❌ accuracy regressed")
+            sys.exit(1)
+        print("✅ no accuracy regression")
@@ -0,0 +1,91 @@
+"""
+pub/sub ในโปรเซสสำหรับความคืบหน้าของงานวิเคราะห์ (ingest / refresh / rebuild)
+
+worker เรียก publish(job_id, stage, ...) ทุกขั้นของงาน:
+    queued → started → metadata → segments (N) → segment (k/N + label) ... → graph → committed
+    (หรือ retrying / failed)
+ผู้ติดตาม (เช่น /jobs/<id>/events แบบ server-sent events) เรียก wait(job_id, after) แล้วได้ event
+ที่ seq มากกว่า after ทั้งหมด จึงต่อจากจุดเดิมได้เมื่อ reconnect (Last-Event-ID)
+
+publish ไม่รอผู้ติดตามเลย: event เก็บใน history ของงาน (จำกัด PROGRESS_MAX_EVENTS ต่องาน)
+ผู้ติดตามแต่ละรายอ่านตาม seq ของตัวเอง client ที่อ่านช้าจึงแค่ตามหลัง ไม่ทำให้ worker ช้าลง
+(ถ้าตามหลังจน event เก่าถูกตัดทิ้ง จะข้ามไปยัง event ที่ยังเหลืออยู่)
+
+event ทุกตัวมี seq, stage, time และ elapsed (วินาทีนับจาก event แรกของงาน) → ดูได้ว่าเวลาหมดไปกับขั้นไหน
+ใช้ได้เฉพาะเมื่อ worker อยู่ในโปรเซสเดียวกับเว็บ (INGEST_WORKERS>0) ไม่งั้น endpoint ใช้สถานะจากตาราง jobs แทน
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# จำนวนงานที่เก็บ history ไว้ (งานเก่าสุดถูกลบก่อน) และจำนวน event สูงสุดต่องาน
+MAX_JOBS = int(os.getenv("PROGRESS_MAX_JOBS", "256"))
+MAX_EVENTS = int(os.getenv("PROGRESS_MAX_EVENTS", "2000"))
+
+FINAL_STAGES = ("committed", "failed")
+
+_lock = threading.Lock()
+_channels = OrderedDict()  # job_id → _Channel
+
+
+class _Channel:
+    __slots__ = ("events", "first_seq", "started", "cond")
+
+    def __init__(self):
+        self.events = []
+        self.first_seq = 0  # seq ของ events[0]
+        self.started = None
+        self.cond = threading.Condition(_lock)
+
+    @property
+    def next_seq(self):
+        return self.first_seq + len(self.events)
+
+
+def _channel(job_id):
+    # เรียกขณะถือ _lock
+    ch = _channels.get(job_id)
+    if ch is None:
+        ch = _channels[job_id] = _Channel()
+        while len(_channels) > MAX_JOBS:
+            _channels.popitem(last=False)
+    else:
+        _channels.move_to_end(job_id)
+    return ch
+
+
+def publish(job_id, stage, **data):
+    """บันทึก event ของงานแล้วปลุกผู้ติดตาม (ไม่บล็อก)"""
+    now = time.time()
+    with _lock:
+        ch = _channel(job_id)
+        if ch.started is None:
+            ch.started = now
+        event = {"seq": ch.next_seq, "stage": stage, "time": now,
+                 "elapsed": round(now - ch.started, 3), **data}
+        ch.events.append(event)
+        if len(ch.events) > MAX_EVENTS:
+            del ch.events[0]
+            ch.first_seq += 1
+        ch.cond.notify_all()
+    return event
+
+
+def wait(job_id, after=-1, timeout=None):
+    """
+    event ของงานที่ seq > after (รอได้ถึง timeout วินาทีถ้ายังไม่มี)
+    Returns: (events, closed) closed=True เมื่อ event สุดท้ายที่คืนเป็น committed / failed
+    """
+    with _lock:
+        ch = _channel(job_id)
+        ch.cond.wait_for(lambda: ch.next_seq > after + 1, timeout)
+        events = ch.events[max(0, after + 1 - ch.first_seq):]
+        return events, bool(events) and events[-1]["stage"] in FINAL_STAGES
+
+
+def history(job_id):
+    """event ทั้งหมดที่ยังเก็บไว้ของงาน"""
+    with _lock:
+        ch = _channels.get(job_id)
+        return list(ch.events) if ch else []
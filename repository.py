@@ -0,0 +1,263 @@
+import json
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from db import execute
+import stats
+
+# ชั้นเข้าถึงข้อมูลที่ใช้ร่วมกันระหว่าง route ต่างๆ (ลด N+1 query)
+
+
+def db_query(query, args=(), fetch=False):
+    """รัน query เดียวบน connection ที่ pool ไว้ของ thread นี้ (autocommit ถ้าไม่ได้อยู่ใน transaction)"""
+    return execute(query, args, fetch=fetch)
+
+
+def list_songs(columns="id,title,view_count,like_count,upload_date,graph_html"):
+    """ดึงเพลงทั้งหมด (ตามลำดับ id) คืนเป็น list ของ tuple ตาม columns"""
+    return db_query(f"SELECT {columns} FROM songs ORDER BY id", fetch=True)
+
+
+def list_songs_page(after=None, limit=24):
+    """
+    หน้าหนึ่งของรายการเพลง (keyset ตาม id ไม่ใช้ OFFSET) ไม่รวม graph_html
+    Returns: (rows, next_after) — rows: (id,title,view_count,like_count,upload_date,overall,has_graph)
+             next_after = None เมื่อเป็นหน้าสุดท้าย
+    """
+    rows = db_query("""
+        SELECT s.id, s.title, s.view_count, s.like_count, s.upload_date, m.overall, s.graph_html IS NOT NULL
+        FROM songs s LEFT JOIN song_emotion_summary m ON m.song_id = s.id
+        WHERE s.id > ?
+        ORDER BY s.id
+        LIMIT ?
+    """, (after or 0, limit + 1), fetch=True)
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1][0]
+    return rows, None
+
+
+def get_songs(song_ids, columns="id,title,view_count,like_count,upload_date,graph_html"):
+    """ดึงเพลงตาม id (columns ต้องขึ้นต้นด้วย id) คืน {song_id: tuple}"""
+    song_ids = list(song_ids)
+    rows = []
+    for start in range(0, len(song_ids), 500):
+        chunk = song_ids[start:start + 500]
+        rows += db_query(
+            f"SELECT {columns} FROM songs WHERE id IN ({','.join('?' * len(chunk))})",
+            tuple(chunk), fetch=True,
+        )
+    return {row[0]: row for row in rows}
+
+
+def load_emotion_sequences(song_ids=None):
+    """
+    ดึงลำดับอารมณ์ของทุกเพลงใน query เดียว
+    Returns: {song_id: [emotion, ...]} เรียงตาม segment_order (ค่า NULL คงไว้เป็น None)
+    """
+    if song_ids is None:
+        rows = db_query(
+            "SELECT song_id, emotion FROM segments ORDER BY song_id, segment_order",
+            fetch=True,
+        )
+    else:
+        song_ids = list(song_ids)
+        rows = []
+        # SQLite จำกัดจำนวน parameter ต่อ statement
+        for start in range(0, len(song_ids), 500):
+            chunk = song_ids[start:start + 500]
+            rows += db_query(
+                f"SELECT song_id, emotion FROM segments WHERE song_id IN ({','.join('?' * len(chunk))}) "
+                "ORDER BY song_id, segment_order",
+                tuple(chunk), fetch=True,
+            )
+
+    sequences = defaultdict(list)
+    for song_id, emotion in rows:
+        sequences[song_id].append(emotion)
+    return dict(sequences)
+
+
+# ----------------------
+# Write paths (ทุกการเขียนเพลง/segments ผ่านฟังก์ชันเหล่านี้ ภายใน transaction ของผู้เรียก)
+# ----------------------
+def insert_song(cur, meta, yt_link, video_id, lyrics, segments, emotions, graph_html):
+    """เพิ่มเพลงใหม่พร้อม segments คืน song_id"""
+    cur.execute("""
+        INSERT INTO songs (title,youtube_link,video_id,description,tags,upload_date,view_count,like_count,lyrics,graph_html)
+        VALUES (?,?,?,?,?,?,?,?,?,?)
+    """, (
+        meta.get("title"), yt_link, video_id, meta.get("description",""),
+        ",".join(meta.get("tags",[])), meta.get("upload_date",""),
+        meta.get("view_count",0), meta.get("like_count",0), lyrics,
+        graph_html
+    ))
+    song_id = cur.lastrowid
+    _insert_segments(cur, song_id, segments, emotions)
+    write_emotion_summaries(cur, [(song_id, emotions)])
+    stats.apply_delta(cur, songs=1, emotions=_segment_emotions(segments, emotions))
+    bump_data_version(cur)
+    return song_id
+
+
+def insert_songs(cur, items):
+    """
+    เพิ่มหลายเพลงใน executemany เดียว (bulk import)
+    items: [(meta, yt_link, video_id, lyrics, segments, emotions, graph_html), ...] — video_id ต้องไม่ซ้ำ
+    คืน [song_id, ...] ตามลำดับของ items
+    """
+    cur.executemany("""
+        INSERT INTO songs (title,youtube_link,video_id,description,tags,upload_date,view_count,like_count,lyrics,graph_html)
+        VALUES (?,?,?,?,?,?,?,?,?,?)
+    """, [(
+        meta.get("title"), yt_link, video_id, meta.get("description",""),
+        ",".join(meta.get("tags",[])), meta.get("upload_date",""),
+        meta.get("view_count",0), meta.get("like_count",0), lyrics,
+        graph_html
+    ) for meta, yt_link, video_id, lyrics, _, _, graph_html in items])
+
+    # executemany ไม่คืน lastrowid ของทุกแถว → map กลับด้วย video_id (unique)
+    video_ids = [item[2] for item in items]
+    id_by_video = {}
+    for start in range(0, len(video_ids), 500):
+        chunk = video_ids[start:start + 500]
+        id_by_video.update(cur.execute(
+            f"SELECT video_id, id FROM songs WHERE video_id IN ({','.join('?' * len(chunk))})",
+            chunk,
+        ).fetchall())
+    song_ids = [id_by_video[v] for v in video_ids]
+
+    cur.executemany(
+        "INSERT INTO segments (song_id,segment_order,text,emotion) VALUES (?,?,?,?)",
+        [(song_id, i, seg, e)
+         for song_id, (_, _, _, _, segments, emotions, _) in zip(song_ids, items)
+         for i, (seg, e) in enumerate(zip(segments, emotions))],
+    )
+    write_emotion_summaries(cur, [(song_id, item[5]) for song_id, item in zip(song_ids, items)])
+    delta = Counter()
+    for item in items:
+        delta.update(_segment_emotions(item[4], item[5]))
+    stats.apply_delta(cur, songs=len(items), emotions=delta)
+    bump_data_version(cur)
+    return song_ids
+
+
+def replace_song_analysis(cur, song_id, segments, emotions, graph_html):
+    """แทนที่ segments + กราฟของเพลงเดิม (refresh / rebuild)"""
+    delta = _segment_emotions(segments, emotions)
+    delta.subtract(_stored_emotions(cur, song_id))
+    cur.execute("DELETE FROM segments WHERE song_id=?", (song_id,))
+    _insert_segments(cur, song_id, segments, emotions)
+    cur.execute("UPDATE songs SET graph_html=? WHERE id=?", (graph_html, song_id))
+    write_emotion_summaries(cur, [(song_id, emotions)])
+    stats.apply_delta(cur, emotions=delta)
+    bump_data_version(cur)
+
+
+def delete_song(cur, song_id):
+    delta = Counter()
+    delta.subtract(_stored_emotions(cur, song_id))
+    # ลบ segments ก่อน
+    cur.execute("DELETE FROM segments WHERE song_id=?", (song_id,))
+    cur.execute("DELETE FROM song_emotion_summary WHERE song_id=?", (song_id,))
+    # ลบเพลง
+    cur.execute("DELETE FROM songs WHERE id=?", (song_id,))
+    stats.apply_delta(cur, songs=-cur.rowcount, emotions=delta)
+    bump_data_version(cur)
+
+
+def bump_data_version(cur):
+    """เพิ่มเวอร์ชันข้อมูล (ทุก write path เรียกภายใน transaction เดียวกัน)"""
+    cur.execute("UPDATE data_version SET version = version + 1, updated_at = ? WHERE id = 1", (time.time(),))
+
+
+def get_data_version():
+    """คืน (version, updated_at) ของข้อมูลเพลงปัจจุบัน"""
+    rows = db_query("SELECT version, updated_at FROM data_version WHERE id = 1", fetch=True)
+    return rows[0] if rows else (0, 0.0)
+
+
+def _segment_emotions(segments, emotions):
+    """จำนวน segment ต่ออารมณ์ที่ _insert_segments จะเขียน (zip ตัดตามรายการที่สั้นกว่า)"""
+    return Counter(e for _, e in zip(segments, emotions))
+
+
+def _stored_emotions(cur, song_id):
+    return dict(cur.execute(
+        "SELECT emotion, COUNT(*) FROM segments WHERE song_id=? GROUP BY emotion", (song_id,)
+    ).fetchall())
+
+
+def _insert_segments(cur, song_id, segments, emotions):
+    cur.executemany(
+        "INSERT INTO segments (song_id,segment_order,text,emotion) VALUES (?,?,?,?)",
+        [(song_id, i, seg, e) for i, (seg, e) in enumerate(zip(segments, emotions))],
+    )
+
+
+# ----------------------
+# Song emotion summary (สรุปอารมณ์ต่อเพลง คำนวณตอนเขียน ไม่ต้องคำนวณใหม่ทุก request)
+# ----------------------
+def _emotion_codes(cur, labels):
+    """รหัสของ label อารมณ์ (เพิ่มใน emotion_codes ถ้ายังไม่มี) คืน {label: code}"""
+    labels = sorted({l for l in labels if l})
+    if labels:
+        cur.executemany("INSERT OR IGNORE INTO emotion_codes (label) VALUES (?)", [(l,) for l in labels])
+    codes = {}
+    for start in range(0, len(labels), 500):
+        chunk = labels[start:start + 500]
+        codes.update(cur.execute(
+            f"SELECT label, code FROM emotion_codes WHERE label IN ({','.join('?' * len(chunk))})", chunk
+        ).fetchall())
+    return codes
+
+
+def write_emotion_summaries(cur, songs):
+    """songs: [(song_id, [emotion, ...]), ...] ตาม segment_order (None = ไม่มีอารมณ์)"""
+    from emotion_labels import summarize_emotions
+
+    codes = _emotion_codes(cur, (e for _, emotions in songs for e in emotions))
+    rows = []
+    for song_id, emotions in songs:
+        summary = summarize_emotions(emotions)
+        seq = np.array([codes.get(e, 0) if e else 0 for e in emotions], dtype="<i4").tobytes()
+        rows.append((
+            song_id, seq, len(emotions), summary["overall"], summary["path"], summary["trans_cnt"],
+            int(summary["stable"]), json.dumps(summary["histogram"], ensure_ascii=False),
+        ))
+    cur.executemany("""
+        INSERT OR REPLACE INTO song_emotion_summary
+            (song_id, seq, seg_count, overall, path, trans_cnt, stable, histogram)
+        VALUES (?,?,?,?,?,?,?,?)
+    """, rows)
+
+
+def emotion_code_labels():
+    """คืน list label ตามรหัส (index 0 = None)"""
+    rows = db_query("SELECT code, label FROM emotion_codes", fetch=True)
+    labels = [None] * (max((code for code, _ in rows), default=0) + 1)
+    for code, label in rows:
+        labels[code] = label
+    return labels
+
+
+def load_emotion_codes():
+    """ลำดับรหัสอารมณ์ของทุกเพลง: [(song_id, view_count, np.ndarray int32), ...] ตามลำดับ id"""
+    rows = db_query("""
+        SELECT s.id, s.view_count, m.seq
+        FROM songs s LEFT JOIN song_emotion_summary m ON m.song_id = s.id
+        ORDER BY s.id
+    """, fetch=True)
+    return [(sid, views, np.frombuffer(seq, dtype="<i4") if seq else np.zeros(0, dtype="<i4"))
+            for sid, views, seq in rows]
+
+
+def get_emotion_summary(song_id):
+    rows = db_query(
+        "SELECT overall, histogram, seg_count FROM song_emotion_summary WHERE song_id=?", (song_id,), fetch=True
+    )
+    if not rows:
+        return None
+    overall, histogram, seg_count = rows[0]
+    return {"overall": overall, "histogram": json.loads(histogram), "seg_count": seg_count}
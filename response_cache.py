@@ -0,0 +1,119 @@
+"""
+แคช response ที่ render แล้วในหน่วยความจำ (หน้า /, /explore, /dashboard, /song/<id>)
+
+- key = (path, query args, data version) → ทุก write path เพิ่ม data version (repository.bump_data_version)
+  แคชเก่าจึงหมดอายุเองทันทีโดยไม่ต้องลบทีละหน้า และใช้ร่วมกันได้ข้ามโปรเซสที่อ่าน songs.db เดียวกัน
+- จำกัดขนาดแบบ LRU ทั้งจำนวนหน้าและจำนวน byte
+- ส่ง ETag / Last-Modified และตอบ 304 เมื่อ If-None-Match / If-Modified-Since ตรงกัน
+
+ตั้งค่า:
+    RESPONSE_CACHE_SIZE       จำนวน response สูงสุด (ค่าเริ่มต้น 256, 0 = ปิดแคชแต่ยังส่ง ETag)
+    RESPONSE_CACHE_MAX_BYTES  ขนาดรวมสูงสุด (ค่าเริ่มต้น 64MB)
+"""
+import functools
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import Response, current_app, request
+
+from repository import get_data_version
+
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_entries = OrderedDict()  # key → (body, mimetype, etag)
+_lock = threading.Lock()
+_bytes = 0
+_version = None
+_hits = _misses = _not_modified = 0
+
+
+def _evict(key):
+    global _bytes
+    body = _entries.pop(key)[0]
+    _bytes -= len(body)
+
+
+def _get(key, version):
+    global _bytes, _version, _hits, _misses
+    with _lock:
+        if version != _version:
+            # ข้อมูลเปลี่ยน → แคชของเวอร์ชันเก่าใช้ไม่ได้อีก
+            _entries.clear()
+            _bytes = 0
+            _version = version
+        entry = _entries.get(key)
+        if entry is None:
+            _misses += 1
+            return None
+        _entries.move_to_end(key)
+        _hits += 1
+        return entry
+
+
+def _put(key, version, entry):
+    global _bytes
+    if MAX_ENTRIES <= 0 or len(entry[0]) > MAX_BYTES:
+        return
+    with _lock:
+        if version != _version:
+            return  # มีการเขียนระหว่าง render → ไม่เก็บผลที่อาจเก่า
+        if key in _entries:
+            _evict(key)
+        _entries[key] = entry
+        _bytes += len(entry[0])
+        while len(_entries) > MAX_ENTRIES or _bytes > MAX_BYTES:
+            _evict(next(iter(_entries)))
+
+
+def _respond(entry, updated_at):
+    global _not_modified
+    body, mimetype, etag = entry
+    resp = Response(body, mimetype=mimetype)
+    resp.set_etag(etag)
+    resp.last_modified = datetime.fromtimestamp(int(updated_at), tz=timezone.utc)
+    # browser เก็บไว้ได้ แต่ต้องถามเซิร์ฟเวอร์ทุกครั้ง (ได้ 304 ถ้ายังไม่เปลี่ยน)
+    resp.cache_control.no_cache = True
+    resp = resp.make_conditional(request)
+    if resp.status_code == 304:
+        with _lock:
+            _not_modified += 1
+    return resp
+
+
+def cached_response(view):
+    """decorator สำหรับ route ที่ผลลัพธ์ขึ้นกับข้อมูลใน songs.db เท่านั้น (แคชเฉพาะ GET ที่ได้ 200)"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != "GET":
+            return view(*args, **kwargs)
+
+        version, updated_at = get_data_version()
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        entry = _get(key, version)
+        if entry is None:
+            resp = current_app.make_response(view(*args, **kwargs))
+            if resp.status_code != 200:
+                return resp  # เช่น ("ไม่พบเพลงนี้", 404) → ไม่แคช
+            body = resp.get_data()
+            entry = (body, resp.mimetype, hashlib.sha1(body).hexdigest())
+            _put(key, version, entry)
+        return _respond(entry, updated_at)
+    return wrapper
+
+
+def stats():
+    with _lock:
+        total = _hits + _misses
+        return {
+            "entries": len(_entries),
+            "bytes": _bytes,
+            "version": _version,
+            "hits": _hits,
+            "misses": _misses,
+            "not_modified": _not_modified,
+            "hit_rate": round(_hits / total, 4) if total else 0.0,
+        }
@@ -1,51 +1,185 @@
+import heapq
+import os
+
 from vectorstore import search_query
+from emotion_search import decode_cursor, encode_cursor
 import numpy as np
 
-def calculate_emotion_similarity(query_emotions, song_emotions):
+# Sakoe–Chiba band: รัศมีรอบเส้นทแยงเป็นสัดส่วนของลำดับที่ยาวกว่า (0 = ไม่จำกัด ได้คะแนนเดิมทุกประการ)
+DTW_BAND = float(os.getenv("DTW_BAND", "0"))
+# จำนวนเพลงต่อ batch ของ similarity_many (เพลงใน batch ถูก pad ให้ยาวเท่ากัน)
+DTW_BATCH = 512
+
+_NEG = -(1 << 40)  # ช่องที่อยู่นอก band (ไปไม่ถึง)
+
+
+def encode_labels(sequences, vocab=None):
+    """แปลงลำดับ label เป็น array รหัส int32 (label เดียวกัน = รหัสเดียวกัน) คืน (codes, vocab)"""
+    vocab = {} if vocab is None else vocab
+    codes = [np.array([vocab.setdefault(label, len(vocab)) for label in seq], dtype=np.int32)
+             for seq in sequences]
+    return codes, vocab
+
+
+def _band(n, lengths, band):
+    """ช่วงคอลัมน์ [lo, hi] ที่แต่ละแถวเดินได้: list ของ (lo, hi) ต่อแถว แต่ละตัวเป็น array ต่อเพลง"""
+    if not band or n == 1:
+        return [(np.zeros_like(lengths), lengths - 1)] * n
+    slope = (lengths - 1) / (n - 1)
+    radius = np.ceil(band * np.maximum(lengths, n))
+    windows, prev_hi = [], None
+    for i in range(n):
+        center = i * slope
+        lo = np.clip(np.ceil(center - radius), 0, lengths - 1).astype(np.int64)
+        hi = np.clip(np.floor(center + radius), 0, lengths - 1).astype(np.int64)
+        if prev_hi is not None:
+            # ให้ window ทับกับแถวก่อนหน้าเสมอ → มีเส้นทางถึงช่องสุดท้ายแม้ band แคบมาก
+            lo = np.minimum(lo, prev_hi)
+        windows.append((lo, hi))
+        prev_hi = hi
+    return windows
+
+
+def _min_matches(min_similarity, norm):
+    """
+    จำนวน match ขั้นต่ำ (จำนวนเต็ม) ที่ทำให้ match / norm >= min_similarity
+    min_similarity * norm ตรงๆ อาจปัดขึ้นเกินค่าจริง (เช่น (14/25)*25 = 14.000000000000002)
+    แล้วตัดเพลงที่ได้คะแนนเท่าเกณฑ์พอดีทิ้ง → ลบ epsilon ก่อนปัดขึ้น
+    """
+    return np.ceil(np.asarray(min_similarity * norm, dtype=np.float64) - 1e-9)
+
+
+def _dtw_batch(query, songs, lengths, band, need):
+    """
+    DTW ของ query กับเพลงหลายเพลงพร้อมกัน (songs: (B, M) pad ด้วย -1)
+    คืน (คะแนนดิบ, mask ของเพลงที่ยังไม่ถูกตัดทิ้ง)
+
+    dp[i][j] = match + max(dp[i-1][j], dp[i][j-1], dp[i-1][j-1]) ไม่ลดลงทั้งสองแกน ช่องทแยงจึงไม่เคยชนะ
+    ทั้งแถวจึงคำนวณได้ด้วย prefix sum: dp[i][j] = P[j] + max_{k<=j}(dp[i-1][k] - P[k-1])
+    (P = ผลรวมสะสมของ match ในแถว i) → maximum.accumulate ต่อแถว ไม่ต้องวนทีละช่อง
+    need: จำนวน match ขั้นต่ำต่อเพลงจาก _min_matches (None = ไม่ตัด) ตัดเพลงทิ้งทันทีที่ upper bound ต่ำกว่า
+    """
+    n = len(query)
+    B, M = songs.shape
+    cols = np.arange(M)
+    alive = np.ones(B, dtype=bool)
+    idx = np.arange(B)
+    windows = _band(n, lengths, band)
+    prev = np.zeros((B, M), dtype=np.int64)  # แถวสมมติก่อนแถวแรก: 0 ทุกช่อง
+    for i in range(n):
+        lo, hi = windows[i]
+        lo, hi = lo[idx], hi[idx]
+        allowed = (cols >= lo[:, None]) & (cols <= hi[:, None])
+        match = (songs == query[i]).astype(np.int64)
+        prefix = np.cumsum(match, axis=1)
+        up = np.where(allowed, prev, _NEG)
+        row = prefix + np.maximum.accumulate(up - (prefix - match), axis=1)
+        row = np.where(allowed, row, _NEG)
+
+        if need is not None and i < n - 1:
+            # upper bound: ทุกก้าวที่เหลือ (ไปขวา m-1-j และลง n-1-i) ได้เพิ่มไม่เกิน 1
+            bound = (row + (lengths[:, None] - 1 - cols)).max(axis=1) + (n - 1 - i)
+            keep = bound >= need
+            if not keep.all():
+                alive[idx[~keep]] = False
+                idx, songs, lengths, need, row = idx[keep], songs[keep], lengths[keep], need[keep], row[keep]
+                if not len(idx):
+                    break
+        prev = row
+
+    scores = np.zeros(B)
+    if len(idx):
+        scores[idx] = prev[np.arange(len(idx)), lengths - 1]
+    return scores, alive
+
+
+def similarity_many(query_codes, song_codes, band=None, min_similarity=None):
+    """
+    ความคล้ายของ query กับหลายเพลง (รหัสจาก encode_labels) คืน np.ndarray ตามลำดับ song_codes
+    band=None ใช้ DTW_BAND; min_similarity: เพลงที่ไม่มีทางถึงเกณฑ์ถูกตัดทิ้งกลางทางและได้ 0.0
+    """
+    band = DTW_BAND if band is None else band
+    query = np.asarray(query_codes, dtype=np.int32)
+    n = len(query)
+    lengths = np.array([len(codes) for codes in song_codes], dtype=np.int64)
+    out = np.zeros(len(song_codes))
+    if n == 0:
+        return out
+    norm = np.maximum(lengths, n)  # normalize ด้วยความยาวที่ยาวกว่า
+
+    # เรียงตามความยาวเพื่อให้เพลงใน batch เดียวกัน pad น้อย
+    todo = np.flatnonzero(lengths > 0)
+    todo = todo[np.argsort(lengths[todo], kind="stable")]
+    for start in range(0, len(todo), DTW_BATCH):
+        batch = todo[start:start + DTW_BATCH]
+        width = int(lengths[batch].max())
+        songs = np.full((len(batch), width), -1, dtype=np.int32)
+        for row, k in enumerate(batch):
+            songs[row, :lengths[k]] = song_codes[k]
+        need = None
+        if min_similarity is not None:
+            # bound ก่อนรัน DP: คอลัมน์ที่ไม่มี label ของ query เลยได้ 0 ส่วนก้าวลงเพิ่มได้ไม่เกิน n-1
+            need = _min_matches(min_similarity, norm[batch])
+            keep = np.isin(songs, query).sum(axis=1) + n - 1 >= need
+            batch, songs, need = batch[keep], songs[keep], need[keep]
+            if not len(batch):
+                continue
+        scores, alive = _dtw_batch(query, songs, lengths[batch], band, need)
+        out[batch[alive]] = scores[alive] / norm[batch[alive]]
+    return out
+
+
+def calculate_emotion_similarity(query_emotions, song_emotions, band=None, min_similarity=None):
     """
     คำนวณความคล้ายของลำดับอารมณ์ระหว่าง query กับเพลง
-    ใช้ Dynamic Time Warping algorithm แบบง่าย
+    ใช้ Dynamic Time Warping (คะแนน = จำนวนช่องที่ตรงกันบนเส้นทางที่ดีที่สุด / ความยาวที่ยาวกว่า)
+    band / min_similarity: ดู similarity_many (คู่เดียวใช้ลูปจำนวนเต็มธรรมดา เร็วกว่าเรียก numpy ทีละแถว)
     """
     if not query_emotions or not song_emotions:
         return 0.0
-        
-    # สร้าง matrix ความคล้าย
-    n, m = len(query_emotions), len(song_emotions)
-    dp = np.zeros((n, m))
-    
-    # ใส่ค่าเริ่มต้น
-    dp[0][0] = 1 if query_emotions[0] == song_emotions[0] else 0
-    
-    # คำนวณ similarity score
-    for i in range(n):
-        for j in range(m):
-            if i == 0 and j == 0:
-                continue
-            
-            score = 1 if query_emotions[i] == song_emotions[j] else 0
-            prev = []
-            if i > 0:
-                prev.append(dp[i-1][j])
-            if j > 0:
-                prev.append(dp[i][j-1])
-            if i > 0 and j > 0:
-                prev.append(dp[i-1][j-1])
-                
-            dp[i][j] = score + max(prev) if prev else score
-            
-    return dp[n-1][m-1] / max(n, m)  # normalize score
-
-def match_query(query_text, min_similarity=0.6):
+    band = DTW_BAND if band is None else band
+    (query, song), _ = encode_labels([query_emotions, song_emotions])
+    query, song = query.tolist(), song.tolist()
+    n, m = len(query), len(song)
+    norm = max(n, m)
+    need = None if min_similarity is None else float(_min_matches(min_similarity, norm))
+    windows = [(int(lo[0]), int(hi[0])) for lo, hi in _band(n, np.array([m]), band)]
+
+    prev = [0] * m  # แถวสมมติก่อนแถวแรก
+    for i, label in enumerate(query):
+        lo, hi = windows[i]
+        row = [_NEG] * m
+        running = _NEG
+        for j in range(lo, hi + 1):
+            # dp[i][j] = match + max(บน, ซ้าย) (ช่องทแยงไม่มีทางมากกว่าสองช่องนี้)
+            running = max(prev[j], running) + (song[j] == label)
+            row[j] = running
+        if need is not None and i < n - 1:
+            bound = max(row[j] + (m - 1 - j) for j in range(lo, hi + 1)) + (n - 1 - i)
+            if bound < need:
+                return 0.0
+        prev = row
+    return prev[m - 1] / norm
+
+def match_query(query_text, min_similarity=0.6, limit=10):
     """
     ค้นหาเพลงที่มีลำดับอารมณ์คล้ายกับ query
     รองรับทั้งการค้นหาแบบใช้ลูกศร (→) และภาษาธรรมชาติ
     """
+    return match_query_page(query_text, limit, min_similarity=min_similarity)[0]
+
+def match_query_page(query_text, limit=10, after=None, min_similarity=0.6):
+    """
+    ผลลัพธ์ของ match_query หนึ่งหน้า เรียงตามความคล้าย, view_count (มาก→น้อย) แล้วตาม id
+    after: cursor ของหน้าก่อน (ข้อความ)
+    Returns: ([song, ...], cursor ของหน้าถัดไป หรือ None ถ้าหมดแล้ว)
+    """
     from app import parse_thai_emotion_query, db_query
     
     # แยกอารมณ์จาก query
     query_emotions = parse_thai_emotion_query(query_text)
     if not query_emotions:
-        return []
+        return [], None
         
     # ดึงข้อมูลเพลงทั้งหมด
     songs = db_query("""
@@ -56,16 +190,34 @@ def match_query(query_text, min_similarity=0.6):
         GROUP BY s.id
     """, fetch=True)
     
-    # คำนวณความคล้ายและจัดอันดับ
-    results = []
-    for song in songs:
-        song_emotions = song[6].split(',') if song[6] else []
-        similarity = calculate_emotion_similarity(query_emotions, song_emotions)
-        if similarity >= min_similarity:
-            results.append((similarity, song))
-    
-    # เรียงตามความคล้ายมากไปน้อย
-    results.sort(reverse=True, key=lambda x: x[0])
-    
-    # ส่งคืนเฉพาะข้อมูลเพลง (ไม่รวม similarity score)
-    return [song for _, song in results[:10]]
\ No newline at end of file
+    vocab = {}
+    (query_codes,), vocab = encode_labels([query_emotions], vocab)
+    song_codes, _ = encode_labels([song[6].split(',') if song[6] else [] for song in songs], vocab)
+
+    # เก็บ limit+1 อันดับแรกใน min-heap ตาม key (ความคล้าย, view_count, -id) ไม่ต้องเรียงทุกเพลง
+    # เมื่อ heap เต็ม เกณฑ์ของ batch ถัดไปขยับขึ้นเป็นคะแนนของตัวท้าย heap
+    # → similarity_many ตัดเพลงที่ upper bound ไม่ถึงคะแนนนั้นทิ้งกลางทาง
+    cursor = decode_cursor(after) if after else None
+    if cursor is not None:
+        cursor = (cursor[0], cursor[1], -cursor[2])
+    heap, size, threshold = [], limit + 1, min_similarity
+    for start in range(0, len(songs), DTW_BATCH):
+        scores = similarity_many(query_codes, song_codes[start:start + DTW_BATCH], min_similarity=threshold)
+        for similarity, song in zip(scores.tolist(), songs[start:start + DTW_BATCH]):
+            if similarity < threshold:
+                continue
+            key = (similarity, float(song[2] or 0), -song[0])
+            if cursor is not None and key >= cursor:
+                continue  # อยู่ในหน้าก่อนๆ แล้ว
+            if len(heap) < size:
+                heapq.heappush(heap, (key, song))
+            elif key > heap[0][0]:
+                heapq.heapreplace(heap, (key, song))
+        if len(heap) == size:
+            threshold = max(threshold, heap[0][0][0])
+
+    ranked = sorted(heap, reverse=True)
+    if len(ranked) <= limit:
+        return [song for _, song in ranked], None
+    (similarity, views, neg_id), _ = ranked[limit - 1]
+    return [song for _, song in ranked[:limit]], encode_cursor(similarity, views, -neg_id)
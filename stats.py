@@ -0,0 +1,77 @@
+"""
+ตัวนับสถิติของแดชบอร์ด (จำนวนเพลง, จำนวน segment, จำนวน segment ต่ออารมณ์)
+
+ตัวนับถูกปรับแบบ delta ใน transaction เดียวกับการเขียน songs/segments (repository.py)
+หน้า /dashboard /evaluation /explore จึงอ่านได้โดยไม่ต้อง COUNT(*) / GROUP BY ทั้งตาราง
+
+Usage:
+    python stats.py --rebuild      # คำนวณตัวนับใหม่ทั้งหมดจาก songs/segments
+"""
+from collections import Counter
+
+from db import execute, transaction
+
+
+def apply_delta(cur, songs=0, emotions=None):
+    """
+    ปรับตัวนับภายใน transaction ของผู้เรียก
+    emotions: Counter {emotion: +/-จำนวน segment} (emotion เป็น None ได้)
+    """
+    emotions = Counter(emotions or {})
+    segments = sum(emotions.values())
+    for key, delta in (("songs", songs), ("segments", segments)):
+        if delta:
+            cur.execute("UPDATE stats_counters SET value = value + ? WHERE key=?", (delta, key))
+    for emotion, delta in emotions.items():
+        if not delta:
+            continue
+        # emotion อาจเป็น NULL → ใช้ IS แทน = และเพิ่มแถวเองถ้ายังไม่มี
+        cur.execute("UPDATE emotion_stats SET cnt = cnt + ? WHERE emotion IS ?", (delta, emotion))
+        if cur.rowcount == 0:
+            cur.execute("INSERT INTO emotion_stats (emotion, cnt) VALUES (?, ?)", (emotion, delta))
+
+
+def rebuild(cur=None):
+    """คำนวณตัวนับใหม่จากตารางจริง (เช่น หลังแก้ฐานข้อมูลด้วยมือ)"""
+    if cur is None:
+        with transaction() as cur:
+            return rebuild(cur)
+    cur.execute("DELETE FROM stats_counters")
+    cur.execute("DELETE FROM emotion_stats")
+    cur.execute("INSERT INTO stats_counters (key, value) SELECT 'songs', COUNT(*) FROM songs")
+    cur.execute("INSERT INTO stats_counters (key, value) SELECT 'segments', COUNT(*) FROM segments")
+    cur.execute("INSERT INTO emotion_stats (emotion, cnt) SELECT emotion, COUNT(*) FROM segments GROUP BY emotion")
+
+
+def totals():
+    """คืน (จำนวนเพลง, จำนวน segment)"""
+    values = dict(execute("SELECT key, value FROM stats_counters", fetch=True))
+    return values.get("songs", 0), values.get("segments", 0)
+
+
+def emotion_counts(limit=None):
+    """[(emotion, count), ...] เรียงจากมากไปน้อย (แบบเดียวกับ GROUP BY emotion ORDER BY cnt DESC)"""
+    query = "SELECT emotion, cnt FROM emotion_stats WHERE cnt > 0 ORDER BY cnt DESC, emotion"
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    return execute(query, fetch=True)
+
+
+if __name__ == "__main__":
+    import argparse
+    from migrations import migrate
+
+    parser = argparse.ArgumentParser(description="Dashboard statistics counters")
+    parser.add_argument("--rebuild", action="store_true", help="คำนวณตัวนับใหม่ทั้งหมด")
+    args = parser.parse_args()
+
+    migrate()
+    if args.rebuild:
+        from repository import bump_data_version
+        with transaction() as cur:
+            rebuild(cur)
+            bump_data_version(cur)
+    songs, segments = totals()
+    print(f"songs={songs} segments={segments}")
+    for emotion, cnt in emotion_counts():
+        print(f"  {emotion}: {cnt}")
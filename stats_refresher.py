@@ -0,0 +1,248 @@
+"""
+อัปเดตยอดวิว / ไลก์ของเพลงจาก YouTube เป็นรอบๆ (ค่าใน songs ถูกเก็บครั้งเดียวตอนเพิ่มเพลง)
+
+แต่ละรอบ:
+1. เรียงเพลงตาม priority = ความเก่าของยอด (วัน) × (1 + log10(1 + ยอดวิว)) → เพลงดังที่ยอดเก่ามาก่อน
+   เพลงที่ยังไม่เคยอัปเดตถือว่าเก่า MAX_AGE_DAYS วัน, เพลงที่เพิ่งอัปเดตภายใน STATS_MIN_AGE_HOURS ข้ามไป
+2. เลือกไม่เกิน quota ที่เหลือของวัน: งบของงานนี้ (STATS_REFRESH_BUDGET unit/วัน) และ quota รวมของ API
+   videos.list 1 unit ได้ 50 เพลง
+3. ดึง statistics ผ่าน youtube_utils ทีละ chunk แล้วเขียนกลับด้วย executemany เดียวต่อ chunk
+   พร้อมเพิ่ม data version (แคชหน้าเว็บ / ดัชนีของ /search หมดอายุ)
+4. บันทึกผลของรอบ (จำนวนเพลง, call, unit, เวลา) ในตาราง refresh_runs
+
+รันเองได้ (เช่น cron) หรือให้เว็บรันเป็น thread เบื้องหลังทุก STATS_REFRESH_INTERVAL วินาที
+รอบที่กำลังรันจอง lease ใน refresh_runs ไว้ โปรเซสอื่นจึงไม่รันซ้อน
+
+Usage:
+    python stats_refresher.py                  # รันหนึ่งรอบ
+    python stats_refresher.py --loop 3600      # รันทุกชั่วโมง
+    python stats_refresher.py --history        # ประวัติการรันล่าสุด
+"""
+import math
+import os
+import threading
+import time
+import traceback
+
+from db import execute, transaction
+
+# quota (unit) ต่อวันที่งานนี้ใช้ได้ (เหลือที่เหลือไว้ให้การเพิ่มเพลง)
+BUDGET = int(os.getenv("STATS_REFRESH_BUDGET", "500"))
+# จำนวนเพลงต่อ chunk (ปัดเป็นจำนวนเต็มของ 50) = หนึ่ง transaction
+CHUNK_SIZE = int(os.getenv("STATS_REFRESH_CHUNK", "500"))
+# เพลงที่อัปเดตไม่เกินกี่ชั่วโมงถือว่ายังใหม่
+MIN_AGE = float(os.getenv("STATS_MIN_AGE_HOURS", "24")) * 3600
+# ช่วงเวลาระหว่างรอบของ thread ในเว็บ (วินาที, 0 = ไม่รันในเว็บ)
+INTERVAL = float(os.getenv("STATS_REFRESH_INTERVAL", "0"))
+# รอบที่ running นานเกินนี้ถือว่าโปรเซสตายแล้ว
+LEASE_SECONDS = 3600
+MAX_AGE_DAYS = 365
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def priorities(now=None, min_age=MIN_AGE):
+    """[(song_id, video_id), ...] ที่ควรอัปเดต เรียงจาก priority สูงไปต่ำ"""
+    now = now or time.time()
+    candidates = []
+    rows = execute("SELECT id, video_id, view_count, stats_updated_at FROM songs WHERE video_id IS NOT NULL",
+                   fetch=True)
+    for song_id, video_id, views, updated_at in rows:
+        if updated_at and now - updated_at < min_age:
+            continue
+        age_days = MAX_AGE_DAYS if not updated_at else min((now - updated_at) / 86400, MAX_AGE_DAYS)
+        popularity = 1 + math.log10(1 + max(_int(views) or 0, 0))
+        candidates.append((age_days * popularity, song_id, video_id))
+    candidates.sort(reverse=True)
+    return [(song_id, video_id) for _, song_id, video_id in candidates]
+
+
+def budget_left(budget=BUDGET, day=None):
+    """unit ที่ยังใช้ได้วันนี้ = min(งบของงานนี้ที่เหลือ, quota รวมที่เหลือ)"""
+    from youtube_client import get_client, quota_day
+
+    spent = execute("SELECT COALESCE(SUM(units), 0) FROM refresh_runs WHERE day=?",
+                    (day or quota_day(),), fetch=True)[0][0]
+    return max(0, min(budget - spent, get_client().quota_remaining()))
+
+
+# ----------------------
+# Runs
+# ----------------------
+def _start_run(day):
+    """จองรอบใหม่ คืน run id (None ถ้ามีรอบอื่นกำลังรันอยู่)"""
+    now = time.time()
+    with transaction() as cur:
+        if cur.execute("SELECT 1 FROM refresh_runs WHERE status='running' AND started_at > ?",
+                       (now - LEASE_SECONDS,)).fetchone():
+            return None
+        cur.execute("UPDATE refresh_runs SET status='abandoned' WHERE status='running'")
+        cur.execute("INSERT INTO refresh_runs (day, status, started_at) VALUES (?, 'running', ?)", (day, now))
+        return cur.lastrowid
+
+
+def _save_run(cur, run_id, counts, status="running", error=None):
+    cur.execute("""
+        UPDATE refresh_runs SET status=?, finished_at=?, songs=?, updated=?, missing=?, calls=?, units=?, error=?
+        WHERE id=?
+    """, (status, None if status == "running" else time.time(), counts["songs"], counts["updated"],
+          counts["missing"], counts["calls"], counts["units"], error, run_id))
+
+
+def _count_call(counts, units):
+    counts["calls"] += 1
+    counts["units"] += units
+
+
+def run_once(budget=BUDGET, chunk_size=CHUNK_SIZE, min_age=MIN_AGE, verbose=False):
+    """
+    อัปเดตหนึ่งรอบ คืน dict ผลของรอบ (None ถ้ามีโปรเซสอื่นกำลังรันอยู่)
+    """
+    from migrations import migrate
+    from repository import bump_data_version
+    from youtube_client import MAX_IDS_PER_CALL, QUOTA_COST, YouTubeApiError, quota_day
+    from youtube_utils import fetch_youtube_metadata_many
+
+    migrate()
+    day = quota_day()
+    run_id = _start_run(day)
+    if run_id is None:
+        if verbose:
+            print("⏭ มีรอบอื่นกำลังรันอยู่")
+        return None
+
+    counts = {"songs": 0, "updated": 0, "missing": 0, "calls": 0, "units": 0}
+    started = time.time()
+    status, error = "done", None
+    try:
+        units = budget_left(budget, day)
+        todo = priorities(started, min_age)[:units * MAX_IDS_PER_CALL]
+        if verbose:
+            print(f"งบเหลือ {units} unit → อัปเดต {len(todo)} เพลง")
+        chunk_size = max(MAX_IDS_PER_CALL, chunk_size - chunk_size % MAX_IDS_PER_CALL)
+
+        for start in range(0, len(todo), chunk_size):
+            chunk = todo[start:start + chunk_size]
+            # ดึงทีละ batch (1 call) แล้วนับทันที → ถ้า call หลังๆ ล้ม unit ที่เสียไปแล้วยังถูกบันทึก
+            metas = {}
+            for i in range(0, len(chunk), MAX_IDS_PER_CALL):
+                batch = [video_id for _, video_id in chunk[i:i + MAX_IDS_PER_CALL]]
+                try:
+                    metas.update(fetch_youtube_metadata_many(batch, use_cache=False))
+                except YouTubeApiError:
+                    _count_call(counts, QUOTA_COST["videos"])  # YouTube ตอบ error ก็เสีย quota
+                    raise
+                _count_call(counts, QUOTA_COST["videos"])
+
+            now = time.time()
+            rows = []
+            for song_id, video_id in chunk:
+                meta = metas.get(video_id)
+                if meta:
+                    rows.append((_int(meta.get("view_count")), _int(meta.get("like_count")), now, song_id))
+                    counts["updated"] += 1
+                else:
+                    rows.append((None, None, now, song_id))  # วิดีโอถูกลบ/ปิด → เก็บยอดเดิม ไม่ถามซ้ำจนกว่าจะเก่า
+                    counts["missing"] += 1
+            counts["songs"] += len(chunk)
+
+            with transaction() as cur:
+                cur.executemany("""
+                    UPDATE songs SET view_count=COALESCE(?, view_count), like_count=COALESCE(?, like_count),
+                                     stats_updated_at=?
+                    WHERE id=?
+                """, rows)
+                bump_data_version(cur)
+                _save_run(cur, run_id, counts)
+            if verbose:
+                elapsed = max(time.time() - started, 1e-9)
+                print(f"เพลง {counts['songs']:>7}/{len(todo)} | {counts['calls']} calls"
+                      f" | {counts['songs'] / elapsed:7.1f} songs/s", flush=True)
+    except Exception as e:
+        status, error = "failed", f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+    finally:
+        with transaction() as cur:
+            _save_run(cur, run_id, counts, status, error)
+
+    seconds = time.time() - started
+    return {"id": run_id, "status": status, "error": error, "seconds": round(seconds, 3),
+            "songs_per_sec": round(counts["songs"] / seconds, 1) if seconds else 0.0, **counts}
+
+
+def recent_runs(limit=10):
+    rows = execute("""
+        SELECT id, day, status, started_at, finished_at, songs, updated, missing, calls, units, error
+        FROM refresh_runs ORDER BY id DESC LIMIT ?
+    """, (limit,), fetch=True)
+    keys = ("id", "day", "status", "started_at", "finished_at", "songs", "updated", "missing",
+            "calls", "units", "error")
+    runs = []
+    for row in rows:
+        run = dict(zip(keys, row))
+        seconds = (run["finished_at"] or time.time()) - run["started_at"]
+        run["seconds"] = round(seconds, 3)
+        run["songs_per_sec"] = round(run["songs"] / seconds, 1) if seconds > 0 else 0.0
+        runs.append(run)
+    return runs
+
+
+# ----------------------
+# Scheduler
+# ----------------------
+def _loop(interval, stop):
+    while not stop.wait(interval):
+        try:
+            run_once()
+        except Exception:
+            traceback.print_exc()
+
+
+def start_scheduler(interval=INTERVAL):
+    """รันทุก interval วินาทีใน daemon thread (เรียกซ้ำได้ เริ่มครั้งเดียว, interval <= 0 = ไม่รัน)"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None and interval > 0:
+            _scheduler = threading.Thread(target=_loop, args=(interval, threading.Event()),
+                                          name="stats-refresher", daemon=True)
+            _scheduler.start()
+    return _scheduler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Refresh view/like counts from YouTube within a quota budget")
+    parser.add_argument("--budget", type=int, default=BUDGET, help="quota (unit) ต่อวันสำหรับงานนี้")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="เพลงต่อ transaction")
+    parser.add_argument("--min-age-hours", type=float, default=MIN_AGE / 3600, help="ข้ามเพลงที่อัปเดตไม่เกินเท่านี้")
+    parser.add_argument("--loop", type=float, metavar="SECONDS", help="รันซ้ำทุกกี่วินาที")
+    parser.add_argument("--history", action="store_true", help="แสดงประวัติการรันล่าสุด")
+    args = parser.parse_args()
+
+    if args.history:
+        from migrations import migrate
+        migrate()
+        print(f"{'Run':>5} | {'Day':<10} | {'Status':<9} | {'Songs':>6} | {'Missing':>7} | {'Calls':>5}"
+              f" | {'Units':>5} | {'Seconds':>8} | {'songs/s':>8}")
+        print("-" * 88)
+        for run in recent_runs():
+            print(f"{run['id']:>5} | {run['day']:<10} | {run['status']:<9} | {run['songs']:>6} | {run['missing']:>7}"
+                  f" | {run['calls']:>5} | {run['units']:>5} | {run['seconds']:>8.1f} | {run['songs_per_sec']:>8.1f}")
+    else:
+        while True:
+            result = run_once(args.budget, args.chunk_size, args.min_age_hours * 3600, verbose=True)
+            if result:
+                print(f"✅ {result['status']}: {result['songs']} เพลง ({result['missing']} ไม่พบ), "
+                      f"{result['calls']} calls, {result['seconds']:.1f}s ({result['songs_per_sec']} songs/s)")
+            if not args.loop:
+                break
+            time.sleep(args.loop)
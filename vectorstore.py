@@ -1,24 +1,389 @@
+"""
+FAISS index ของ embedding เนื้อเพลงราย segment (ค้นหาด้วยความหมาย)
+
+- index เป็น IndexIDMap2 ใช้ segments.id เป็น id ของเวกเตอร์ → เพิ่ม/ลบราย segment ได้
+- บันทึกลงดิสก์ (VECTOR_INDEX_PATH) และโหลดแบบ memory-map → รีสตาร์ทไม่ต้อง embed ใหม่
+- metadata (segment id → song_id, segment_order) เก็บเป็น numpy array เรียงตาม id, ค้นด้วย searchsorted
+- sync กับ segments ผ่าน index_songs() / remove_songs() หลัง commit และ sync_from_db() สำหรับซ่อมส่วนที่ตกหล่น
+- VECTOR_INDEX_TYPE=ivfpq / hnsw: ค้นหาด้วย ANN index ที่ train จากเวกเตอร์ใน flat index
+  (flat index ยังเก็บไว้เป็นต้นฉบับสำหรับ train ใหม่และ benchmark)
+
+Usage:
+    python vectorstore.py --sync       # embed segment ที่ยังไม่อยู่ใน index และลบที่หายไปจากฐานข้อมูล
+    python vectorstore.py --train      # สร้าง/train ANN index ใหม่ตาม VECTOR_INDEX_TYPE
+"""
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
-embedder = SentenceTransformer("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+EMBED_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", "segments.faiss")
+# 0 = ไม่อัปเดต index อัตโนมัติตอนเพิ่ม/ลบเพลง
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "1") != "0"
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+# ANN: flat (ค้นแบบ exact) / ivfpq / hnsw
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))         # 0 = เลือกอัตโนมัติ (~4·sqrt(N))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+# IVF-PQ: ดึงผู้สมัคร k·IVF_REFINE ตัวแล้วจัดอันดับใหม่ด้วยเวกเตอร์เต็มจาก flat index (0 = ปิด)
+IVF_REFINE = int(os.getenv("IVF_REFINE", "4"))
+PQ_M = int(os.getenv("PQ_M", "48"))                  # จำนวน sub-quantizer (384 / 48 = 8 มิติต่อตัว)
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+INDEX_TYPES = ("flat", "ivfpq", "hnsw")
 
-# สร้าง index FAISS
 dimension = 384
-index = faiss.IndexFlatL2(dimension)
 
-# mapping (id → song/segment)
-metadata = []
+_embedder = None
+_lock = threading.RLock()
+
+
+def get_embedder():
+    """โหลด SentenceTransformer ครั้งแรกที่ต้องใช้"""
+    global _embedder
+    if _embedder is None:
+        with _lock:
+            if _embedder is None:
+                from sentence_transformers import SentenceTransformer
+                _embedder = SentenceTransformer(EMBED_MODEL)
+    return _embedder
+
+
+def embed(texts):
+    vectors = get_embedder().encode(list(texts), batch_size=EMBED_BATCH_SIZE)
+    return np.ascontiguousarray(vectors, dtype="float32").reshape(-1, dimension)
+
+
+class SegmentMetadata:
+    """segment id → (song_id, segment_order) แบบ array เรียงตาม id (ไม่มี tuple ต่อแถว)"""
+
+    def __init__(self, ids=None, song_ids=None, orders=None):
+        self.ids = np.asarray(ids if ids is not None else [], dtype=np.int64)
+        self.song_ids = np.asarray(song_ids if song_ids is not None else [], dtype=np.int64)
+        self.orders = np.asarray(orders if orders is not None else [], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, ids, song_ids, orders):
+        ids = np.asarray(ids, dtype=np.int64)
+        self.ids = np.concatenate([self.ids, ids])
+        self.song_ids = np.concatenate([self.song_ids, np.asarray(song_ids, dtype=np.int64)])
+        self.orders = np.concatenate([self.orders, np.asarray(orders, dtype=np.int32)])
+        # segments.id เป็น autoincrement ส่วนใหญ่ต่อท้ายอยู่แล้ว → sort เฉพาะเมื่อจำเป็น
+        if len(self.ids) > 1 and np.any(self.ids[1:] < self.ids[:-1]):
+            order = np.argsort(self.ids, kind="stable")
+            self.ids, self.song_ids, self.orders = self.ids[order], self.song_ids[order], self.orders[order]
+
+    def remove(self, ids):
+        keep = ~np.isin(self.ids, np.asarray(ids, dtype=np.int64))
+        self.ids, self.song_ids, self.orders = self.ids[keep], self.song_ids[keep], self.orders[keep]
+
+    def ids_for_songs(self, song_ids):
+        return self.ids[np.isin(self.song_ids, np.asarray(list(song_ids), dtype=np.int64))]
+
+    def lookup(self, ids):
+        """คืน mask ของ id ที่พบ และ (song_ids, orders) ของ id เหล่านั้น"""
+        ids = np.asarray(ids, dtype=np.int64)
+        pos = np.searchsorted(self.ids, ids)
+        pos_clipped = np.minimum(pos, max(len(self.ids) - 1, 0))
+        found = (pos < len(self.ids)) & (self.ids[pos_clipped] == ids) if len(self.ids) else np.zeros(len(ids), bool)
+        return found, self.song_ids[pos_clipped[found]], self.orders[pos_clipped[found]]
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez(f, ids=self.ids, song_ids=self.song_ids, orders=self.orders)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["ids"], data["song_ids"], data["orders"])
+
+
+# ----------------------
+# ANN index
+# ----------------------
+def stored_vectors(index):
+    """ดึง (ids, vectors) ทั้งหมดจาก IndexIDMap2(IndexFlatL2) โดยไม่ต้อง embed ใหม่"""
+    ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+    flat = faiss.downcast_index(index.index)
+    vectors = flat.reconstruct_n(0, flat.ntotal) if flat.ntotal else np.zeros((0, dimension), "float32")
+    return ids, vectors
+
+
+def build_ann(kind, vectors, ids, nlist=None, pq_m=PQ_M, hnsw_m=HNSW_M):
+    """สร้าง ANN index จากเวกเตอร์ที่มีอยู่ (train + add)"""
+    n = len(vectors)
+    if kind == "ivfpq":
+        if n < 256:
+            raise ValueError(f"IVF-PQ ต้องมีอย่างน้อย 256 เวกเตอร์สำหรับ train (มี {n})")
+        nlist = nlist or IVF_NLIST or int(4 * np.sqrt(n))
+        nlist = max(1, min(nlist, n // 39))  # k-means ต้องการ ~39 จุดต่อ centroid
+        nbits = min(8, int(np.log2(n // 39)))  # codebook 2^nbits ต่อ sub-quantizer (ข้อมูลน้อย → codebook เล็กลง)
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimension), dimension, nlist, pq_m, nbits)
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(n, min(n, 256 * nlist), replace=False)] if n > 256 * nlist else vectors
+        index.train(sample)
+    elif kind == "hnsw":
+        inner = faiss.IndexHNSWFlat(dimension, hnsw_m)
+        inner.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index = faiss.IndexIDMap2(inner)
+    else:
+        raise ValueError(f"unknown ANN index type: {kind}")
+    if n:
+        index.add_with_ids(np.ascontiguousarray(vectors, dtype="float32"), ids)
+    set_search_params(index)
+    return index
+
+
+def set_search_params(index, nprobe=IVF_NPROBE, ef_search=HNSW_EF_SEARCH):
+    """ตั้งค่า nprobe (IVF) / efSearch (HNSW) ตอนค้นหา"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = nprobe
+    elif isinstance(index, faiss.IndexIDMap2):
+        inner = faiss.downcast_index(index.index)
+        if isinstance(inner, faiss.IndexHNSW):
+            inner.hnsw.efSearch = ef_search
+    return index
+
+
+def refine(flat, query, candidate_ids, k):
+    """จัดอันดับผู้สมัครจาก ANN ใหม่ด้วยระยะ L2 จริง (เวกเตอร์จาก flat index)"""
+    candidate_ids = candidate_ids[candidate_ids >= 0]
+    if not len(candidate_ids):
+        return candidate_ids
+    vectors = flat.reconstruct_batch(candidate_ids)
+    dist = ((vectors - query) ** 2).sum(axis=1)
+    return candidate_ids[np.argsort(dist, kind="stable")[:k]]
+
+
+def _is_hnsw(index):
+    return isinstance(index, faiss.IndexIDMap2) and isinstance(faiss.downcast_index(index.index), faiss.IndexHNSW)
+
+
+class VectorStore:
+    """index + metadata ที่บันทึกคู่กันบนดิสก์ (อ่านซ้ำอัตโนมัติเมื่อโปรเซสอื่นเขียนไฟล์ใหม่)"""
+
+    def __init__(self, path=VECTOR_INDEX_PATH, index_type=VECTOR_INDEX_TYPE):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"VECTOR_INDEX_TYPE must be one of {INDEX_TYPES}")
+        self.path = path
+        self.meta_path = path + ".meta.npz"
+        self.index_type = index_type
+        self.ann_path = f"{path}.{index_type}" if index_type != "flat" else None
+        self.index = None
+        self.ann = None  # None = ยังไม่ได้ train → ค้นด้วย flat
+        self.metadata = None
+        self._mtime = None
+
+    # ---------- persistence ----------
+    def _file_mtime(self):
+        try:
+            return os.stat(self.meta_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _new_index(self):
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+
+    def load(self):
+        """โหลดจากดิสก์ (memory-map) ถ้าไฟล์เปลี่ยนตั้งแต่โหลดครั้งก่อน"""
+        with _lock:
+            mtime = self._file_mtime()
+            if self.index is not None and mtime == self._mtime:
+                return self
+            if mtime is not None and os.path.exists(self.path):
+                self.index = faiss.read_index(self.path, faiss.IO_FLAG_MMAP)
+                self.metadata = SegmentMetadata.load(self.meta_path)
+            else:
+                self.index = self._new_index()
+                self.metadata = SegmentMetadata()
+            self.ann = None
+            if self.ann_path and os.path.exists(self.ann_path):
+                self.ann = set_search_params(faiss.read_index(self.ann_path))
+            self._mtime = mtime
+            return self
+
+    def save(self):
+        # เขียนไฟล์ชั่วคราวแล้ว rename ทีละไฟล์; metadata เขียนทีหลังและใช้เป็นตัวบอกเวอร์ชัน
+        with _lock:
+            faiss.write_index(self.index, self.path + ".tmp")
+            os.replace(self.path + ".tmp", self.path)
+            if self.ann is not None:
+                faiss.write_index(self.ann, self.ann_path + ".tmp")
+                os.replace(self.ann_path + ".tmp", self.ann_path)
+            self.metadata.save(self.meta_path + ".tmp")
+            os.replace(self.meta_path + ".tmp", self.meta_path)
+            self._mtime = self._file_mtime()
+
+    @contextmanager
+    def writing(self):
+        """แก้ไข index แบบกันหลายโปรเซสเขียนชนกัน: lock ไฟล์ → โหลดล่าสุด → แก้ → บันทึก"""
+        with _lock, open(self.path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self.load()
+                try:
+                    yield self
+                except BaseException:
+                    self._mtime = None  # ของในหน่วยความจำอาจแก้ไปครึ่งทาง → โหลดใหม่ครั้งหน้า
+                    raise
+                self.save()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # ---------- updates ----------
+    def _remove_ids(self, ids):
+        if len(ids):
+            ids = np.asarray(ids, dtype=np.int64)
+            self.index.remove_ids(ids)
+            # HNSW ลบเวกเตอร์ไม่ได้ → ปล่อยไว้ แล้วกรองทิ้งผ่าน metadata ตอนค้นหา (train ใหม่เพื่อเก็บกวาด)
+            if self.ann is not None and not _is_hnsw(self.ann):
+                self.ann.remove_ids(ids)
+            self.metadata.remove(ids)
+
+    def _add(self, rows, vectors=None):
+        """rows: [(segment_id, song_id, segment_order, text), ...]"""
+        if not rows:
+            return
+        ids, song_ids, orders, texts = zip(*rows)
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = embed(texts) if vectors is None else vectors
+        self.index.add_with_ids(vectors, ids)
+        if self.ann is not None:
+            self.ann.add_with_ids(vectors, ids)
+        self.metadata.add(ids, song_ids, orders)
+
+    def index_songs(self, song_ids):
+        """(re)index segments ของเพลงที่ระบุจาก songs.db (ใช้หลัง ingest / refresh / rebuild)"""
+        song_ids = list(song_ids)
+        rows = _load_segments(song_ids)
+        vectors = embed([r[3] for r in rows]) if rows else None  # embed นอก lock
+        with self.writing():
+            self._remove_ids(self.metadata.ids_for_songs(song_ids))
+            self._add(rows, vectors)
+
+    def remove_songs(self, song_ids):
+        with self.writing():
+            self._remove_ids(self.metadata.ids_for_songs(song_ids))
+
+    def sync_from_db(self):
+        """ทำให้ index ตรงกับตาราง segments: ลบ id ที่ไม่มีแล้ว, embed เฉพาะ segment ใหม่"""
+        from repository import db_query
+
+        db_ids = np.array([r[0] for r in db_query("SELECT id FROM segments ORDER BY id", fetch=True)], dtype=np.int64)
+        with self.writing():
+            self._remove_ids(np.setdiff1d(self.metadata.ids, db_ids, assume_unique=True))
+            missing = np.setdiff1d(db_ids, self.metadata.ids, assume_unique=True)
+            for start in range(0, len(missing), 4096):
+                self._add(_load_segments_by_id(missing[start:start + 4096].tolist()))
+            return len(missing)
+
+    def train_ann(self, **params):
+        """สร้าง ANN index ใหม่จากเวกเตอร์ใน flat index (ไม่ต้อง embed ใหม่)"""
+        if not self.ann_path:
+            raise ValueError("VECTOR_INDEX_TYPE=flat ไม่ต้อง train")
+        with self.writing():
+            ids, vectors = stored_vectors(self.index)
+            self.ann = build_ann(self.index_type, vectors, ids, **params)
+            return self.ann.ntotal
+
+    # ---------- search ----------
+    def search(self, query, top_k=5):
+        """คืน [(song_id, segment_order), ...] ของ segment ที่ใกล้ query ที่สุด"""
+        self.load()
+        index = self.ann if self.ann is not None else self.index
+        if index.ntotal < len(self.metadata):
+            index = self.index  # ANN ถูก train ก่อนเพิ่มเวกเตอร์ชุดล่าสุด → ใช้ flat จนกว่าจะ train ใหม่
+        if not index.ntotal:
+            return []
+        # เวกเตอร์ที่ถูกลบแต่ยังค้างใน HNSW → ดึงเผื่อแล้วกรองด้วย metadata
+        stale = index.ntotal - len(self.metadata)
+        fetch = top_k if stale <= 0 else min(top_k + stale, 4 * top_k + 16)
+        vec = embed([query])
+        use_refine = IVF_REFINE > 0 and faiss.try_extract_index_ivf(index) is not None
+        _, ids = index.search(vec, fetch * IVF_REFINE if use_refine else fetch)
+        ids = refine(self.index, vec[0], ids[0], fetch) if use_refine else ids[0]
+        ids = ids[ids >= 0]
+        # HNSW อาจมี id เดิมซ้ำ (เวกเตอร์เก่าที่ลบไม่ได้ + เวกเตอร์ใหม่) → เก็บเฉพาะตัวที่ใกล้ที่สุด
+        _, first = np.unique(ids, return_index=True)
+        found, song_ids, orders = self.metadata.lookup(ids[np.sort(first)])
+        return list(zip(song_ids.tolist(), orders.tolist()))[:top_k]
+
+
+def _load_segments(song_ids):
+    from repository import db_query
+
+    rows = []
+    for start in range(0, len(song_ids), 500):
+        chunk = song_ids[start:start + 500]
+        rows += db_query(
+            f"SELECT id, song_id, segment_order, COALESCE(text, '') FROM segments WHERE song_id IN ({','.join('?' * len(chunk))})",
+            tuple(chunk), fetch=True,
+        )
+    return rows
+
+
+def _load_segments_by_id(segment_ids):
+    from repository import db_query
+
+    rows = []
+    for start in range(0, len(segment_ids), 500):
+        chunk = segment_ids[start:start + 500]
+        rows += db_query(
+            f"SELECT id, song_id, segment_order, COALESCE(text, '') FROM segments WHERE id IN ({','.join('?' * len(chunk))})",
+            tuple(chunk), fetch=True,
+        )
+    return rows
+
+
+store = VectorStore()
 
-def add_segments_to_index(song_id, segments):
-    vectors = embedder.encode(segments)
-    index.add(np.array(vectors, dtype="float32"))
-    for i in range(len(segments)):
-        metadata.append((song_id, i))
 
 def search_query(query, top_k=5):
-    vec = embedder.encode([query])
-    D, I = index.search(np.array(vec, dtype="float32"), top_k)
-    results = [metadata[i] for i in I[0]]
-    return results
\ No newline at end of file
+    return store.search(query, top_k)
+
+
+def warmup():
+    """โหลด embedder และ index ล่วงหน้า"""
+    get_embedder()
+    store.load()
+
+
+def on_songs_changed(song_ids, deleted=False):
+    """
+    hook หลัง commit ของ ingest / refresh / rebuild / delete
+    ข้อผิดพลาดไม่ทำให้การเขียนเพลงล้ม (sync_from_db ซ่อมได้ภายหลัง)
+    """
+    if not VECTOR_INDEX:
+        return
+    try:
+        if deleted:
+            store.remove_songs(song_ids)
+        else:
+            store.index_songs(song_ids)
+    except Exception as e:
+        print(f"⚠️ Vector index update failed: {e}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintain the segment vector index")
+    parser.add_argument("--sync", action="store_true", help="sync index กับตาราง segments")
+    parser.add_argument("--train", action="store_true", help=f"train ANN index ({VECTOR_INDEX_TYPE})")
+    args = parser.parse_args()
+
+    if args.sync:
+        added = store.sync_from_db()
+        print(f"Indexed {added} new segments, total {store.index.ntotal} → {store.path}")
+    if args.train:
+        total = store.train_ann()
+        print(f"Trained {store.index_type} index with {total} vectors → {store.ann_path}")
@@ -0,0 +1,428 @@
+"""
+client ของ YouTube Data API (videos.list) ที่รวม id เป็น batch แคชผลลงดิสก์ และนับ quota
+
+- ใช้ service / connection ชุดเดียวตลอดโปรเซส (ไม่ build discovery client ใหม่ทุกครั้ง)
+- videos.list รับได้ 50 id ต่อครั้ง (1 unit เท่ากันไม่ว่ากี่ id) → ดึงหลายเพลงเสีย call เพียง 1/50
+- แคช item ราย video id ในตาราง youtube_cache ของ songs.db (หมดอายุตาม YOUTUBE_CACHE_TTL)
+  id ที่ไม่พบวิดีโอก็แคชไว้ (สั้นกว่า) เพื่อไม่ถามซ้ำ
+- ทุก call บันทึก quota ที่ใช้ในตาราง youtube_quota ต่อวัน (วันตามเวลาแปซิฟิก แบบที่ YouTube รีเซ็ต)
+- transport เปลี่ยนได้: ค่าเริ่มต้นใช้ google-api-python-client, ถ้าตั้ง YOUTUBE_API_BASE_URL
+  จะเรียก REST ตรงด้วย urllib → ชี้ไปที่ fixture server ในเครื่องแทน YouTube ได้ (ทดสอบ / benchmark)
+
+Usage:
+    python youtube_client.py serve --videos 1000 --port 8766   # fixture server (หรือ --fixtures items.json)
+    YOUTUBE_API_BASE_URL=http://127.0.0.1:8766/youtube/v3 python app.py
+    python youtube_client.py bench --videos 500 --latency-ms 20
+    python youtube_client.py quota                             # quota ที่ใช้วันนี้
+"""
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from youtube_utils import API_KEY, YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION
+
+# REST endpoint (ตั้งเพื่อใช้ HttpTransport แทน google-api-python-client)
+API_BASE_URL = os.getenv("YOUTUBE_API_BASE_URL")
+# อายุแคช (วินาที) ของ item ที่พบ / ของ id ที่ไม่พบวิดีโอ (0 = ไม่แคช)
+CACHE_TTL = int(os.getenv("YOUTUBE_CACHE_TTL", str(24 * 3600)))
+NEGATIVE_TTL = int(os.getenv("YOUTUBE_CACHE_NEGATIVE_TTL", "3600"))
+DAILY_QUOTA = int(os.getenv("YOUTUBE_DAILY_QUOTA", "10000"))
+TIMEOUT = float(os.getenv("YOUTUBE_TIMEOUT", "30"))
+
+MAX_IDS_PER_CALL = 50
+VIDEO_PART = "snippet,statistics"
+# quota ต่อ call ตามเอกสารของ YouTube Data API v3
+QUOTA_COST = {"videos": 1, "channels": 1, "playlistItems": 1, "search": 100}
+
+
+class YouTubeApiError(RuntimeError):
+    """API ตอบ error (เช่น quotaExceeded / key ไม่ถูกต้อง)"""
+
+    def __init__(self, status, message):
+        super().__init__(f"YouTube API {status}: {message}")
+        self.status = status
+
+
+def quota_day(ts=None):
+    """วันที่ของ quota (YouTube รีเซ็ต quota เที่ยงคืนเวลาแปซิฟิก)"""
+    try:
+        from zoneinfo import ZoneInfo
+        tz = ZoneInfo("America/Los_Angeles")
+    except Exception:
+        tz = timezone.utc
+    return datetime.fromtimestamp(ts or time.time(), tz).strftime("%Y-%m-%d")
+
+
+def to_metadata(item):
+    """item ของ videos.list → dict metadata ที่ใช้ตอนเพิ่มเพลง (None ถ้าไม่พบวิดีโอ)"""
+    if not item:
+        return None
+    snippet = item.get("snippet", {})
+    stats = item.get("statistics", {})
+    return {
+        "title": snippet.get("title"),
+        "description": snippet.get("description"),
+        "tags": snippet.get("tags", []),
+        "upload_date": snippet.get("publishedAt"),
+        "view_count": stats.get("viewCount"),
+        "like_count": stats.get("likeCount"),
+    }
+
+
+# ----------------------
+# Transports: transport(method, params) → response dict
+# ----------------------
+class DiscoveryTransport:
+    """google-api-python-client: build service ครั้งแรกที่ใช้แล้วใช้ซ้ำ"""
+
+    def __init__(self, api_key=API_KEY):
+        self.api_key = api_key
+        self._service = None
+        self._lock = threading.Lock()
+
+    def __call__(self, method, params):
+        from googleapiclient.errors import HttpError
+
+        # service (httplib2) ใช้ข้าม thread พร้อมกันไม่ได้ → execute ภายใต้ lock
+        with self._lock:
+            if self._service is None:
+                from googleapiclient.discovery import build
+                self._service = build(YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION,
+                                      developerKey=self.api_key, cache_discovery=False)
+            try:
+                return getattr(self._service, method)().list(**params).execute()
+            except HttpError as e:
+                raise YouTubeApiError(e.resp.status, getattr(e, "reason", None) or str(e)) from e
+
+
+class HttpTransport:
+    """เรียก REST API ตรงด้วย urllib (YouTube จริง หรือ fixture server)"""
+
+    def __init__(self, base_url, api_key=API_KEY, timeout=TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def __call__(self, method, params):
+        query = dict(params)
+        if self.api_key:
+            query["key"] = self.api_key
+        url = f"{self.base_url}/{method}?{urllib.parse.urlencode(query)}"
+        try:
+            with urllib.request.urlopen(url, timeout=self.timeout) as resp:
+                return json.load(resp)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.load(e)["error"]["message"]
+            except Exception:
+                message = e.reason
+            raise YouTubeApiError(e.code, message) from e
+
+
+def default_transport():
+    return HttpTransport(API_BASE_URL) if API_BASE_URL else DiscoveryTransport()
+
+
+# ----------------------
+# Client
+# ----------------------
+class YouTubeClient:
+    """videos.list แบบ batch + แคชบนดิสก์ + นับ quota (ใช้ร่วมกันได้ทุก thread)"""
+
+    def __init__(self, transport=None, cache_ttl=CACHE_TTL, negative_ttl=NEGATIVE_TTL,
+                 batch_size=MAX_IDS_PER_CALL, db_path=None):
+        self.transport = transport or default_transport()
+        self.cache_ttl = cache_ttl
+        self.negative_ttl = min(negative_ttl, cache_ttl)
+        self.batch_size = max(1, min(batch_size, MAX_IDS_PER_CALL))
+        self.db_path = db_path
+        self._ready = False
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "units": 0, "errors": 0, "cache_hits": 0, "cache_misses": 0}
+
+    def _ensure_schema(self):
+        if not self._ready:
+            from migrations import migrate
+            migrate(self.db_path)  # ตาราง youtube_cache / youtube_quota มาจาก migration
+            self._ready = True
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                self.counters[key] += value
+
+    # ---- cache ----
+    def _cached(self, ids, part):
+        from db import execute
+
+        self._ensure_schema()
+        now = time.time()
+        found = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = execute(
+                f"SELECT video_id, item, fetched_at FROM youtube_cache "
+                f"WHERE part=? AND video_id IN ({','.join('?' * len(chunk))})",
+                (part, *chunk), fetch=True, path=self.db_path,
+            )
+            for video_id, item, fetched_at in rows:
+                ttl = self.cache_ttl if item is not None else self.negative_ttl
+                if now - fetched_at < ttl:
+                    found[video_id] = json.loads(item) if item is not None else None
+        return found
+
+    def _store(self, items, part):
+        from db import transaction
+
+        self._ensure_schema()
+        now = time.time()
+        with transaction(self.db_path) as cur:
+            cur.executemany(
+                "INSERT OR REPLACE INTO youtube_cache (video_id, part, item, fetched_at) VALUES (?,?,?,?)",
+                [(video_id, part, None if item is None else json.dumps(item, ensure_ascii=False), now)
+                 for video_id, item in items.items()],
+            )
+
+    # ---- quota ----
+    def _call(self, method, params):
+        units = QUOTA_COST.get(method, 1)
+        try:
+            response = self.transport(method, params)
+        except YouTubeApiError:
+            # YouTube ตอบ error กลับมา → request ถึง API แล้ว ยังเสีย quota
+            self._count(errors=1, calls=1, units=units)
+            self._charge(method, units)
+            raise
+        except Exception:
+            # DNS / connection / timeout ก่อนถึง YouTube → ไม่เสีย quota
+            self._count(errors=1)
+            raise
+        self._count(calls=1, units=units)
+        self._charge(method, units)
+        return response
+
+    def _charge(self, method, units):
+        from db import transaction
+
+        self._ensure_schema()
+        with transaction(self.db_path) as cur:
+            cur.execute("""
+                INSERT INTO youtube_quota (day, method, calls, units) VALUES (?,?,1,?)
+                ON CONFLICT(day, method) DO UPDATE SET calls=calls+1, units=units+excluded.units
+            """, (quota_day(), method, units))
+
+    def quota_used(self, day=None):
+        """quota ที่ใช้ไปของวัน (รวมทุกโปรเซสที่ใช้ songs.db เดียวกัน): {method: (calls, units)}"""
+        from db import execute
+
+        self._ensure_schema()
+        rows = execute("SELECT method, calls, units FROM youtube_quota WHERE day=?",
+                       (day or quota_day(),), fetch=True, path=self.db_path)
+        return {method: (calls, units) for method, calls, units in rows}
+
+    def quota_remaining(self):
+        return DAILY_QUOTA - sum(units for _, units in self.quota_used().values())
+
+    # ---- API ----
+    def videos(self, video_ids, part=VIDEO_PART, use_cache=True):
+        """
+        item ของ videos.list ต่อ video id (id ละหนึ่งครั้ง ไม่ว่าส่งซ้ำกี่รอบ)
+        id ที่ยังไม่มีในแคชถูกรวมเป็น call ละไม่เกิน 50 id
+        use_cache=False: ดึงใหม่ทุก id (เช่น อัปเดตยอดวิว) แต่ยังเขียนผลใหม่ลงแคช
+        Returns: {video_id: item หรือ None ถ้าไม่พบวิดีโอ} ตามลำดับของ video_ids
+        """
+        ids = list(dict.fromkeys(v for v in video_ids if v))
+        found = self._cached(ids, part) if use_cache and self.cache_ttl > 0 and ids else {}
+        missing = [v for v in ids if v not in found]
+        self._count(cache_hits=len(ids) - len(missing), cache_misses=len(missing))
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            response = self._call("videos", {"part": part, "id": ",".join(batch)})
+            items = {item["id"]: item for item in response.get("items", [])}
+            fetched = {v: items.get(v) for v in batch}
+            if self.cache_ttl > 0:
+                self._store(fetched, part)
+            found.update(fetched)
+        return {v: found[v] for v in ids}
+
+    def metadata_many(self, video_ids, use_cache=True):
+        """{video_id: metadata dict หรือ None}"""
+        return {v: to_metadata(item) for v, item in self.videos(video_ids, use_cache=use_cache).items()}
+
+    def metadata(self, video_id, use_cache=True):
+        return self.metadata_many([video_id], use_cache=use_cache).get(video_id)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """client ที่ใช้ร่วมกันทั้งโปรเซส (สร้างครั้งแรกที่เรียก)"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = YouTubeClient()
+        return _client
+
+
+# ----------------------
+# Fixture server (แทน YouTube ตอนทดสอบ / benchmark)
+# ----------------------
+def synthetic_videos(n, seed=0):
+    """item ปลอม n รายการ รูปแบบเดียวกับ videos.list: {video_id: item}"""
+    rng = random.Random(seed)
+    alphabet = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-"
+    videos = {}
+    while len(videos) < n:
+        video_id = "".join(rng.choice(alphabet) for _ in range(11))
+        videos[video_id] = {
+            "kind": "youtube#video",
+            "id": video_id,
+            "snippet": {
+                "title": f"เพลงทดสอบ {len(videos) + 1}",
+                "description": "fixture",
+                "tags": ["fixture"],
+                "publishedAt": f"20{rng.randint(10, 24)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}T00:00:00Z",
+            },
+            "statistics": {
+                "viewCount": str(rng.randint(0, 10 ** 8)),
+                "likeCount": str(rng.randint(0, 10 ** 6)),
+            },
+        }
+    return videos
+
+
+def make_fixture_server(videos, host="127.0.0.1", port=0, latency_ms=0.0):
+    """
+    HTTP server ที่ตอบ GET .../videos?part=&id=a,b,... จาก dict videos (ไม่ต้องใช้ API key)
+    server.requests นับจำนวนคำขอ, base URL = server.base_url
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=UTF-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            if not url.path.endswith("/videos"):
+                self._reply(404, {"error": {"code": 404, "message": "Not Found"}})
+                return
+            server.requests += 1
+            if latency_ms:
+                time.sleep(latency_ms / 1000.0)
+            query = urllib.parse.parse_qs(url.query)
+            ids = [v for v in ",".join(query.get("id", [])).split(",") if v]
+            if len(ids) > MAX_IDS_PER_CALL:
+                self._reply(400, {"error": {"code": 400, "message": "Too many ids"}})
+                return
+            parts = ",".join(query.get("part", [VIDEO_PART])).split(",")
+            items = [
+                {k: v for k, v in videos[v_id].items() if k in ("kind", "id", *parts)}
+                for v_id in ids if v_id in videos
+            ]
+            self._reply(200, {"kind": "youtube#videoListResponse", "items": items,
+                              "pageInfo": {"totalResults": len(items), "resultsPerPage": len(items)}})
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.requests = 0
+    server.base_url = f"http://{host}:{server.server_address[1]}/youtube/v3"
+    return server
+
+
+def bench(n_videos=500, latency_ms=20.0, missing=0.1):
+    """เทียบการดึง metadata ทีละ id (แบบเดิม) กับแบบ batch และแบบที่อยู่ในแคช บน fixture server"""
+    import tempfile
+
+    videos = synthetic_videos(n_videos)
+    ids = list(videos) + [f"missing{i:04d}" for i in range(int(n_videos * missing))]
+    server = make_fixture_server(videos, latency_ms=latency_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    transport = HttpTransport(server.base_url, api_key=None)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        print(f"{len(ids)} ids ({len(videos)} found), fixture latency {latency_ms:g} ms\n")
+        print(f"{'Mode':<18} | {'Calls':>6} | {'Units':>6} | {'Seconds':>8} | {'ids/s':>9}")
+        print("-" * 60)
+        runs = [
+            ("one id per call", YouTubeClient(transport, cache_ttl=0, batch_size=1, db_path=db_path)),
+            ("batched (50)", YouTubeClient(transport, cache_ttl=0, db_path=db_path)),
+        ]
+        cached = YouTubeClient(transport, db_path=db_path)
+        cached.videos(ids)  # เติมแคช
+        runs.append(("cached", YouTubeClient(transport, db_path=db_path)))
+        results = []
+        for name, client in runs:
+            started = time.perf_counter()
+            results.append(client.videos(ids))
+            elapsed = time.perf_counter() - started
+            c = client.stats()
+            print(f"{name:<18} | {c['calls']:>6} | {c['units']:>6} | {elapsed:>8.3f} | {len(ids) / elapsed:>9.0f}")
+        assert all(r == results[0] for r in results), "batched / cached results differ"
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Batched, cached YouTube Data API client")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_serve = sub.add_parser("serve", help="รัน fixture server แทน YouTube Data API")
+    p_serve.add_argument("--fixtures", help="ไฟล์ JSON: {video_id: item} หรือ [item, ...]")
+    p_serve.add_argument("--videos", type=int, default=1000, help="จำนวนวิดีโอปลอม (เมื่อไม่ระบุ --fixtures)")
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=8766)
+    p_serve.add_argument("--latency-ms", type=float, default=0.0, help="หน่วงเวลาต่อคำขอ")
+    p_bench = sub.add_parser("bench", help="เทียบทีละ id / batch / แคช บน fixture server")
+    p_bench.add_argument("--videos", type=int, default=500)
+    p_bench.add_argument("--latency-ms", type=float, default=20.0)
+    sub.add_parser("quota", help="quota ที่ใช้ไปวันนี้")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        if args.fixtures:
+            with open(args.fixtures, encoding="utf-8") as f:
+                data = json.load(f)
+            videos = data if isinstance(data, dict) else {item["id"]: item for item in data}
+        else:
+            videos = synthetic_videos(args.videos)
+        server = make_fixture_server(videos, args.host, args.port, args.latency_ms)
+        print(f"🚀 YouTube fixture server ({len(videos)} videos): YOUTUBE_API_BASE_URL={server.base_url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    elif args.command == "bench":
+        bench(args.videos, args.latency_ms)
+    else:
+        used = get_client().quota_used()
+        total = sum(units for _, units in used.values())
+        for method, (calls, units) in sorted(used.items()):
+            print(f"{method:<14} {calls:>6} calls {units:>7} units")
+        print(f"{quota_day()}: {total} / {DAILY_QUOTA} units ({DAILY_QUOTA - total} remaining)")
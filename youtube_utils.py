@@ -1,4 +1,3 @@
-from googleapiclient.discovery import build
 import re
 import os
 from dotenv import load_dotenv
@@ -11,27 +10,15 @@ YOUTUBE_API_SERVICE_NAME = "youtube"
 YOUTUBE_API_VERSION = "v3"
 
 def fetch_youtube_metadata(video_id):
-    youtube = build(YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION, developerKey=API_KEY)
-    request = youtube.videos().list(
-        part="snippet,statistics",
-        id=video_id
-    )
-    response = request.execute()
-    if not response["items"]:
-        return None
+    """metadata ของวิดีโอเดียว (None ถ้าไม่พบ) ผ่าน client ที่ batch + แคช + นับ quota"""
+    from youtube_client import get_client
+    return get_client().metadata(video_id)
 
-    item = response["items"][0]
-    snippet = item["snippet"]
-    stats = item["statistics"]
-
-    return {
-        "title": snippet.get("title"),
-        "description": snippet.get("description"),
-        "tags": snippet.get("tags", []),
-        "upload_date": snippet.get("publishedAt"),
-        "view_count": stats.get("viewCount"),
-        "like_count": stats.get("likeCount"),
-    }
+def fetch_youtube_metadata_many(video_ids, use_cache=True):
+    """metadata ของหลายวิดีโอ: {video_id: dict หรือ None} (รวม 50 id ต่อ API call)
+    use_cache=False: ไม่อ่านจากแคช (ต้องการยอดวิว/ไลก์ล่าสุด)"""
+    from youtube_client import get_client
+    return get_client().metadata_many(video_ids, use_cache=use_cache)
 
 def extract_video_id(url: str):
     pattern = r"(?:v=|youtu\.be/)([a-zA-Z0-9_-]{11})"